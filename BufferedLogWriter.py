@@ -0,0 +1,95 @@
+import atexit
+import threading
+from datetime import datetime
+from PRISMA_SDK.LogProgramFileFactory import LogProgramFileFactory as lpff
+from PRISMA_SDK.simpleClass.LogProgramFile import LogProgramFile as lpf
+
+
+class BufferedLogWriter:
+    '''
+    Queues pr_log_program_file entries in memory and writes them in batches, keeping the order in which they were logged.
+    A batch is written when flush_size entries are queued, every flush_interval seconds (if set) and on close().
+    With a background thread (flush_interval or background set) every batch but the last is written by that thread, so the threads that log never wait for the db.
+    Without one, batches are only written on the thread that created the writer, which owns db: entries logged by other threads wait for its next log() or flush().
+    Entries still queued when the interpreter exits are written by an atexit hook.
+    Entries that couldn't be written stay queued, ahead of those logged since, and are written by the next flush.
+    db is only used by the writer, so it must not be shared with a thread that runs other queries while a background flush can happen.
+    '''
+
+    def __init__(self, db, flush_interval=None, flush_size=100, background=False):
+        self.__db = db
+        self.__flush_size = max(1, int(flush_size))
+        self.__records = []
+        self.__lock = threading.Lock()
+        self.__write_lock = threading.Lock()
+        self.__closed = threading.Event()
+        self.__flush_requested = threading.Event()
+        self.__owner = threading.current_thread()
+        self.__thread = None
+        if flush_interval or background:
+            self.__thread = threading.Thread(target=self.__flush_in_background, args=(flush_interval or None,), daemon=True)
+            self.__thread.start()
+        atexit.register(self.close)
+
+    def __flush_in_background(self, flush_interval):
+        '''
+        Flushes every flush_interval seconds (if set) and whenever log() requests it, until close().
+        '''
+        while True:
+            self.__flush_requested.wait(flush_interval)
+            self.__flush_requested.clear()
+            if self.__closed.is_set():
+                return
+            self.__try_flush()
+
+    def __try_flush(self):
+        '''
+        Flushes, reporting instead of raising an error: the entries stay queued and the next flush writes them.
+        '''
+        try:
+            self.flush()
+        except Exception as err:
+            print(f'Unable to write log entries, they are written by the next flush: {err}')
+
+    def log(self, log_type, level, text, userId):
+        '''
+        Queues a log entry of type log_type (INFO, WARNING, ERROR) with verbosity level level, timestamped now.
+        '''
+        record = lpf().create(datetime.now().strftime("%Y-%m-%d %H:%M:%S"), log_type, level, text, userId, userId, userId)
+        with self.__lock:
+            self.__records.append(record)
+            full = len(self.__records) >= self.__flush_size
+        if full:
+            if self.__thread is not None:
+                self.__flush_requested.set()
+            elif threading.current_thread() is self.__owner:
+                self.__try_flush()
+
+    def flush(self):
+        '''
+        Writes every queued entry to the db.
+        If writing an entry raises, it and the entries after it are queued again in front of those logged meanwhile and the error is raised.
+        '''
+        # write_lock keeps batches in order when the background thread and a caller flush at the same time
+        with self.__write_lock:
+            with self.__lock:
+                records, self.__records = self.__records, []
+            for i, record in enumerate(records):
+                try:
+                    lpff().insert(record, self.__db)
+                except BaseException:
+                    with self.__lock:
+                        self.__records = records[i:] + self.__records
+                    raise
+
+    def close(self):
+        '''
+        Stops the background thread and writes every queued entry.
+        Raises the error of the flush if it failed, the atexit hook then tries again to write the entries.
+        '''
+        self.__closed.set()
+        self.__flush_requested.set()
+        if self.__thread is not None and self.__thread is not threading.current_thread():
+            self.__thread.join()
+        self.flush()
+        atexit.unregister(self.close)
@@ -0,0 +1,131 @@
+import calendar
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'calibration_backfill.sqlite')
+
+
+class CalibrationBackfill:
+    '''
+    Plans the jobs of a backfill and keeps its progress in SQLite, so an interrupted backfill can be resumed.
+    A job is a tuple (camera_id, user_id, date, is_monthly): date is a night (YYYYmmdd) for daily jobs and a month (YYYYmm) for monthly jobs.
+    Every backfill is identified by its date range, cameras and monthly flag: running the same backfill again skips the jobs it already completed.
+    '''
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.__db = None
+        self.__lock = threading.RLock()
+
+    def __connection(self):
+        if self.__db is None:
+            self.__db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self.__db.execute('''
+                CREATE TABLE IF NOT EXISTS backfill_jobs (
+                    backfill_id TEXT NOT NULL,
+                    camera_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    date TEXT NOT NULL,
+                    is_monthly INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    attempts INTEGER NOT NULL,
+                    updated REAL NOT NULL,
+                    PRIMARY KEY (backfill_id, camera_id, date, is_monthly)
+                )
+            ''')
+        return self.__db
+
+    @staticmethod
+    def backfill_id(start_date, end_date, camera_codes=None, monthly=True):
+        '''
+        Returns the identifier of the backfill of the nights from start_date to end_date for camera_codes (every active camera if None).
+        '''
+        return f'{start_date}-{end_date}:{",".join(sorted(camera_codes)) if camera_codes else "*"}:{"monthly" if monthly else "daily"}'
+
+    @staticmethod
+    def plan(cameras, start_date, end_date, monthly=True, today=None):
+        '''
+        Returns the jobs of the backfill of the nights from start_date to end_date (YYYYmmdd, both included) for cameras, and their dependencies.
+        Every camera gets a daily job per night and, if monthly is set, a monthly job for every month of the range that is over by today,
+        which depends on the daily jobs of that month. Jobs are ordered most recent first, the monthly job of a month before its daily jobs.
+        '''
+        first_night = datetime.strptime(start_date, '%Y%m%d')
+        last_night = datetime.strptime(end_date, '%Y%m%d')
+        # The last night that can be calibrated is the one before today
+        last_calibrable_night = (today or datetime.now()) - timedelta(days=1)
+        nights = []
+        night = last_night
+        while night >= first_night:
+            nights.append(night)
+            night -= timedelta(days=1)
+
+        jobs = []
+        dependencies = {}
+        for camera in sorted(cameras, key=lambda camera: camera.id):
+            daily_jobs = [(camera.id, camera.modified_by, night.strftime('%Y%m%d'), 0) for night in nights]
+            jobs += daily_jobs
+            if not monthly:
+                continue
+            for month in sorted(set(night.strftime('%Y%m') for night in nights), reverse=True):
+                month_end = datetime.strptime(month, '%Y%m').replace(day=calendar.monthrange(int(month[:4]), int(month[4:]))[1])
+                if month_end.date() > last_calibrable_night.date():
+                    continue
+                monthly_job = (camera.id, camera.modified_by, month, 1)
+                jobs.append(monthly_job)
+                dependencies[monthly_job] = [job for job in daily_jobs if job[2][:6] == month]
+
+        def priority(job):
+            # Most recent first, a monthly job counts as the last night of its month and comes before the daily jobs of that night
+            date = job[2] if len(job[2]) > 6 else f'{job[2]}{calendar.monthrange(int(job[2][:4]), int(job[2][4:]))[1]:02d}'
+            return date, job[3], -job[0]
+        jobs.sort(key=priority, reverse=True)
+        return jobs, dependencies
+
+    def begin(self, backfill_id, jobs, restart=False):
+        '''
+        Records jobs as the jobs of backfill backfill_id and returns the set of those that already succeeded in a previous run.
+        With restart set the progress of previous runs is forgotten.
+        '''
+        now = time.time()
+        with self.__lock:
+            db = self.__connection()
+            with db:
+                if restart:
+                    db.execute('DELETE FROM backfill_jobs WHERE backfill_id = ?', (backfill_id,))
+                db.executemany('INSERT OR IGNORE INTO backfill_jobs VALUES (?, ?, ?, ?, ?, \'pending\', 0, ?)', [(backfill_id, *job, now) for job in jobs])
+            done = db.execute('SELECT camera_id, user_id, date, is_monthly FROM backfill_jobs WHERE backfill_id = ? AND status = \'done\'', (backfill_id,)).fetchall()
+        return set(done) & set(jobs)
+
+    def is_done(self, backfill_id, job):
+        '''
+        Returns True if job of backfill backfill_id succeeded.
+        '''
+        with self.__lock:
+            row = self.__connection().execute('SELECT status FROM backfill_jobs WHERE backfill_id = ? AND camera_id = ? AND date = ? AND is_monthly = ?', (backfill_id, job[0], job[2], job[3])).fetchone()
+        return row is not None and row[0] == 'done'
+
+    def record(self, backfill_id, job, status):
+        '''
+        Records the status (done, failed or blocked) of job, also if it was not recorded by begin().
+        '''
+        with self.__lock:
+            db = self.__connection()
+            with db:
+                db.execute('INSERT OR IGNORE INTO backfill_jobs VALUES (?, ?, ?, ?, ?, \'pending\', 0, ?)', (backfill_id, *job, time.time()))
+                db.execute('UPDATE backfill_jobs SET status = ?, attempts = attempts + ?, updated = ? WHERE backfill_id = ? AND camera_id = ? AND date = ? AND is_monthly = ?', (status, 0 if status == 'blocked' else 1, time.time(), backfill_id, job[0], job[2], job[3]))
+
+    def progress(self, backfill_id):
+        '''
+        Returns the number of jobs of backfill backfill_id by status.
+        '''
+        with self.__lock:
+            return dict(self.__connection().execute('SELECT status, COUNT(*) FROM backfill_jobs WHERE backfill_id = ? GROUP BY status', (backfill_id,)).fetchall())
+
+    def close(self):
+        with self.__lock:
+            if self.__db is not None:
+                self.__db.close()
+                self.__db = None
@@ -0,0 +1,66 @@
+import hashlib
+import json
+import os
+
+
+class CalibrationFingerprint:
+    '''
+    Fingerprint of the inputs of a calibration job: its captures (names, sizes and mtimes), the user's config_parameters and the system configuration.
+    The fingerprint of the last successful calibration is kept in a sidecar next to `{camera}_{date}_astro_solution.txt`,
+    a job whose fingerprint matches the sidecar doesn't need to run IDL again.
+    '''
+
+    @staticmethod
+    def compute(camera_code, date, is_monthly, captures, usr_config, sys_parameters):
+        '''
+        Returns the hexadecimal SHA-256 fingerprint of a job.
+        captures are the dictionaries returned by CaptureIndex.captures(), sys_parameters a dictionary of system configuration parameters.
+        '''
+        inputs = {
+            'camera_code': camera_code,
+            'date': date,
+            'is_monthly': int(is_monthly),
+            'captures': sorted((capture['filename'], capture['size'], capture['mtime_ns']) for capture in captures),
+            'user_config': usr_config,
+            'system_config': sys_parameters,
+        }
+        return hashlib.sha256(json.dumps(inputs, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def sidecar_path(solution_path):
+        '''
+        Returns the path of the fingerprint sidecar of astro solution solution_path.
+        '''
+        return f'{os.path.splitext(solution_path)[0]}.fingerprint'
+
+    @staticmethod
+    def is_up_to_date(solution_path, fingerprint):
+        '''
+        Returns True if solution_path exists and was produced from inputs with fingerprint fingerprint.
+        '''
+        try:
+            with open(CalibrationFingerprint.sidecar_path(solution_path)) as f:
+                return f.read().strip() == fingerprint and os.path.exists(solution_path)
+        except FileNotFoundError:
+            return False
+
+    @staticmethod
+    def write(solution_path, fingerprint):
+        '''
+        Records fingerprint as the fingerprint of solution_path, replacing the sidecar atomically.
+        '''
+        sidecar_path = CalibrationFingerprint.sidecar_path(solution_path)
+        tmp_path = f'{sidecar_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(f'{fingerprint}\n')
+        os.replace(tmp_path, sidecar_path)
+
+    @staticmethod
+    def remove(solution_path):
+        '''
+        Removes the sidecar of solution_path, if any.
+        '''
+        try:
+            os.remove(CalibrationFingerprint.sidecar_path(solution_path))
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,149 @@
+import os
+import socket
+import threading
+import time
+
+
+class CalibrationLeases:
+    '''
+    Shares calibration jobs between hosts through the calibration_leases table of a database all of them reach.
+    A job (camera_id, user_id, date, is_monthly) is run by the host that claims it. The claim is a lease: a background thread renews the leases of this owner
+    every heartbeat_seconds and a lease not renewed for lease_seconds expires, so the jobs of a host that stopped can be claimed by the others.
+    Works with any DB-API module: connect() opens a connection of module (mysql.connector, sqlite3, ...), whose paramstyle and IntegrityError are used.
+    '''
+
+    def __init__(self, connect, module, owner=None, lease_seconds=300, heartbeat_seconds=60):
+        self.owner = owner or f'{socket.gethostname()}:{os.getpid()}'
+        self.lease_seconds = lease_seconds
+        self.heartbeat_seconds = heartbeat_seconds
+        self.__connect = connect
+        self.__module = module
+        self.__placeholder = '?' if module.paramstyle == 'qmark' else '%s'
+        self.__db = None
+        self.__lock = threading.Lock()
+        self.__heartbeat = None
+        self.__stop = threading.Event()
+
+    def __execute(self, db, query, parameters=()):
+        '''
+        Runs query (with ? placeholders) on db and returns the number of affected rows and the fetched rows.
+        '''
+        cursor = db.cursor()
+        try:
+            cursor.execute(query.replace('?', self.__placeholder), parameters)
+            rows = cursor.fetchall() if cursor.description is not None else []
+            return cursor.rowcount, rows
+        finally:
+            cursor.close()
+
+    def __connection(self):
+        if self.__db is None:
+            self.__db = self.__connect()
+            self.__execute(self.__db, '''
+                CREATE TABLE IF NOT EXISTS calibration_leases (
+                    camera_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    date VARCHAR(8) NOT NULL,
+                    is_monthly INTEGER NOT NULL,
+                    owner VARCHAR(255) NOT NULL,
+                    status VARCHAR(16) NOT NULL,
+                    lease_until DOUBLE NOT NULL,
+                    updated DOUBLE NOT NULL,
+                    PRIMARY KEY (camera_id, date, is_monthly)
+                )
+            ''')
+            self.__db.commit()
+        return self.__db
+
+    def claim(self, job, since=None, force=False):
+        '''
+        Claims job and returns True if it is free: never claimed, claimed by an owner whose lease expired, or failed before since (a timestamp, default: now).
+        With force set jobs done before since are free too.
+        '''
+        camera_id, user_id, date, is_monthly = job
+        now = time.time()
+        finished_statuses = "'failed', 'done'" if force else "'failed'"
+        with self.__lock:
+            db = self.__connection()
+            try:
+                n_claimed, _ = self.__execute(db, f'''
+                    UPDATE calibration_leases SET user_id = ?, owner = ?, status = 'running', lease_until = ?, updated = ?
+                    WHERE camera_id = ? AND date = ? AND is_monthly = ?
+                    AND ((status = 'running' AND lease_until < ?) OR (status IN ({finished_statuses}) AND updated < ?))
+                ''', (user_id, self.owner, now + self.lease_seconds, now, camera_id, date, is_monthly, now, now if since is None else since))
+                if n_claimed == 0:
+                    # Never claimed: of concurrent inserts only one succeeds
+                    self.__execute(db, 'INSERT INTO calibration_leases VALUES (?, ?, ?, ?, ?, \'running\', ?, ?)', (camera_id, user_id, date, is_monthly, self.owner, now + self.lease_seconds, now))
+                db.commit()
+            except self.__module.IntegrityError:
+                db.rollback()
+                return False
+            if self.__heartbeat is None:
+                self.__stop.clear()
+                self.__heartbeat = threading.Thread(target=self.__renew_leases, name='lease-heartbeat', daemon=True)
+                self.__heartbeat.start()
+        return True
+
+    def release(self, job, status):
+        '''
+        Records the status (done or failed) of job claimed by this owner. Returns False if its lease expired and another owner claimed it meanwhile.
+        '''
+        camera_id, user_id, date, is_monthly = job
+        with self.__lock:
+            db = self.__connection()
+            n_released, _ = self.__execute(db, 'UPDATE calibration_leases SET status = ?, updated = ? WHERE camera_id = ? AND date = ? AND is_monthly = ? AND owner = ? AND status = \'running\'', (status, time.time(), camera_id, date, is_monthly, self.owner))
+            db.commit()
+        return n_released == 1
+
+    def expired(self, date=None):
+        '''
+        Returns the jobs (of date, or of any date) whose owner's lease expired, to be claimed with claim().
+        '''
+        with self.__lock:
+            db = self.__connection()
+            query = 'SELECT camera_id, user_id, date, is_monthly FROM calibration_leases WHERE status = \'running\' AND lease_until < ?'
+            _, rows = self.__execute(db, query if date is None else f'{query} AND date = ?', (time.time(),) if date is None else (time.time(), date))
+            db.commit()
+        return [tuple(row) for row in rows]
+
+    def running(self, date):
+        '''
+        Returns the number of jobs of date that other owners are running.
+        '''
+        with self.__lock:
+            db = self.__connection()
+            _, rows = self.__execute(db, 'SELECT COUNT(*) FROM calibration_leases WHERE date = ? AND status = \'running\' AND owner != ?', (date, self.owner))
+            db.commit()
+        return rows[0][0]
+
+    def __renew_leases(self):
+        '''
+        Renews the leases of this owner every heartbeat_seconds, on its own connection, until close().
+        '''
+        db = None
+        while not self.__stop.wait(self.heartbeat_seconds):
+            try:
+                if db is None:
+                    db = self.__connect()
+                self.__execute(db, 'UPDATE calibration_leases SET lease_until = ? WHERE owner = ? AND status = \'running\'', (time.time() + self.lease_seconds, self.owner))
+                db.commit()
+            except Exception:
+                # The next heartbeat tries again on a new connection, the leases expire if it never succeeds
+                if db is not None:
+                    db.close()
+                db = None
+        if db is not None:
+            db.close()
+
+    def close(self):
+        '''
+        Stops the heartbeat and closes the connection, the next claim() opens them again.
+        '''
+        with self.__lock:
+            heartbeat, self.__heartbeat = self.__heartbeat, None
+            self.__stop.set()
+            if self.__db is not None:
+                self.__db.close()
+                self.__db = None
+        if heartbeat is not None:
+            heartbeat.join()
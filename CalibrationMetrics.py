@@ -0,0 +1,166 @@
+import json
+import math
+import os
+import threading
+import time
+from datetime import datetime
+
+
+class JobMetrics:
+    '''
+    Stopwatch and counters of one calibration job (or of a whole run).
+    begin(stage) closes the stage in progress and starts timing the next one, finish() closes the last one.
+    '''
+
+    def __init__(self, camera_id, date, is_monthly):
+        self.camera_id = camera_id
+        self.date = date
+        self.is_monthly = is_monthly
+        self.outcome = None
+        self.started = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.stages = {}
+        self.counts = {}
+        self.__stage = None
+        self.__stage_start = None
+
+    def begin(self, stage):
+        '''
+        Starts timing stage, after closing the stage in progress.
+        '''
+        self.end()
+        self.__stage = stage
+        self.__stage_start = time.perf_counter()
+
+    def end(self):
+        '''
+        Closes the stage in progress, if any.
+        '''
+        if self.__stage is not None:
+            self.stages[self.__stage] = self.stages.get(self.__stage, 0) + time.perf_counter() - self.__stage_start
+            self.__stage = None
+
+    def count(self, name, value=1):
+        '''
+        Adds value to counter name.
+        '''
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def finish(self, outcome):
+        '''
+        Closes the stage in progress and records the outcome of the job (e.g. success, failure, error).
+        '''
+        self.end()
+        self.outcome = outcome
+
+    def as_dict(self):
+        return {'camera_id': self.camera_id, 'date': self.date, 'is_monthly': self.is_monthly, 'started': self.started, 'outcome': self.outcome, 'stages': self.stages, 'counts': self.counts}
+
+
+class CalibrationMetrics:
+    '''
+    Collects the JobMetrics of every job of a calibration run, plus the stages of the run itself in run.
+    Exports them as JSON lines or as a Prometheus textfile and summarizes each stage across jobs.
+    '''
+
+    def __init__(self):
+        self.run = JobMetrics(None, None, None)
+        self.__jobs = []
+        self.__lock = threading.Lock()
+
+    def job(self, camera_id, date, is_monthly):
+        '''
+        Returns a new JobMetrics for a job of this run.
+        '''
+        job_metrics = JobMetrics(camera_id, date, is_monthly)
+        with self.__lock:
+            self.__jobs.append(job_metrics)
+        return job_metrics
+
+    def jobs(self):
+        with self.__lock:
+            return list(self.__jobs)
+
+    def take_finished(self):
+        '''
+        Removes the jobs that finished and returns them in a new CalibrationMetrics sharing run, e.g. for a long-running daemon to export them periodically.
+        '''
+        finished = CalibrationMetrics()
+        finished.run = self.run
+        with self.__lock:
+            finished.__jobs = [job_metrics for job_metrics in self.__jobs if job_metrics.outcome is not None]
+            self.__jobs = [job_metrics for job_metrics in self.__jobs if job_metrics.outcome is None]
+        return finished
+
+    @staticmethod
+    def percentile(values, p):
+        '''
+        Returns the p-th percentile (nearest rank) of values.
+        '''
+        values = sorted(values)
+        return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+    def stage_summary(self):
+        '''
+        Returns {stage: {'count', 'sum', 'p50', 'p95'}} computed over every job that went through the stage.
+        '''
+        durations = {}
+        for job_metrics in self.jobs():
+            for stage, duration in job_metrics.stages.items():
+                durations.setdefault(stage, []).append(duration)
+        return {stage: {'count': len(values), 'sum': sum(values), 'p50': CalibrationMetrics.percentile(values, 50), 'p95': CalibrationMetrics.percentile(values, 95)} for stage, values in durations.items()}
+
+    def summary_lines(self):
+        '''
+        Returns human readable lines describing the run, one per stage.
+        '''
+        jobs = self.jobs()
+        outcomes = {}
+        for job_metrics in jobs:
+            outcomes[job_metrics.outcome] = outcomes.get(job_metrics.outcome, 0) + 1
+        lines = [f'Run stages: {", ".join(f"{stage} {duration:.1f}s" for stage, duration in self.run.stages.items())}; {len(jobs)} job(s): {", ".join(f"{n} {outcome}" for outcome, n in outcomes.items())}.']
+        for stage, summary in self.stage_summary().items():
+            lines.append(f'Stage {stage}: {summary["count"]} job(s), p50 {summary["p50"]:.3f}s, p95 {summary["p95"]:.3f}s, total {summary["sum"]:.1f}s.')
+        return lines
+
+    def write_jsonl(self, path):
+        '''
+        Appends one JSON line per job, and one for the run, to path.
+        '''
+        with open(path, 'a') as f:
+            for job_metrics in self.jobs():
+                f.write(json.dumps(dict(job_metrics.as_dict(), kind='job')) + '\n')
+            f.write(json.dumps(dict(self.run.as_dict(), kind='run')) + '\n')
+
+    def write_prometheus(self, path):
+        '''
+        Writes the metrics of the run to path in the Prometheus text format, replacing the file atomically as expected by the node exporter textfile collector.
+        '''
+        lines = ['# HELP calibration_stage_duration_seconds Duration of the stages of the calibration jobs of the last run.', '# TYPE calibration_stage_duration_seconds summary']
+        for stage, summary in self.stage_summary().items():
+            lines.append(f'calibration_stage_duration_seconds{{stage="{stage}",quantile="0.5"}} {summary["p50"]}')
+            lines.append(f'calibration_stage_duration_seconds{{stage="{stage}",quantile="0.95"}} {summary["p95"]}')
+            lines.append(f'calibration_stage_duration_seconds_sum{{stage="{stage}"}} {summary["sum"]}')
+            lines.append(f'calibration_stage_duration_seconds_count{{stage="{stage}"}} {summary["count"]}')
+
+        lines += ['# HELP calibration_jobs Calibration jobs of the last run by outcome.', '# TYPE calibration_jobs gauge']
+        outcomes = {}
+        counts = {}
+        for job_metrics in self.jobs():
+            outcomes[job_metrics.outcome] = outcomes.get(job_metrics.outcome, 0) + 1
+            for name, value in job_metrics.counts.items():
+                counts[name] = counts.get(name, 0) + value
+        for outcome, n in outcomes.items():
+            lines.append(f'calibration_jobs{{outcome="{outcome}"}} {n}')
+
+        lines += ['# HELP calibration_job_count_total Counters summed over the calibration jobs of the last run.', '# TYPE calibration_job_count_total gauge']
+        for name, value in counts.items():
+            lines.append(f'calibration_job_count_total{{name="{name}"}} {value}')
+
+        lines += ['# HELP calibration_run_stage_duration_seconds Duration of the stages of the last run.', '# TYPE calibration_run_stage_duration_seconds gauge']
+        for stage, duration in self.run.stages.items():
+            lines.append(f'calibration_run_stage_duration_seconds{{stage="{stage}"}} {duration}')
+
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, path)
@@ -0,0 +1,143 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'failed_calibrations.sqlite')
+
+
+class CalibrationRetryQueue:
+    '''
+    SQLite queue of failed calibrations (one entry per camera and date) waiting to be attempted again.
+    After a failure an entry becomes eligible again after backoff_seconds * 2 ** (attempts - 1) seconds.
+    claim() hands out eligible entries atomically and keeps them away from other claims for lease_seconds,
+    so an entry claimed by a run that crashed is attempted again once the lease expires.
+    '''
+
+    def __init__(self, path=DEFAULT_PATH, backoff_seconds=3600, lease_seconds=6 * 3600):
+        self.path = path
+        self.backoff_seconds = backoff_seconds
+        self.lease_seconds = lease_seconds
+        self.__db = None
+        self.__lock = threading.RLock()
+
+    def __connection(self):
+        if self.__db is None:
+            # Autocommit mode, transactions are opened explicitly with BEGIN IMMEDIATE
+            self.__db = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+            self.__db.execute('''
+                CREATE TABLE IF NOT EXISTS failed_calibrations (
+                    camera_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    date TEXT NOT NULL,
+                    is_monthly INTEGER NOT NULL,
+                    attempts INTEGER NOT NULL,
+                    next_attempt REAL NOT NULL,
+                    claimed_until REAL,
+                    last_error TEXT,
+                    PRIMARY KEY (camera_id, date)
+                )
+            ''')
+        return self.__db
+
+    def __transaction(self, statements):
+        '''
+        Runs statements(db) in an immediate transaction and returns its result.
+        '''
+        with self.__lock:
+            db = self.__connection()
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                result = statements(db)
+            except BaseException:
+                db.execute('ROLLBACK')
+                raise
+            db.execute('COMMIT')
+            return result
+
+    def __backoff(self, attempts):
+        return self.backoff_seconds * 2 ** max(0, attempts - 1)
+
+    def add(self, camera_id, user_id, date, is_monthly, error=None):
+        '''
+        Records a failed calibration of camera camera_id on date date, counting one more attempt if it was already queued.
+        '''
+        now = time.time()
+
+        def statements(db):
+            row = db.execute('SELECT attempts FROM failed_calibrations WHERE camera_id = ? AND date = ?', (camera_id, date)).fetchone()
+            attempts = 1 if row is None else row[0] + 1
+            db.execute('INSERT OR REPLACE INTO failed_calibrations VALUES (?, ?, ?, ?, ?, ?, NULL, ?)', (camera_id, user_id, date, int(is_monthly), attempts, now + self.__backoff(attempts), error))
+        self.__transaction(statements)
+
+    def claim(self, now=None):
+        '''
+        Returns the entries eligible for a new attempt and leases them to the caller.
+        Every entry is a dictionary with keys camera_id, user_id, date, is_monthly, attempts and last_error, ordered by date.
+        '''
+        now = time.time() if now is None else now
+
+        def statements(db):
+            rows = db.execute('SELECT camera_id, user_id, date, is_monthly, attempts, last_error FROM failed_calibrations WHERE next_attempt <= ? AND (claimed_until IS NULL OR claimed_until < ?) ORDER BY date, camera_id', (now, now)).fetchall()
+            db.executemany('UPDATE failed_calibrations SET claimed_until = ? WHERE camera_id = ? AND date = ?', [(now + self.lease_seconds, row[0], row[2]) for row in rows])
+            return [dict(zip(('camera_id', 'user_id', 'date', 'is_monthly', 'attempts', 'last_error'), row)) for row in rows]
+        return self.__transaction(statements)
+
+    def complete(self, entry):
+        '''
+        Removes a claimed entry whose calibration succeeded.
+        '''
+        self.__transaction(lambda db: db.execute('DELETE FROM failed_calibrations WHERE camera_id = ? AND date = ?', (entry['camera_id'], entry['date'])))
+
+    def fail(self, entry, max_attempts, error=None):
+        '''
+        Records one more failed attempt of a claimed entry. The entry is dropped once it reached max_attempts attempts.
+        Returns True if the entry will be attempted again.
+        '''
+        attempts = entry['attempts'] + 1
+
+        def statements(db):
+            if attempts >= max_attempts:
+                db.execute('DELETE FROM failed_calibrations WHERE camera_id = ? AND date = ?', (entry['camera_id'], entry['date']))
+                return False
+            db.execute('UPDATE failed_calibrations SET attempts = ?, next_attempt = ?, claimed_until = NULL, last_error = ? WHERE camera_id = ? AND date = ?', (attempts, time.time() + self.__backoff(attempts), error, entry['camera_id'], entry['date']))
+            return True
+        return self.__transaction(statements)
+
+    def count(self, eligible_only=False, now=None):
+        '''
+        Returns the number of queued entries, or with eligible_only those claim() would hand out now.
+        '''
+        now = time.time() if now is None else now
+        with self.__lock:
+            if eligible_only:
+                return self.__connection().execute('SELECT COUNT(*) FROM failed_calibrations WHERE next_attempt <= ? AND (claimed_until IS NULL OR claimed_until < ?)', (now, now)).fetchone()[0]
+            return self.__connection().execute('SELECT COUNT(*) FROM failed_calibrations').fetchone()[0]
+
+    def migrate_json(self, json_path):
+        '''
+        Moves the entries of a failed_calibrations.json file written by previous versions into the queue, then renames the file to json_path.migrated.
+        Returns the number of migrated entries.
+        '''
+        if not os.path.exists(json_path):
+            return 0
+        with open(json_path) as f:
+            failed_calibrations = json.load(f)
+
+        def statements(db):
+            n_migrated = 0
+            for date, failed in failed_calibrations.items():
+                for camera_id, user_id in failed['camera_data']:
+                    db.execute('INSERT OR IGNORE INTO failed_calibrations VALUES (?, ?, ?, ?, ?, 0, NULL, NULL)', (camera_id, user_id, date, int(failed['is_monthly']), failed['attempts']))
+                    n_migrated += 1
+            return n_migrated
+        n_migrated = self.__transaction(statements)
+        os.replace(json_path, f'{json_path}.migrated')
+        return n_migrated
+
+    def close(self):
+        with self.__lock:
+            if self.__db is not None:
+                self.__db.close()
+                self.__db = None
@@ -0,0 +1,86 @@
+import threading
+from PRISMA_SDK import CameraFactory, SystemConfigurationFactory, UserConfigurationFactory
+
+
+class CalibrationRunContext:
+    '''
+    Caches the system configuration, cameras and user configurations for the duration of a calibration run.
+    load() fetches everything a run needs with a few queries; anything not loaded is fetched on first use with the caller's db and kept.
+    Every accessor takes the caller's db, so worker threads never use a connection owned by another thread.
+    Call invalidate() when the cached values may have changed on the db.
+    '''
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.invalidate()
+
+    def invalidate(self):
+        '''
+        Drops every cached value, the next access fetches it again from the db.
+        '''
+        with self.__lock:
+            self.__sys_config = None
+            self.__sys_parameters = None
+            self.__cameras = {}
+            self.__active_cameras = None
+            self.__user_configs = {}
+
+    def load(self, db):
+        '''
+        Fetches the system configuration, the active cameras and the configuration of every user owning one of them.
+        '''
+        self.sys_config(db)
+        for camera in self.active_cameras(db):
+            self.user_config(camera.modified_by, db)
+
+    def sys_config(self, db):
+        '''
+        Returns the list of SystemConfiguration parameters.
+        '''
+        with self.__lock:
+            if self.__sys_config is None:
+                self.__sys_config = SystemConfigurationFactory.SystemConfigurationFactory().getList(db)
+                self.__sys_parameters = {parameter.parameter_name: parameter.parameter_value for parameter in self.__sys_config}
+            return self.__sys_config
+
+    def sys_parameter(self, parameter_name, db):
+        '''
+        Returns the value of SystemConfiguration parameter parameter_name, None if it doesn't exist.
+        '''
+        self.sys_config(db)
+        return self.__sys_parameters.get(parameter_name)
+
+    def active_cameras(self, db):
+        '''
+        Returns the list of active cameras.
+        '''
+        with self.__lock:
+            if self.__active_cameras is None:
+                self.__active_cameras = CameraFactory.CameraFactory.getListActiveCameras(db)
+                for camera in self.__active_cameras:
+                    self.__cameras[camera.id] = camera
+            return self.__active_cameras
+
+    def is_camera_active(self, cameraId, db):
+        '''
+        Returns True if camera cameraId is in the list of active cameras.
+        '''
+        return any(camera.id == cameraId for camera in self.active_cameras(db))
+
+    def camera(self, cameraId, db):
+        '''
+        Returns camera cameraId.
+        '''
+        with self.__lock:
+            if cameraId not in self.__cameras:
+                self.__cameras[cameraId] = CameraFactory.CameraFactory().getById(cameraId, db)
+            return self.__cameras[cameraId]
+
+    def user_config(self, userId, db):
+        '''
+        Returns a copy of the config_parameters dictionary of user userId.
+        '''
+        with self.__lock:
+            if userId not in self.__user_configs:
+                self.__user_configs[userId] = UserConfigurationFactory.UserConfigurationFactory().getDictForUser(userId, db)
+            return dict(self.__user_configs[userId])
@@ -0,0 +1,168 @@
+import collections
+import heapq
+import threading
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+
+
+class CalibrationWorkerPool:
+    '''
+    Runs calibration jobs on a bounded number of worker threads.
+    Every worker thread owns its database connection, so jobs never share a connection.
+    With max_workers set to 1 jobs run one after another on the caller's connection db.
+    A job that raises doesn't stop the others: its traceback is printed and it is yielded with the error_result given to the run method.
+    '''
+
+    def __init__(self, max_workers, db, connect_db):
+        self.max_workers = max(1, int(max_workers))
+        self.__db = db
+        self.__connect_db = connect_db
+        self.__local = threading.local()
+        self.__connections = []
+        self.__lock = threading.Lock()
+
+    def db(self):
+        '''
+        Returns the database connection owned by the calling worker thread, opening it on first use.
+        Returns None if it can't be opened, the next job of the thread tries again.
+        '''
+        if self.max_workers == 1:
+            return self.__db
+        db = getattr(self.__local, 'db', None)
+        if db is None:
+            db = self.__connect_db()
+            if db is None:
+                return None
+            self.__local.db = db
+            with self.__lock:
+                self.__connections.append(db)
+        return db
+
+    def __call(self, job_function, job, error_result):
+        '''
+        Returns job_function(job, db) with the connection of the calling thread, or error_result if it raised.
+        '''
+        try:
+            return job_function(job, self.db())
+        except Exception:
+            traceback.print_exc()
+            return error_result
+
+    def run(self, jobs, job_function, error_result=None):
+        '''
+        Calls job_function(job, db) for every job and yields (job, result) as each one completes.
+        Results are yielded on the caller's thread, so bookkeeping done while iterating needs no locking.
+        Jobs not started yet are cancelled if the caller stops iterating.
+        '''
+        if self.max_workers == 1:
+            for job in jobs:
+                yield job, self.__call(job_function, job, error_result)
+            return
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='calibration') as executor:
+            futures = {executor.submit(self.__call, job_function, job, error_result): job for job in jobs}
+            try:
+                for future in as_completed(futures):
+                    yield futures[future], future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    def run_graph(self, jobs, job_function, dependencies, error_result=None):
+        '''
+        Like run(), for jobs that depend on other jobs: a job starts once every job in dependencies.get(job, ()) returned a true result.
+        A job with a dependency that failed (or was not run) is not run and is yielded with result None.
+        Ready jobs start in the order of jobs, dependencies that are not in jobs count as already succeeded. Jobs must be hashable.
+        '''
+        position = {job: i for i, job in enumerate(jobs)}
+        waiting_for = {job: set(dependency for dependency in dependencies.get(job, ()) if dependency in position) for job in jobs}
+        dependents = {}
+        for job, job_dependencies in waiting_for.items():
+            for dependency in job_dependencies:
+                dependents.setdefault(dependency, []).append(job)
+        ready = [position[job] for job, job_dependencies in waiting_for.items() if not job_dependencies]
+        heapq.heapify(ready)
+
+        def complete(job, result):
+            '''
+            Returns job and the jobs it blocks with their results, and queues the jobs it made ready.
+            '''
+            completed = [(job, result)]
+            for dependent in dependents.get(job, ()):
+                if waiting_for[dependent] is None:
+                    continue
+                if not result:
+                    waiting_for[dependent] = None
+                    completed += complete(dependent, None)
+                else:
+                    waiting_for[dependent].discard(job)
+                    if not waiting_for[dependent]:
+                        heapq.heappush(ready, position[dependent])
+            return completed
+
+        if self.max_workers == 1:
+            while ready:
+                job = jobs[heapq.heappop(ready)]
+                yield from complete(job, self.__call(job_function, job, error_result))
+            return
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='calibration') as executor:
+            running = {}
+            while ready or running:
+                while ready and len(running) < self.max_workers:
+                    job = jobs[heapq.heappop(ready)]
+                    running[executor.submit(self.__call, job_function, job, error_result)] = job
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from complete(running.pop(future), future.result())
+
+    def run_stream(self, next_jobs, job_function, interval, error_result=None):
+        '''
+        Like run(), for jobs that become known while others run.
+        next_jobs() is called on the caller's thread whenever a job completes, and every interval seconds while none does,
+        and returns the list of jobs to start, or None to stop: running jobs are waited for and jobs not started yet are dropped.
+        Jobs wait in order until a worker is free.
+        '''
+        pending = collections.deque()
+        if self.max_workers == 1:
+            while True:
+                jobs = next_jobs()
+                if jobs is None:
+                    return
+                pending.extend(jobs)
+                if pending:
+                    job = pending.popleft()
+                    yield job, self.__call(job_function, job, error_result)
+                else:
+                    time.sleep(interval)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='calibration') as executor:
+            running = {}
+            while True:
+                jobs = next_jobs()
+                if jobs is None:
+                    pending.clear()
+                else:
+                    pending.extend(jobs)
+                while pending and len(running) < self.max_workers:
+                    job = pending.popleft()
+                    running[executor.submit(self.__call, job_function, job, error_result)] = job
+                if jobs is None and not running:
+                    return
+                if running:
+                    done, _ = wait(running, timeout=interval, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield running.pop(future), future.result()
+                else:
+                    time.sleep(interval)
+
+    def close(self):
+        '''
+        Closes every connection opened by the worker threads.
+        '''
+        with self.__lock:
+            connections, self.__connections = self.__connections, []
+        for db in connections:
+            if db.is_connected():
+                db.close()
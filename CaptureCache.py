@@ -0,0 +1,134 @@
+import argparse
+import gzip
+import hashlib
+import os
+import shutil
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+
+class CaptureCache:
+    '''
+    Shared cache of decompressed captures: every `.fit.gz` capture is decompressed once into cache_dir and reused by every job and every run until it is evicted.
+    The decompressed file keeps the name of its capture without `.gz` and the mtime of its capture, a capture that changed is decompressed again.
+    Its atime records its last use: once the cache holds more than quota_bytes the files used least recently are evicted,
+    except those used in the last grace_seconds, which a running calibration may still be reading.
+    '''
+
+    def __init__(self, cache_dir, quota_bytes=None, max_workers=4, grace_seconds=6 * 3600):
+        self.cache_dir = cache_dir
+        self.quota_bytes = quota_bytes
+        self.max_workers = max(1, int(max_workers))
+        self.grace_seconds = grace_seconds
+        self.__lock = threading.Lock()
+
+    def cache_path(self, capture):
+        '''
+        Returns the path of the decompressed copy of capture.
+        '''
+        folder_key = hashlib.sha1(os.path.dirname(capture['path']).encode('utf-8')).hexdigest()[:16]
+        return f'{self.cache_dir}/{folder_key}/{capture["filename"][:-3]}'
+
+    @staticmethod
+    def __decompress(capture, path):
+        '''
+        Decompresses capture to path, returns False if it isn't a valid gzip file.
+        '''
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        try:
+            with gzip.open(capture['path'], 'rb') as src, open(tmp_path, 'wb') as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+        except (OSError, EOFError, zlib.error):
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+        os.utime(tmp_path, ns=(time.time_ns(), capture['mtime_ns']))
+        os.replace(tmp_path, path)
+        return True
+
+    def stage(self, captures):
+        '''
+        Returns captures with every `.fit.gz` capture replaced by its decompressed copy, and how many captures had to be decompressed.
+        Missing copies are decompressed in parallel, captures that can't be decompressed are returned unchanged.
+        '''
+        staged = list(captures)
+        misses = []
+        now_ns = time.time_ns()
+        for i, capture in enumerate(captures):
+            if not capture['filename'].endswith('.gz'):
+                continue
+            path = self.cache_path(capture)
+            try:
+                hit = os.stat(path).st_mtime_ns == capture['mtime_ns']
+            except FileNotFoundError:
+                hit = False
+            if hit:
+                os.utime(path, ns=(now_ns, capture['mtime_ns']))
+                staged[i] = dict(capture, filename=capture['filename'][:-3], path=path)
+            else:
+                misses.append(i)
+
+        if misses:
+            with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='decompression') as executor:
+                results = list(executor.map(lambda i: CaptureCache.__decompress(captures[i], self.cache_path(captures[i])), misses))
+            for i, decompressed in zip(misses, results):
+                if decompressed:
+                    staged[i] = dict(captures[i], filename=captures[i]['filename'][:-3], path=self.cache_path(captures[i]))
+            if self.quota_bytes is not None:
+                self.evict()
+        return staged, len(misses)
+
+    def usage(self):
+        '''
+        Returns the list of (atime_ns, size, path) of the cached files and their total size.
+        '''
+        files = []
+        if os.path.isdir(self.cache_dir):
+            for folder in os.scandir(self.cache_dir):
+                if not folder.is_dir():
+                    continue
+                for entry in os.scandir(folder.path):
+                    if entry.name.endswith('.tmp'):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    files.append((stat.st_atime_ns, stat.st_size, entry.path))
+        return files, sum(size for _, size, _ in files)
+
+    def evict(self, quota_bytes=None):
+        '''
+        Removes the files used least recently until the cache holds at most quota_bytes (default: the quota of the cache) and returns how many were removed.
+        '''
+        quota_bytes = self.quota_bytes if quota_bytes is None else quota_bytes
+        n_removed = 0
+        with self.__lock:
+            files, total = self.usage()
+            oldest_protected = time.time_ns() - int(self.grace_seconds * 1e9)
+            for atime_ns, size, path in sorted(files):
+                if total <= quota_bytes or atime_ns >= oldest_protected:
+                    break
+                try:
+                    os.remove(path)
+                    n_removed += 1
+                except FileNotFoundError:
+                    pass
+                total -= size
+        return n_removed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Maintain the cache of decompressed captures.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    evict_parser = subparsers.add_parser('evict', help='remove the files used least recently until the cache fits in a quota')
+    evict_parser.add_argument('cache_dir', help='cache folder (capture_cache_dir)')
+    evict_parser.add_argument('quota_mb', type=float, help='size the cache must fit in, in MB')
+    evict_parser.add_argument('--grace-hours', type=float, default=0, help='keep files used in the last hours (default: 0)')
+    args = parser.parse_args()
+
+    cache = CaptureCache(args.cache_dir, grace_seconds=args.grace_hours * 3600)
+    print(f'Removed {cache.evict(int(args.quota_mb * 1024 * 1024))} file(s).')
@@ -0,0 +1,189 @@
+import argparse
+import os
+import re
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'capture_index.sqlite')
+# Night folders are named {prefix}_{YYYYmmdd}, whatever the prefix
+NIGHT_FOLDER = re.compile(r'^.+_(?P<night>\d{8})$')
+# mtime_ns of a folder whose captures are not indexed
+NOT_INDEXED = -1
+
+
+class CaptureIndex:
+    '''
+    SQLite index of the captures found in `{root_path}/{camera_code}/{folder}_{YYYYmmdd}/captures`.
+    Every capture is stored with the night it belongs to: captures taken before 12:00 belong to the night of the previous day.
+    refresh() only lists the captures folders whose mtime changed since they were last indexed, and for a job only those of the nights around its date.
+    '''
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.__db = None
+        self.__lock = threading.RLock()
+
+    def __connection(self):
+        if self.__db is None:
+            self.__db = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self.__db.executescript('''
+                CREATE TABLE IF NOT EXISTS folders (
+                    camera_code TEXT NOT NULL,
+                    folder TEXT NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    PRIMARY KEY (camera_code, folder)
+                );
+                CREATE TABLE IF NOT EXISTS cameras (
+                    camera_code TEXT PRIMARY KEY,
+                    mtime_ns INTEGER
+                );
+                CREATE TABLE IF NOT EXISTS captures (
+                    camera_code TEXT NOT NULL,
+                    folder TEXT NOT NULL,
+                    filename TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    observation_time TEXT,
+                    night TEXT,
+                    size INTEGER NOT NULL,
+                    mtime_ns INTEGER NOT NULL,
+                    PRIMARY KEY (camera_code, folder, filename)
+                );
+                CREATE INDEX IF NOT EXISTS captures_by_night ON captures (camera_code, night, observation_time);
+            ''')
+        return self.__db
+
+    @staticmethod
+    def night_of(filename):
+        '''
+        Returns the observation time (YYYYmmddTHHMMSS) of capture filename and the night (YYYYmmdd) it belongs to, (None, None) if its name has no `_YYYYmmddTHHMMSS` part.
+        '''
+        try:
+            observation_time = datetime.strptime(filename.split('_')[1][:15], '%Y%m%dT%H%M%S')
+        except (IndexError, ValueError):
+            return None, None
+        night = observation_time - timedelta(days=1) if observation_time.hour < 12 else observation_time
+        return observation_time.strftime('%Y%m%dT%H%M%S'), night.strftime('%Y%m%d')
+
+    @staticmethod
+    def __nights_around(date):
+        '''
+        Returns the first and last night (YYYYmmdd) whose folder may hold captures of night date (YYYYmmdd) or of the nights of month date (YYYYmm):
+        captures taken before 12:00 are in the folder of the next day, a day is added on both ends.
+        '''
+        if len(date) > 6:
+            first = last = datetime.strptime(date, '%Y%m%d')
+        else:
+            first = datetime.strptime(date, '%Y%m')
+            last = (first + timedelta(days=31)).replace(day=1) - timedelta(days=1)
+        return (first - timedelta(days=1)).strftime('%Y%m%d'), (last + timedelta(days=1)).strftime('%Y%m%d')
+
+    def refresh(self, camera_code, root_path, date=None, force=False):
+        '''
+        Brings the index of camera camera_code up to date with `{root_path}/{camera_code}`.
+        With date (YYYYmmdd or YYYYmm) only the captures folders of the nights around date are checked, and the camera folder is only listed again
+        if its mtime changed (a folder was added or removed). Without date every captures folder is checked, as rebuild() does.
+        With force every checked captures folder is listed again, whatever its mtime.
+        The file system is read without holding the lock of the index, so jobs of other cameras don't wait for it.
+        '''
+        camera_path = f'{root_path}/{camera_code}'
+        try:
+            camera_mtime_ns = os.stat(camera_path).st_mtime_ns
+        except (FileNotFoundError, NotADirectoryError):
+            camera_mtime_ns = None
+
+        with self.__lock:
+            db = self.__connection()
+            indexed = dict(db.execute('SELECT folder, mtime_ns FROM folders WHERE camera_code = ?', (camera_code,)).fetchall())
+            indexed_camera = db.execute('SELECT mtime_ns FROM cameras WHERE camera_code = ?', (camera_code,)).fetchone()
+
+        # Folders of the camera, listed again unless only the nights around date are checked and none was added or removed
+        listed = None
+        if date is None or indexed_camera is None or indexed_camera[0] != camera_mtime_ns:
+            listed = []
+            if camera_mtime_ns is not None:
+                try:
+                    listed = [entry.name for entry in os.scandir(camera_path)]
+                except (FileNotFoundError, NotADirectoryError):
+                    pass
+        folders = set(indexed) if listed is None else set(listed)
+        if date is not None:
+            first, last = CaptureIndex.__nights_around(date)
+            matches = (NIGHT_FOLDER.match(folder) for folder in folders)
+            folders = set(match.group(0) for match in matches if match is not None and first <= match.group('night') <= last)
+
+        listings = {}
+        for folder in folders:
+            try:
+                mtime_ns = os.stat(f'{camera_path}/{folder}/captures').st_mtime_ns
+            except (FileNotFoundError, NotADirectoryError):
+                # Not a night folder, or its captures were removed
+                listings[folder] = (NOT_INDEXED, [])
+                continue
+            if not force and indexed.get(folder) == mtime_ns:
+                continue
+            rows = []
+            for entry in os.scandir(f'{camera_path}/{folder}/captures'):
+                stat = entry.stat()
+                observation_time, night = CaptureIndex.night_of(entry.name)
+                rows.append((camera_code, folder, entry.name, entry.path, observation_time, night, stat.st_size, stat.st_mtime_ns))
+            listings[folder] = (mtime_ns, rows)
+
+        with self.__lock:
+            db = self.__connection()
+            with db:
+                if listed is not None:
+                    for folder in set(indexed) - set(listed):
+                        db.execute('DELETE FROM captures WHERE camera_code = ? AND folder = ?', (camera_code, folder))
+                        db.execute('DELETE FROM folders WHERE camera_code = ? AND folder = ?', (camera_code, folder))
+                    # Folders not checked yet are known, so a refresh of their nights finds them without listing the camera folder
+                    db.executemany('INSERT OR IGNORE INTO folders VALUES (?, ?, ?)', [(camera_code, folder, NOT_INDEXED) for folder in set(listed) - set(indexed)])
+                    db.execute('INSERT OR REPLACE INTO cameras VALUES (?, ?)', (camera_code, camera_mtime_ns))
+                for folder, (mtime_ns, rows) in listings.items():
+                    db.execute('DELETE FROM captures WHERE camera_code = ? AND folder = ?', (camera_code, folder))
+                    db.executemany('INSERT INTO captures VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+                    db.execute('INSERT OR REPLACE INTO folders VALUES (?, ?, ?)', (camera_code, folder, mtime_ns))
+
+    def captures(self, camera_code, date):
+        '''
+        Returns the captures of camera camera_code for night date (YYYYmmdd) or for every night of month date (YYYYmm), ordered by observation time.
+        Every capture is a dictionary with keys filename, path, night, size and mtime_ns.
+        '''
+        if len(date) > 6:
+            condition, arguments = 'night = ?', (camera_code, date)
+        else:
+            condition, arguments = 'night BETWEEN ? AND ?', (camera_code, f'{date}01', f'{date}31')
+        with self.__lock:
+            rows = self.__connection().execute(f'SELECT filename, path, night, size, mtime_ns FROM captures WHERE camera_code = ? AND {condition} ORDER BY observation_time', arguments).fetchall()
+        return [dict(zip(('filename', 'path', 'night', 'size', 'mtime_ns'), row)) for row in rows]
+
+    def rebuild(self, root_path, camera_codes=None):
+        '''
+        Drops the index of the cameras camera_codes (every folder of root_path if None) and lists all their captures again.
+        '''
+        if camera_codes is None:
+            camera_codes = [entry.name for entry in os.scandir(root_path) if entry.is_dir()]
+        for camera_code in camera_codes:
+            self.refresh(camera_code, root_path, force=True)
+        return camera_codes
+
+    def close(self):
+        with self.__lock:
+            if self.__db is not None:
+                self.__db.close()
+                self.__db = None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Maintain the index of the captures used by ProcessCalibration.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    rebuild_parser = subparsers.add_parser('rebuild', help='index every capture again, ignoring folder mtimes')
+    rebuild_parser.add_argument('root_path', help='folder containing one folder per camera code (system parameter root_path)')
+    rebuild_parser.add_argument('--camera', dest='cameras', action='append', help='camera code to rebuild, can be repeated (default: every camera)')
+    rebuild_parser.add_argument('--index', default=DEFAULT_PATH, help=f'index file (default: {DEFAULT_PATH})')
+    args = parser.parse_args()
+
+    index = CaptureIndex(args.index)
+    for code in index.rebuild(args.root_path, args.cameras):
+        print(f'Indexed captures of camera {code}.')
+    index.close()
@@ -0,0 +1,78 @@
+import argparse
+import os
+import time
+
+
+class CaptureStaging:
+    '''
+    Makes the captures of a calibration job available to IDL under `cp_dir_captures`, either as one symbolic link per capture or as a single manifest file listing their paths.
+    '''
+
+    @staticmethod
+    def link_captures(captures, target_dir):
+        '''
+        Creates in target_dir a symbolic link to every capture that isn't linked there yet and returns how many were created.
+        A capture is linked under one name only: the link to its decompressed copy (`.fit`) replaces the link to the capture (`.fit.gz`) and vice versa.
+        '''
+        os.makedirs(target_dir, exist_ok=True)
+        linked = set(os.listdir(target_dir))
+        n_linked = 0
+        for capture in captures:
+            if capture['filename'] not in linked:
+                counterpart = capture['filename'][:-3] if capture['filename'].endswith('.gz') else f'{capture["filename"]}.gz'
+                if counterpart in linked:
+                    os.remove(f'{target_dir}/{counterpart}')
+                os.symlink(capture['path'], f'{target_dir}/{capture["filename"]}')
+                n_linked += 1
+        return n_linked
+
+    @staticmethod
+    def write_manifest(captures, manifest_path):
+        '''
+        Writes the paths of captures to manifest_path, one per line, unless it already lists exactly those paths.
+        The file is replaced atomically, so IDL never reads a partially written manifest.
+        Returns True if the file was written.
+        '''
+        content = ''.join(f'{capture["path"]}\n' for capture in captures)
+        try:
+            with open(manifest_path) as f:
+                if f.read() == content:
+                    return False
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+        tmp_path = f'{manifest_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            f.write(content)
+        os.replace(tmp_path, manifest_path)
+        return True
+
+    @staticmethod
+    def collect_garbage(captures_dir_path, max_age_days=None):
+        '''
+        Removes from captures_dir_path the symbolic links whose capture no longer exists and, if max_age_days is set, the links and manifests older than max_age_days days.
+        Folders left empty are removed too. Returns the number of removed files.
+        '''
+        oldest = None if max_age_days is None else time.time() - max_age_days * 86400
+        n_removed = 0
+        for dir_path, dir_names, filenames in os.walk(captures_dir_path, topdown=False):
+            for filename in filenames:
+                path = f'{dir_path}/{filename}'
+                stat = os.lstat(path)
+                is_link = os.path.islink(path)
+                if (is_link and not os.path.exists(path)) or (oldest is not None and (is_link or filename.endswith('.manifest')) and stat.st_mtime < oldest):
+                    os.remove(path)
+                    n_removed += 1
+            if dir_path != captures_dir_path and not os.listdir(dir_path):
+                os.rmdir(dir_path)
+        return n_removed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Maintain the captures staged for calibration.pro.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    gc_parser = subparsers.add_parser('gc', help='remove stale capture links and manifests')
+    gc_parser.add_argument('captures_dir_path', help='staging folder (system parameter cp_dir_captures)')
+    gc_parser.add_argument('--max-age-days', type=float, help='also remove links and manifests older than this many days')
+    args = parser.parse_args()
+
+    print(f'Removed {CaptureStaging.collect_garbage(args.captures_dir_path, args.max_age_days)} stale file(s).')
@@ -0,0 +1,167 @@
+import os
+import re
+import time
+from datetime import datetime, timedelta
+
+try:
+    import inotify_simple
+except ImportError:
+    inotify_simple = None
+
+# The prefix of a night folder is not necessarily the camera code (e.g. the station code)
+NIGHT_FOLDER = re.compile(r'^.+_(?P<night>\d{8})$')
+
+
+class CaptureWatcher:
+    '''
+    Watches the `{root_path}/{camera_code}/*_YYYYmmdd/captures` folders of the last lookback_days nights and tells when the captures of a night are complete:
+    a night is complete once no capture arrived in its folder for quiet_seconds after dawn_hour (local time) of the next day.
+    New captures are noticed with inotify if use_inotify is set and inotify_simple is installed, otherwise by listing the camera folders on every call of complete_nights().
+    '''
+
+    def __init__(self, root_path, camera_codes, quiet_seconds=1800, dawn_hour=6, lookback_days=2, use_inotify=True):
+        self.root_path = root_path
+        self.quiet_seconds = quiet_seconds
+        self.dawn_hour = dawn_hour
+        self.lookback_days = lookback_days
+        self.camera_codes = set()
+        # Time of the last capture of every night not reported complete yet, and the nights already reported
+        self.__activity = {}
+        self.__reported = set()
+        self.__inotify = inotify_simple.INotify() if use_inotify and inotify_simple is not None else None
+        self.__watches = {}
+        self.__scan_needed = True
+        self.set_cameras(camera_codes)
+
+    @property
+    def uses_inotify(self):
+        return self.__inotify is not None
+
+    def set_cameras(self, camera_codes):
+        '''
+        Sets the codes of the cameras to watch.
+        '''
+        camera_codes = set(camera_codes)
+        if camera_codes - self.camera_codes:
+            self.__scan_needed = True
+        self.camera_codes = camera_codes
+
+    def night_end(self, night):
+        '''
+        Returns the timestamp of dawn after night (YYYYmmdd).
+        '''
+        return (datetime.strptime(night, '%Y%m%d') + timedelta(days=1, hours=self.dawn_hour)).timestamp()
+
+    def is_complete(self, camera_code, night, now=None):
+        '''
+        Returns True if the captures of camera_code on night are complete, also when the night has no captures folder.
+        '''
+        now = time.time() if now is None else now
+        last_activity = self.__activity.get((camera_code, night), 0)
+        return now >= max(self.night_end(night), last_activity) + self.quiet_seconds
+
+    def complete_nights(self, now=None):
+        '''
+        Returns the list of (camera_code, night) whose captures became complete since the last call, every night is reported once.
+        '''
+        now = time.time() if now is None else now
+        if self.__inotify is None or self.__scan_needed:
+            self.__scan(now)
+        else:
+            self.__read_events(now)
+
+        complete = sorted(key for key in self.__activity if self.is_complete(*key, now))
+        for key in complete:
+            del self.__activity[key]
+            self.__reported.add(key)
+            self.__unwatch(key)
+        # Nights out of the lookback window are never reported again
+        first_night = self.__first_night(now)
+        self.__reported = set(key for key in self.__reported if key[1] >= first_night)
+        return complete
+
+    def __first_night(self, now):
+        return (datetime.fromtimestamp(now) - timedelta(days=self.lookback_days)).strftime('%Y%m%d')
+
+    def __scan(self, now):
+        '''
+        Lists the camera folders and records the mtime of the captures folder of every night of the lookback window.
+        '''
+        self.__scan_needed = False
+        first_night = self.__first_night(now)
+        for camera_code in self.camera_codes:
+            camera_path = f'{self.root_path}/{camera_code}'
+            self.__watch(camera_path, (camera_code, None))
+            try:
+                entries = list(os.scandir(camera_path))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                match = NIGHT_FOLDER.match(entry.name)
+                if match is None or match['night'] < first_night or (camera_code, match['night']) in self.__reported:
+                    continue
+                self.__add_night(camera_code, match['night'], entry.path)
+
+    def __add_night(self, camera_code, night, night_path, activity=None):
+        '''
+        Starts tracking night, with its last activity at the mtime of its captures folder (or at activity if later).
+        '''
+        self.__watch(night_path, (camera_code, night))
+        try:
+            mtime = os.stat(f'{night_path}/captures').st_mtime
+        except FileNotFoundError:
+            return
+        self.__watch(f'{night_path}/captures', (camera_code, night))
+        key = (camera_code, night)
+        self.__activity[key] = max(self.__activity.get(key, 0), mtime, activity or 0)
+
+    def __watch(self, path, key):
+        if self.__inotify is None:
+            return
+        flags = inotify_simple.flags
+        try:
+            wd = self.__inotify.add_watch(path, flags.CREATE | flags.MOVED_TO | flags.CLOSE_WRITE | flags.ONLYDIR)
+        except OSError:
+            return
+        self.__watches[wd] = (path, key)
+
+    def __unwatch(self, key):
+        if self.__inotify is None:
+            return
+        for wd, (_, watch_key) in list(self.__watches.items()):
+            if watch_key == key:
+                try:
+                    self.__inotify.rm_watch(wd)
+                except OSError:
+                    pass
+                del self.__watches[wd]
+
+    def __read_events(self, now):
+        '''
+        Records the activity reported by inotify since the last call.
+        '''
+        flags = inotify_simple.flags
+        first_night = self.__first_night(now)
+        for event in self.__inotify.read(timeout=0):
+            if event.mask & flags.Q_OVERFLOW:
+                self.__scan(now)
+                continue
+            if event.mask & flags.IGNORED:
+                self.__watches.pop(event.wd, None)
+                continue
+            if event.wd not in self.__watches:
+                continue
+            path, (camera_code, night) = self.__watches[event.wd]
+            if night is None:
+                # A new night folder in a camera folder
+                match = NIGHT_FOLDER.match(event.name)
+                if match is not None and match['night'] >= first_night and (camera_code, match['night']) not in self.__reported:
+                    self.__add_night(camera_code, match['night'], f'{path}/{event.name}', now)
+            elif (camera_code, night) not in self.__reported:
+                # A new captures folder in a night folder, or a new capture
+                self.__add_night(camera_code, night, os.path.dirname(path) if path.endswith('/captures') else path, now)
+
+    def close(self):
+        if self.__inotify is not None:
+            self.__inotify.close()
+            self.__inotify = None
@@ -0,0 +1,134 @@
+import itertools
+import threading
+import time
+
+
+class DatabaseConnectionPool:
+    '''
+    Pool of pool_size database connections, opened on first use, shared by the main thread, the log writer and the calibration workers of a process.
+    The connections are held by mysql.connector.pooling.MySQLConnectionPool instances of up to CNX_POOL_MAXSIZE connections each,
+    reserve() adds instances when a run needs more connections than are open. Connections are handed out as PingingConnection: before the first query that follows
+    ping_interval seconds without use the connection is pinged and reconnected if the server dropped it, so no write fails after a long IDL run.
+    Works with mysql.connector or any module with the same pooling, errors.PoolError and Error.
+    '''
+
+    __pool_ids = itertools.count()
+
+    def __init__(self, module, config, pool_size, ping_interval=30, reconnect_attempts=3, timeout=60):
+        self.pool_size = pool_size
+        self.ping_interval = ping_interval
+        self.reconnect_attempts = reconnect_attempts
+        self.timeout = timeout
+        self.module = module
+        self.__config = config
+        self.__pools = []
+        self.__lock = threading.Lock()
+        self.__stats = {'acquired': 0, 'in_use': 0, 'max_in_use': 0, 'waits': 0, 'pings': 0, 'reconnects': 0}
+
+    def reserve(self, n_connections):
+        '''
+        Makes the pool hold at least n_connections connections, those missing are opened on the next connection().
+        '''
+        with self.__lock:
+            self.pool_size = max(self.pool_size, n_connections)
+
+    def __open_pools(self):
+        '''
+        Opens pools until they hold pool_size connections, with the lock held.
+        '''
+        n_open = sum(size for _, size in self.__pools)
+        while n_open < self.pool_size:
+            size = min(self.pool_size - n_open, self.module.pooling.CNX_POOL_MAXSIZE)
+            self.__pools.append((self.module.pooling.MySQLConnectionPool(pool_name=f'calibration_{next(DatabaseConnectionPool.__pool_ids)}', pool_size=size, **self.__config), size))
+            n_open += size
+
+    def connection(self):
+        '''
+        Returns a PingingConnection of the pool, waiting up to timeout seconds for one to be closed if they are all in use.
+        Raises the module's Error if the database can't be reached, or PoolError once timeout expired.
+        '''
+        deadline = time.monotonic() + self.timeout
+        waited = False
+        while True:
+            with self.__lock:
+                self.__open_pools()
+                for pool, _ in self.__pools:
+                    try:
+                        # The pool reconnects a connection that is no longer connected before handing it out
+                        connection = pool.get_connection()
+                    except self.module.errors.PoolError:
+                        continue
+                    self.__stats['acquired'] += 1
+                    self.__stats['in_use'] += 1
+                    self.__stats['max_in_use'] = max(self.__stats['max_in_use'], self.__stats['in_use'])
+                    return PingingConnection(self, connection)
+                if time.monotonic() >= deadline:
+                    raise self.module.errors.PoolError(f'All {self.pool_size} database connections are in use.')
+                if not waited:
+                    self.__stats['waits'] += 1
+                    waited = True
+            time.sleep(0.05)
+
+    def release(self, connection):
+        '''
+        Returns connection (the pooled connection of a PingingConnection) to its pool.
+        '''
+        try:
+            connection.close()
+        except self.module.Error:
+            # The pool takes the connection back even if resetting its session failed, it is reconnected when handed out again
+            pass
+        with self.__lock:
+            self.__stats['in_use'] -= 1
+
+    def record(self, stat):
+        '''
+        Counts one more ping or reconnect in the stats.
+        '''
+        with self.__lock:
+            self.__stats[stat] += 1
+
+    def stats(self):
+        '''
+        Returns the usage of the pool since it was created (pool_size, acquired, in_use, max_in_use, waits, pings, reconnects), or None if it was never used.
+        '''
+        with self.__lock:
+            if not self.__pools:
+                return None
+            return {'pool_size': sum(size for _, size in self.__pools), **self.__stats}
+
+
+class PingingConnection:
+    '''
+    Connection handed out by a DatabaseConnectionPool: forwards everything to its pooled connection, pinging it first in cursor() after ping_interval seconds without use.
+    close() returns the connection to the pool, is_connected() is True until then.
+    '''
+
+    def __init__(self, pool, connection):
+        self.__pool = pool
+        self.__connection = connection
+        self.__last_used = time.monotonic()
+        self.__closed = False
+
+    def cursor(self, *args, **kwargs):
+        now = time.monotonic()
+        if now - self.__last_used >= self.__pool.ping_interval:
+            self.__pool.record('pings')
+            try:
+                self.__connection.ping(reconnect=False)
+            except self.__pool.module.Error:
+                self.__connection.reconnect(attempts=self.__pool.reconnect_attempts, delay=1)
+                self.__pool.record('reconnects')
+        self.__last_used = now
+        return self.__connection.cursor(*args, **kwargs)
+
+    def is_connected(self):
+        return not self.__closed
+
+    def close(self):
+        if not self.__closed:
+            self.__closed = True
+            self.__pool.release(self.__connection)
+
+    def __getattr__(self, name):
+        return getattr(self.__connection, name)
@@ -0,0 +1,95 @@
+import hashlib
+import itertools
+import json
+import os
+import re
+import threading
+import time
+
+CONFIG_FILE = re.compile(r'^configuration_(?:[0-9a-f]{16}|tmp_\d+_\d+_\d+)\.ini$')
+
+
+class IDLConfigFileCache:
+    '''
+    Content-addressed IDL configuration files: the file of a job is `configuration_{hash}.ini`, named by the hash of its rendered content,
+    so jobs with the same parameters share one file and jobs with different parameters never overwrite each other's, in this process or in others.
+    Files are rendered by handler (an IDLConfigFileHandler) under a temporary name and renamed atomically, once per set of parameters per process.
+    A file is never deleted while a job of this process uses it: files not used for max_age_seconds, by any process, are deleted by collect_garbage().
+    '''
+
+    def __init__(self, handler, max_age_seconds=24 * 3600):
+        self.max_age_seconds = max_age_seconds
+        self.__handler = handler
+        self.__lock = threading.Lock()
+        self.__rendered = {}
+        self.__users = {}
+        self.__last_collection = 0
+        self.__tmp_ids = itertools.count()
+
+    @staticmethod
+    def __parameters_key(usr_config, sys_config):
+        parameters = [usr_config, sorted((parameter.parameter_name, str(parameter.parameter_value)) for parameter in sys_config)]
+        return hashlib.sha256(json.dumps(parameters, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def acquire(self, usr_config, sys_config, config_dir_path):
+        '''
+        Returns the key of the configuration file of usr_config and sys_config (the file is `{config_dir_path}/configuration_{key}.ini`) and its config_json,
+        rendering the file if this process didn't yet, or False if it couldn't be created. Every acquire() must be followed by a release().
+        '''
+        parameters_key = IDLConfigFileCache.__parameters_key(usr_config, sys_config)
+        with self.__lock:
+            rendered = self.__rendered.get(parameters_key)
+            if rendered is None or not os.path.exists(f'{config_dir_path}/configuration_{rendered[0]}.ini'):
+                tmp_key = f'tmp_{os.getpid()}_{threading.get_ident()}_{next(self.__tmp_ids)}'
+                config_json = self.__handler.create(tmp_key, usr_config, sys_config)
+                if config_json is False:
+                    return False
+                tmp_path = f'{config_dir_path}/configuration_{tmp_key}.ini'
+                with open(tmp_path, 'rb') as f:
+                    config_key = hashlib.sha256(f.read()).hexdigest()[:16]
+                # Another job may use a file with the same name: it has the same content, so replacing it is harmless
+                os.replace(tmp_path, f'{config_dir_path}/configuration_{config_key}.ini')
+                rendered = (config_key, config_json)
+                self.__rendered[parameters_key] = rendered
+            config_key, config_json = rendered
+            # The mtime of a file records its last use, for collect_garbage() in every process
+            os.utime(f'{config_dir_path}/configuration_{config_key}.ini')
+            self.__users[config_key] = self.__users.get(config_key, 0) + 1
+        return config_key, config_json
+
+    def release(self, config_key, config_dir_path):
+        '''
+        Releases the configuration file config_key acquired by a job. Once no job of this process uses a file, old files are collected at most once an hour.
+        '''
+        with self.__lock:
+            self.__users[config_key] -= 1
+            if self.__users[config_key] == 0:
+                del self.__users[config_key]
+            collect = not self.__users and time.time() - self.__last_collection > 3600
+        if collect:
+            self.collect_garbage(config_dir_path)
+
+    def collect_garbage(self, config_dir_path):
+        '''
+        Deletes the configuration files (and temporary files left by interrupted jobs) of config_dir_path not used for max_age_seconds,
+        except those used by a job of this process. Returns the number of deleted files.
+        '''
+        oldest = time.time() - self.max_age_seconds
+        n_removed = 0
+        with self.__lock:
+            self.__last_collection = time.time()
+            in_use = set(f'configuration_{config_key}.ini' for config_key in self.__users)
+            try:
+                entries = list(os.scandir(config_dir_path))
+            except FileNotFoundError:
+                return 0
+            for entry in entries:
+                if CONFIG_FILE.match(entry.name) is None or entry.name in in_use:
+                    continue
+                try:
+                    if entry.stat().st_mtime < oldest:
+                        os.remove(entry.path)
+                        n_removed += 1
+                except FileNotFoundError:
+                    pass
+        return n_removed
@@ -0,0 +1,100 @@
+import collections
+import gzip
+import os
+import threading
+import time
+
+
+class IDLOutputLog:
+    '''
+    Receives the output of an IDL calibration line by line.
+    Every line is written to the gzip file path (created on the first line, if path is set) while only the first head_lines and the last tail_lines are kept in memory.
+    The first skip_lines lines (IDL license information) are dropped.
+    remove_old() deletes the log files of a log folder once they are older than a maximum age.
+    '''
+
+    __last_removal = {}
+    __removal_lock = threading.Lock()
+
+    def __init__(self, path=None, head_lines=50, tail_lines=200, skip_lines=0):
+        self.path = path
+        self.n_lines = 0
+        self.n_bytes = 0
+        self.__head_lines = head_lines
+        self.__skip_lines = skip_lines
+        self.__head = []
+        self.__tail = collections.deque(maxlen=tail_lines)
+        self.__file = None
+
+    def write(self, line):
+        '''
+        Adds line (a string ending with a newline, except maybe the last one) to the output.
+        '''
+        if self.__skip_lines > 0:
+            self.__skip_lines -= 1
+            return
+        self.n_lines += 1
+        self.n_bytes += len(line)
+        if len(self.__head) < self.__head_lines:
+            self.__head.append(line)
+        else:
+            self.__tail.append(line)
+        if self.path is not None:
+            if self.__file is None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self.__file = gzip.open(self.path, 'wt', encoding='utf-8')
+            self.__file.write(line)
+
+    def pump(self, stream):
+        '''
+        Writes every line read from the binary stream stream until it ends, e.g. from a thread reading a pipe of the IDL process.
+        '''
+        for line in iter(stream.readline, b''):
+            self.write(line.decode('utf-8', errors='replace'))
+
+    def summary(self):
+        '''
+        Returns the head and tail of the output, with a note on the omitted lines and on where the full output is.
+        '''
+        n_omitted = self.n_lines - len(self.__head) - len(self.__tail)
+        summary = ''.join(self.__head)
+        if n_omitted > 0:
+            summary += f'[... {n_omitted} line(s) omitted ...]\n'
+        summary += ''.join(self.__tail)
+        if self.__file is not None:
+            summary += f'[Full output ({self.n_lines} line(s)) in {self.path}]\n'
+        return summary
+
+    def close(self):
+        if self.__file is not None:
+            self.__file.close()
+
+    @staticmethod
+    def remove_old(log_dir, max_age_seconds, min_interval=3600):
+        '''
+        Deletes the log files ({log_dir}/{camera_code}/*.gz) not modified for max_age_seconds, at most once every min_interval seconds per log_dir.
+        Camera folders are kept, a job may be about to write in them. Returns the number of deleted files.
+        '''
+        with IDLOutputLog.__removal_lock:
+            if time.time() - IDLOutputLog.__last_removal.get(log_dir, 0) < min_interval:
+                return 0
+            IDLOutputLog.__last_removal[log_dir] = time.time()
+        oldest = time.time() - max_age_seconds
+        n_removed = 0
+        try:
+            camera_dirs = [entry.path for entry in os.scandir(log_dir) if entry.is_dir()]
+        except FileNotFoundError:
+            return 0
+        for camera_dir in camera_dirs:
+            try:
+                entries = list(os.scandir(camera_dir))
+            except FileNotFoundError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.name.endswith('.gz') and entry.stat().st_mtime < oldest:
+                        os.remove(entry.path)
+                        n_removed += 1
+                except FileNotFoundError:
+                    pass
+        return n_removed
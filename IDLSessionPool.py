@@ -0,0 +1,164 @@
+import os
+import queue
+import signal
+import subprocess
+import threading
+import time
+import uuid
+
+
+class IDLSession:
+    '''
+    A long-running IDL process that executes commands written to its stdin.
+    Every command is followed by a sentinel printed on both stdout and stderr, so the output of each command can be told apart.
+    '''
+
+    def __init__(self, cmd=('bash', '-c', 'idl')):
+        self.__cmd = list(cmd)
+        self.__process = None
+        self.__output = None
+
+    @staticmethod
+    def __read_lines(stream, name, output):
+        '''
+        Copies lines from stream to the queue output as (name, line), (name, None) marks the end of the stream.
+        '''
+        for line in iter(stream.readline, b''):
+            output.put((name, line.decode('utf-8', errors='replace')))
+        output.put((name, None))
+
+    def is_alive(self):
+        return self.__process is not None and self.__process.poll() is None
+
+    def start(self, timeout=None):
+        '''
+        Starts the IDL process and discards its startup output (license information).
+        Returns False if IDL didn't come up within timeout seconds.
+        '''
+        # IDL gets its own process group, so it can be killed together with every process it started
+        self.__process = subprocess.Popen(self.__cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True)
+        # Both streams share one queue, so neither can fill up while the other one is being read
+        self.__output = queue.Queue()
+        for stream, name in ((self.__process.stdout, 'stdout'), (self.__process.stderr, 'stderr')):
+            threading.Thread(target=IDLSession.__read_lines, args=(stream, name, self.__output), daemon=True).start()
+        returncode, _, _ = self.run('', timeout)
+        return returncode == 0
+
+    def stop(self):
+        '''
+        Asks IDL to exit and kills it if it doesn't.
+        '''
+        if self.__process is None:
+            return
+        try:
+            if self.__process.poll() is None:
+                self.__process.stdin.write(b'exit\n')
+                self.__process.stdin.flush()
+                self.__process.wait(5)
+        except (OSError, subprocess.TimeoutExpired):
+            self.__kill()
+            self.__process.wait()
+        self.__process = None
+
+    def __kill(self):
+        '''
+        Kills the process group of IDL.
+        '''
+        try:
+            os.killpg(self.__process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+    def run(self, command, timeout=None, on_stdout=None, on_stderr=None):
+        '''
+        Executes command in the session and returns (returncode, stdout, stderr) for that command only.
+        If on_stdout or on_stderr are given every line of that stream is passed to them as soon as it is read, instead of being returned.
+        returncode is the IDL error code of the command, the process return code (-1 if there is none) if the session died,
+        or None if it didn't answer within timeout seconds and was killed.
+        '''
+        sentinel = f'PROCESS_CALIBRATION_DONE_{uuid.uuid4().hex}'
+        try:
+            self.__process.stdin.write(f'message, /reset\n{command}\nretall\nprint, \'{sentinel}\', !error_state.code\nprintf, -2, \'{sentinel}\'\n'.encode('utf-8'))
+            self.__process.stdin.flush()
+        except OSError:
+            pass
+
+        std_out = []
+        std_err = []
+        handlers = {'stdout': std_out.append if on_stdout is None else on_stdout, 'stderr': std_err.append if on_stderr is None else on_stderr}
+        error_code, timed_out = self.__read_until(sentinel, None if timeout is None else time.monotonic() + timeout, handlers)
+        if error_code is None:
+            # The session died or is wedged, it can't be trusted with another command
+            if not timed_out:
+                # Its output may end before the process is gone
+                try:
+                    self.__process.wait(5)
+                except subprocess.TimeoutExpired:
+                    pass
+            if self.__process.poll() is None:
+                self.__kill()
+            returncode = self.__process.wait()
+            self.__process = None
+            if timed_out:
+                return None, ''.join(std_out), ''.join(std_err)
+            return (returncode if returncode != 0 else -1), ''.join(std_out), ''.join(std_err)
+        return error_code, ''.join(std_out), ''.join(std_err)
+
+    def __read_until(self, sentinel, deadline, handlers):
+        '''
+        Passes the lines read before sentinel on stdout and stderr to handlers['stdout'] and handlers['stderr'].
+        Returns (error_code, timed_out): the error code printed with the sentinel on stdout, or None if a stream ended or (timed_out True) the deadline passed before both sentinels were read.
+        '''
+        error_code = None
+        waiting = {'stdout', 'stderr'}
+        while waiting:
+            try:
+                name, line = self.__output.get(timeout=None if deadline is None else max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                return None, True
+            if line is None:
+                return None, False
+            if name in waiting and line.strip().startswith(sentinel):
+                waiting.discard(name)
+                if name == 'stdout':
+                    code = line.strip()[len(sentinel):].strip()
+                    error_code = int(code) if code.lstrip('-').isdigit() else 0
+                continue
+            handlers[name](line)
+        return error_code, False
+
+
+class IDLSessionPool:
+    '''
+    Keeps up to size IDL sessions alive and hands each calibration command to a free one.
+    Sessions that die or don't answer in time are replaced by a new one on the next command.
+    '''
+
+    def __init__(self, size, cmd=('bash', '-c', 'idl')):
+        self.__cmd = cmd
+        self.__sessions = queue.Queue()
+        for _ in range(max(1, int(size))):
+            self.__sessions.put(IDLSession(self.__cmd))
+
+    def run(self, command, timeout=None, on_stdout=None, on_stderr=None):
+        '''
+        Executes command on a free session, starting or restarting it if needed, and returns (returncode, stdout, stderr), see IDLSession.run().
+        '''
+        session = self.__sessions.get()
+        try:
+            if not session.is_alive() and not session.start(timeout):
+                return -1, '', 'Unable to start IDL session.\n'
+            return session.run(command, timeout, on_stdout, on_stderr)
+        finally:
+            self.__sessions.put(session)
+
+    def close(self):
+        '''
+        Stops every session.
+        '''
+        while True:
+            try:
+                session = self.__sessions.get_nowait()
+            except queue.Empty:
+                return
+            session.stop()
@@ -1,30 +1,227 @@
 import time
+import argparse
 import mysql
+import mysql.connector.pooling
 import os
+import signal
 import subprocess
 import calendar
 import json
+import threading
+import sqlite3
 from datetime import datetime, timedelta
-from mysql.connector import connect, errorcode
+from mysql.connector import errorcode
 from PRISMA_SDK.simpleClass import UserConfiguration, CorePerson, CalibrationExecutionHistory, Camera, SystemConfiguration
-from PRISMA_SDK import UserConfigurationFactory, CorePersonFactory, CalibrationExecutionHistoryFactory, CameraFactory, IDLConfigFileHandler, SystemConfigurationFactory
+from PRISMA_SDK import CorePersonFactory, CalibrationExecutionHistoryFactory, IDLConfigFileHandler
 from PRISMA_SDK.LogProgramFileFactory import LogProgramFileFactory as lpff
 from PRISMA_SDK.simpleClass.LogProgramFile import LogProgramFile as lpf
+from CalibrationWorkerPool import CalibrationWorkerPool
+from IDLSessionPool import IDLSessionPool
+from BufferedLogWriter import BufferedLogWriter
+from CalibrationRunContext import CalibrationRunContext
+from CaptureIndex import CaptureIndex, DEFAULT_PATH as DEFAULT_CAPTURE_INDEX_PATH
+from CaptureStaging import CaptureStaging
+from CaptureCache import CaptureCache
+from CaptureWatcher import CaptureWatcher
+from CalibrationRetryQueue import CalibrationRetryQueue, DEFAULT_PATH as DEFAULT_RETRY_QUEUE_PATH
+from CalibrationMetrics import CalibrationMetrics
+from CalibrationFingerprint import CalibrationFingerprint
+from CalibrationBackfill import CalibrationBackfill, DEFAULT_PATH as DEFAULT_BACKFILL_PROGRESS_PATH
+from IDLOutputLog import IDLOutputLog
+from IDLConfigFileCache import IDLConfigFileCache
+from CalibrationLeases import CalibrationLeases
+from DatabaseConnectionPool import DatabaseConnectionPool
 
-# load default configuration from json file
-with open('../procedures_config.json') as pc:
-    default_config = json.load(pc)
+# procedures_config.json is read by load_config(), on first use instead of at import
+CONFIG_PATH_ENV = 'PRISMA_PROCEDURES_CONFIG'
+DEFAULT_CONFIG_PATHS = ('../procedures_config.json', os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'procedures_config.json'))
+CONFIG_NAMES = ('default_config', 'default_user', 'config', 'LOG_MESSAGE_PREFIX', 'db_connection_attempts', 'max_parallel_jobs', 'use_idl_sessions', 'idl_session_timeout', 'log_flush_interval', 'log_flush_size', 'idl_timeout_daily', 'idl_timeout_monthly', 'idl_log_dir', 'idl_output_head_lines', 'idl_output_tail_lines', 'idl_log_max_age_days', 'idl_rlimit_cpu_seconds', 'idl_rlimit_memory_mb', 'idl_nice', 'idl_ionice_class', 'history_progress_writes', 'capture_index', 'capture_staging_mode', 'capture_cache_dir', 'capture_cache_quota_mb', 'capture_cache_threads', 'capture_cache', 'retry_queue', 'metrics_jsonl_path', 'metrics_prometheus_path', 'skip_up_to_date', 'fingerprint_ignored_parameters', 'backfill_progress', 'daemon_quiet_minutes', 'daemon_dawn_hour', 'daemon_lookback_days', 'daemon_poll_seconds', 'daemon_use_inotify', 'daemon_metrics_minutes', 'config_files', 'distributed', 'lease_db_path', 'lease_seconds', 'lease_heartbeat_seconds', 'db_pool_size', 'db_ping_interval', 'db_pool', 'leases')
+config_path = None
 
-default_user = default_config['process_calibration']['default_user']
 
-config = default_config['process_calibration']['db_config']
+def load_config(path=None):
+    '''
+    Reads the configuration file and sets up the settings, queues and caches of the module, does nothing if it was already read.  
+    The file is path, or the file named by environment variable `PRISMA_PROCEDURES_CONFIG`, or `../procedures_config.json` relative to the working directory, or `procedures_config.json` in the parent folder of this file.  
+    '''
+    global default_config, default_user, config, LOG_MESSAGE_PREFIX, db_connection_attempts, max_parallel_jobs, use_idl_sessions, idl_session_timeout, \
+        log_flush_interval, log_flush_size, idl_timeout_daily, idl_timeout_monthly, idl_log_dir, idl_output_head_lines, idl_output_tail_lines, idl_log_max_age_days, idl_rlimit_cpu_seconds, \
+        idl_rlimit_memory_mb, idl_nice, idl_ionice_class, history_progress_writes, capture_index, capture_staging_mode, capture_cache_dir, capture_cache_quota_mb, \
+        capture_cache_threads, capture_cache, retry_queue, metrics_jsonl_path, metrics_prometheus_path, skip_up_to_date, fingerprint_ignored_parameters, \
+        backfill_progress, daemon_quiet_minutes, daemon_dawn_hour, daemon_lookback_days, daemon_poll_seconds, daemon_use_inotify, daemon_metrics_minutes, config_files, distributed, \
+        lease_db_path, lease_seconds, lease_heartbeat_seconds, db_pool_size, db_ping_interval, db_pool, leases
+    global config_path
+    if config_path is not None:
+        return
+    path = path or os.environ.get(CONFIG_PATH_ENV) or next((candidate for candidate in DEFAULT_CONFIG_PATHS if os.path.exists(candidate)), DEFAULT_CONFIG_PATHS[0])
+    with open(path) as pc:
+        default_config = json.load(pc)
 
-LOG_MESSAGE_PREFIX = default_config['process_calibration']['LOG_MESSAGE_PREFIX']
+    default_user = default_config['process_calibration']['default_user']
 
-db_connection_attempts = default_config['process_calibration']['db_connection_attempts']
+    config = default_config['process_calibration']['db_config']
+
+    LOG_MESSAGE_PREFIX = default_config['process_calibration']['LOG_MESSAGE_PREFIX']
+
+    db_connection_attempts = default_config['process_calibration']['db_connection_attempts']
+
+    # maximum number of IDL calibrations running at the same time, 1 keeps the serial behaviour
+    max_parallel_jobs = default_config['process_calibration'].get('max_parallel_jobs', 1)
+
+    # keep one long-running IDL session per worker instead of starting IDL for every calibration
+    use_idl_sessions = default_config['process_calibration'].get('use_idl_sessions', False)
+
+    # seconds after which an IDL session that doesn't answer is considered wedged and restarted, None waits forever
+    idl_session_timeout = default_config['process_calibration'].get('idl_session_timeout', None)
+
+    # bulkProcess queues pr_log_program_file entries and writes them every log_flush_interval seconds or once log_flush_size are queued
+    log_flush_interval = default_config['process_calibration'].get('log_flush_interval', 5)
+    log_flush_size = default_config['process_calibration'].get('log_flush_size', 100)
+
+    # wall-clock seconds after which a daily or monthly IDL calibration is killed together with every process it started, None waits forever (or idl_session_timeout in IDL sessions)
+    idl_timeout_daily = default_config['process_calibration'].get('idl_timeout_daily', None)
+    idl_timeout_monthly = default_config['process_calibration'].get('idl_timeout_monthly', None)
+    # IDL output is written to {idl_log_dir}/{camera_code}/{date}_{history id}.{stdout|stderr}.gz (None keeps no log files),
+    # only its first idl_output_head_lines and last idl_output_tail_lines lines are kept in the CalibrationExecutionHistory entry
+    idl_log_dir = default_config['process_calibration'].get('idl_log_dir', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'idl_logs'))
+    idl_output_head_lines = default_config['process_calibration'].get('idl_output_head_lines', 50)
+    idl_output_tail_lines = default_config['process_calibration'].get('idl_output_tail_lines', 200)
+    # IDL log files older than idl_log_max_age_days are deleted (checked at most once an hour), None keeps them forever
+    idl_log_max_age_days = default_config['process_calibration'].get('idl_log_max_age_days', 90)
+
+    # resource limits (ulimit) and scheduling priority (nice, ionice class) of the IDL processes, None leaves them unchanged
+    idl_rlimit_cpu_seconds = default_config['process_calibration'].get('idl_rlimit_cpu_seconds', None)
+    idl_rlimit_memory_mb = default_config['process_calibration'].get('idl_rlimit_memory_mb', None)
+    idl_nice = default_config['process_calibration'].get('idl_nice', None)
+    idl_ionice_class = default_config['process_calibration'].get('idl_ionice_class', None)
+
+    # write the CalibrationExecutionHistory entry after every stage of start() instead of only once the job has finished
+    history_progress_writes = default_config['process_calibration'].get('history_progress_writes', False)
+
+    # index of the captures under root_path, see CaptureIndex.py
+    capture_index = CaptureIndex(default_config['process_calibration'].get('capture_index_path', DEFAULT_CAPTURE_INDEX_PATH))
+
+    # 'symlink' links every capture in cp_dir_captures, 'manifest' writes one file listing them and passes it to IDL as config parameter capture_manifest
+    capture_staging_mode = default_config['process_calibration'].get('capture_staging_mode', 'symlink')
+
+    # decompress the '.fit.gz' captures into this shared folder and stage the decompressed copies, None stages the '.fit.gz' captures
+    capture_cache_dir = default_config['process_calibration'].get('capture_cache_dir', None)
+    # size of the capture cache, the copies used least recently are evicted beyond it (None: unlimited), and number of decompression threads per job
+    capture_cache_quota_mb = default_config['process_calibration'].get('capture_cache_quota_mb', None)
+    capture_cache_threads = default_config['process_calibration'].get('capture_cache_threads', 4)
+    capture_cache = None if capture_cache_dir is None else CaptureCache(capture_cache_dir, None if capture_cache_quota_mb is None else int(capture_cache_quota_mb * 1024 * 1024), capture_cache_threads)
+
+    # failed calibrations waiting to be attempted again, the n-th retry waits retry_backoff_seconds * 2 ** (n - 1) seconds after the last failure
+    retry_queue = CalibrationRetryQueue(default_config['process_calibration'].get('retry_queue_path', DEFAULT_RETRY_QUEUE_PATH), default_config['process_calibration'].get('retry_backoff_seconds', 3600))
+
+    # files where bulkProcess exports the stage durations, counters and outcomes of its jobs, None disables the export
+    metrics_jsonl_path = default_config['process_calibration'].get('metrics_jsonl_path', None)
+    metrics_prometheus_path = default_config['process_calibration'].get('metrics_prometheus_path', None)
+
+    # skip jobs whose astro solution was produced from the same captures, user configuration and system configuration (fingerprint sidecar)
+    skip_up_to_date = default_config['process_calibration'].get('skip_up_to_date', True)
+    # system configuration parameters that don't change the result of a calibration and are left out of the fingerprint
+    fingerprint_ignored_parameters = default_config['process_calibration'].get('fingerprint_ignored_parameters', ['calibration_max_failed_retry_attempts'])
+
+    # progress of the backfills, an interrupted backfill resumes from here
+    backfill_progress = CalibrationBackfill(default_config['process_calibration'].get('backfill_progress_path', DEFAULT_BACKFILL_PROGRESS_PATH))
+
+    # daemon mode: a night is complete once no capture arrived for daemon_quiet_minutes after daemon_dawn_hour (local time) of the next day,
+    # nights older than daemon_lookback_days are ignored, captures folders are watched with inotify (if inotify_simple is installed) or polled every daemon_poll_seconds
+    daemon_quiet_minutes = default_config['process_calibration'].get('daemon_quiet_minutes', 30)
+    daemon_dawn_hour = default_config['process_calibration'].get('daemon_dawn_hour', 6)
+    daemon_lookback_days = default_config['process_calibration'].get('daemon_lookback_days', 2)
+    daemon_poll_seconds = default_config['process_calibration'].get('daemon_poll_seconds', 60)
+    daemon_use_inotify = default_config['process_calibration'].get('daemon_use_inotify', True)
+    # the daemon exports the metrics of the jobs that finished every daemon_metrics_minutes, and drops them
+    daemon_metrics_minutes = default_config['process_calibration'].get('daemon_metrics_minutes', 60)
+
+    # configuration files are named by the hash of their content and shared by the jobs with the same parameters,
+    # files no job used for config_file_max_age_hours (longer than any calibration) are deleted
+    config_files = IDLConfigFileCache(IDLConfigFileHandler.IDLConfigFileHandler(), default_config['process_calibration'].get('config_file_max_age_hours', 24) * 3600)
+
+    # several hosts share the jobs of bulkProcess through the calibration_leases table of the database (or of the SQLite file lease_db_path, to try it on one host),
+    # a host renews its leases every lease_heartbeat_seconds, the jobs of a host that didn't for lease_seconds are taken over by the others
+    distributed = default_config['process_calibration'].get('distributed', False)
+    lease_db_path = default_config['process_calibration'].get('lease_db_path', None)
+    lease_seconds = default_config['process_calibration'].get('lease_seconds', 300)
+    lease_heartbeat_seconds = default_config['process_calibration'].get('lease_heartbeat_seconds', 60)
+    leases = CalibrationLeases(connect_lease_db, mysql.connector if lease_db_path is None else sqlite3, None, lease_seconds, lease_heartbeat_seconds) if distributed else None
+
+    # every connection comes from a pool of db_pool_size connections (default: one per worker, plus the main thread, the log writer and the lease connections), grown by runs with more workers,
+    # a connection not used for db_ping_interval seconds is pinged, and reconnected if needed, before its next query
+    db_pool_size = default_config['process_calibration'].get('db_pool_size', None)
+    db_ping_interval = default_config['process_calibration'].get('db_ping_interval', 30)
+    db_pool = DatabaseConnectionPool(mysql.connector, config, db_pool_size or max_parallel_jobs + 4, db_ping_interval, db_connection_attempts)
+    config_path = path
+
+
+def __getattr__(name):
+    '''
+    Reads the configuration file the first time one of its settings is read from outside the module.  
+    '''
+    if name in CONFIG_NAMES:
+        load_config()
+        return globals()[name]
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+
+
+def connect_db():
+    '''
+    Returns a connection of the pool of database connections, retrying up to db_connection_attempts times, closing it returns it to the pool.  
+    Returns None if the database could not be reached.  
+    '''
+    load_config()
+    a = 0
+    while True:
+        try:
+            return db_pool.connection()
+        except mysql.connector.Error as err:
+            if err.errno == errorcode.ER_ACCESS_DENIED_ERROR:
+                print('Something is wrong with your username or password')
+            elif err.errno == errorcode.ER_BAD_DB_ERROR:
+                print('Database does not exist')
+            else:
+                print(err)
+            a += 1
+            if a == db_connection_attempts:
+                return None
+            time.sleep(1)
+
+
+def idl_shell_command(arguments='', cpu_limit=True):
+    '''
+    Returns the bash command that starts IDL with arguments, under the resource limits and scheduling priority set in the configuration file.  
+    The CPU time limit counts the whole life of the process, so cpu_limit is False for the long-lived IDL sessions, where idl_session_timeout bounds each command instead.  
+    '''
+    load_config()
+    limits = ''
+    if cpu_limit and idl_rlimit_cpu_seconds:
+        limits += f'ulimit -t {int(idl_rlimit_cpu_seconds)}; '
+    if idl_rlimit_memory_mb:
+        limits += f'ulimit -v {int(idl_rlimit_memory_mb) * 1024}; '
+    launcher = ''
+    if idl_nice is not None:
+        launcher += f'nice -n {int(idl_nice)} '
+    if idl_ionice_class is not None:
+        launcher += f'ionice -c {int(idl_ionice_class)} '
+    return f'{limits}exec {launcher}idl{arguments}'
+
+
+def connect_lease_db():
+    '''
+    Opens a new connection to the database holding the calibration_leases table.  
+    '''
+    if lease_db_path is not None:
+        return sqlite3.connect(lease_db_path, timeout=30, check_same_thread=False)
+    db = connect_db()
+    if db is None:
+        raise RuntimeError('Unable to open a database connection for the calibration leases.')
+    return db
 
 
 class ProcessCalibration:
+
     @staticmethod
     def __format_d(d, is_m):
         '''
@@ -36,33 +233,130 @@ class ProcessCalibration:
         return f'{"" if is_m else f"{d[6:8]}-"}{d[4:6]}-{d[:4]}'
 
     @staticmethod
-    def start(cameraId, userId, date, is_monthly, db, loggingUserId=False):
+    def __target(date, is_monthly=None):
+        '''
+        Returns the night (datetime) processed by a run on date, the night before, and whether its monthly processing is done too:  
+        if it is the last night of its month, unless is_monthly (0 or 1) is given.  
+        '''
+        night = date - timedelta(days=1)
+        if is_monthly is None:
+            is_monthly = int(night.day == calendar.monthrange(night.year, night.month)[1])
+        return night, is_monthly
+
+    @staticmethod
+    def __fingerprint(camera_code, date, is_monthly, captures, usr_config, sys_config):
+        '''
+        Returns the fingerprint of the inputs of a calibration, without the system parameters in `fingerprint_ignored_parameters`.  
+        '''
+        return CalibrationFingerprint.compute(camera_code, date, is_monthly, captures, usr_config, {parameter.parameter_name: parameter.parameter_value for parameter in sys_config if parameter.parameter_name not in fingerprint_ignored_parameters})
+
+    @staticmethod
+    def __export_metrics(metrics, launcherId, log_writer):
+        '''
+        Logs the summary of metrics and the usage of the database connection pool, and writes the metrics to the metrics files set in the configuration file.  
+        '''
+        for line in metrics.summary_lines():
+            log_writer.log('INFO', 5, f'{LOG_MESSAGE_PREFIX}{line}', launcherId)
+        pool_stats = db_pool.stats()
+        if pool_stats is not None:
+            log_writer.log('INFO', 5, f'{LOG_MESSAGE_PREFIX}Database connections: pool of {pool_stats["pool_size"]}, up to {pool_stats["max_in_use"]} in use, {pool_stats["acquired"]} handed out, {pool_stats["waits"]} wait(s) for a free connection, {pool_stats["pings"]} ping(s), {pool_stats["reconnects"]} reconnect(s) since the process started.', launcherId)
+        if metrics_jsonl_path:
+            metrics.write_jsonl(metrics_jsonl_path)
+        if metrics_prometheus_path:
+            metrics.write_prometheus(metrics_prometheus_path)
+
+    @staticmethod
+    def __last_insert_id(db):
+        '''
+        Returns the id generated by the last INSERT executed on connection db.  
+        '''
+        cursor = db.cursor()
+        try:
+            cursor.execute('SELECT LAST_INSERT_ID()')
+            return cursor.fetchone()[0]
+        finally:
+            cursor.close()
+
+    @staticmethod
+    def start(cameraId, userId, date, is_monthly, db, loggingUserId=False, idl_sessions=None, log_writer=None, context=None, metrics=None, force=False):
         '''
         Runs procedure calibration.pro for camera cameraId on date date.  
         If is_monthly is set to 1 both daily and monthly processing will be done.  
+        If idl_sessions (an IDLSessionPool) is given the procedure runs in one of its IDL sessions instead of a new IDL process.  
+        If log_writer (a BufferedLogWriter) is given log entries are queued on it instead of being written right away.  
+        If context (a CalibrationRunContext) is given system configuration, camera and user configuration are read from it instead of the db.  
+        If metrics (a CalibrationMetrics) is given the duration of every stage, some counters and the outcome of the job are recorded on it.  
+        The job is skipped if its astro solution was produced from the same captures and configuration, unless force is set.  
+        '''
+        load_config()
+        return ProcessCalibration.__start_job(cameraId, userId, date, is_monthly, db, loggingUserId, idl_sessions, log_writer, context, metrics, force).outcome == 'success'
+
+    @staticmethod
+    def __start_job(cameraId, userId, date, is_monthly, db, loggingUserId=False, idl_sessions=None, log_writer=None, context=None, metrics=None, force=False):
+        '''
+        Runs start() and returns the JobMetrics of the job, whose outcome is success, failure, timeout (IDL was killed) or error (an exception was raised, or db is None).  
+        '''
+        job_metrics = (CalibrationMetrics() if metrics is None else metrics).job(cameraId, date, is_monthly)
+        if db is None:
+            # The worker couldn't get a database connection, the job fails without history entry and is queued for retry like any failure
+            if log_writer is not None:
+                log_writer.log('ERROR', 1, f'{LOG_MESSAGE_PREFIX}Error: Unable to open a database connection for camera {cameraId} on date {date}.', loggingUserId)
+            job_metrics.finish('error')
+            return job_metrics
+        outcome = 'error'
+        try:
+            success = ProcessCalibration.__start(cameraId, userId, date, is_monthly, db, loggingUserId, idl_sessions, log_writer, context, job_metrics, force)
+            outcome = 'success' if success else 'timeout' if job_metrics.counts.get('timeouts') else 'failure'
+        finally:
+            job_metrics.finish(outcome)
+        return job_metrics
+
+    @staticmethod
+    def __start(cameraId, userId, date, is_monthly, db, loggingUserId, idl_sessions, log_writer, context, job_metrics, force):
+        '''
+        Body of start, recording the duration of each stage on job_metrics.  
         '''
 
         # if loggingUserId was not changed do logging for user userId
         if loggingUserId is False:
             loggingUserId = userId
 
+        if context is None:
+            context = CalibrationRunContext()
+
+        def write_log(log_type, text, level, db):
+            '''
+            Creates log entry in entity pr_log_program_file of type log_type, or queues it on log_writer if there is one.  
+            '''
+            if log_writer is None:
+                lpff().insert(lpf().create(datetime.now().strftime("%Y-%m-%d %H:%M:%S"), log_type, level, LOG_MESSAGE_PREFIX + text, loggingUserId, loggingUserId, loggingUserId), db)
+            else:
+                log_writer.log(log_type, level, LOG_MESSAGE_PREFIX + text, loggingUserId)
+
+        def save_history(db, final=True):
+            '''
+            Writes history_entry to the db, intermediate (not final) writes only happen if history_progress_writes is set.  
+            '''
+            if final or history_progress_writes:
+                CalibrationExecutionHistoryFactory.CalibrationExecutionHistoryFactory().update(history_entry, db)
+
         def log_info_with_level(text, level, db):
             '''
             Creates log entry in entity pr_log_program_file of type INFO, text = text, verbosity level = level.  
             '''
-            lpff().insert(lpf().create(datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 'INFO', level, LOG_MESSAGE_PREFIX + text, loggingUserId, loggingUserId, loggingUserId), db)
+            write_log('INFO', text, level, db)
 
         def log_warning_with_level(text, level, db):
             '''
             Creates log entry in entity pr_log_program_file of type WARNING, text = text, verbosity level = level.  
             '''
-            lpff().insert(lpf().create(datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 'WARNING', level, LOG_MESSAGE_PREFIX + text, loggingUserId, loggingUserId, loggingUserId), db)
+            write_log('WARNING', text, level, db)
 
         def log_error_with_level(text, level, db):
             '''
             Creates log entry in entity pr_log_program_file of type ERROR, text = text, verbosity level = level.  
             '''
-            lpff().insert(lpf().create(datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 'ERROR', level, LOG_MESSAGE_PREFIX + text, loggingUserId, loggingUserId, loggingUserId), db)
+            write_log('ERROR', text, level, db)
 
         # Check if date is valid
         try:
@@ -78,252 +372,670 @@ class ProcessCalibration:
             return False
 
         # Create new CalibrationExecutionHistory entry
+        job_metrics.begin('history_insert')
         history_entry = CalibrationExecutionHistory.CalibrationExecutionHistory().create(cameraId, date, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), is_monthly, '', '', '', userId, userId, userId)
         if not CalibrationExecutionHistoryFactory.CalibrationExecutionHistoryFactory().insert(history_entry, db):
             # Error couldn't create CalibrationExecutionHistory entry on the db
             log_error_with_level('Error: Couldn\'t create CalibrationExecutionHistory entry on the db.', 1, db)
             return False
-        history_entry.id = CalibrationExecutionHistoryFactory.CalibrationExecutionHistoryFactory().getByCameraIdForUser(cameraId, userId, db)[-1].id
+        history_entry.id = ProcessCalibration.__last_insert_id(db)
         log_info_with_level(f'Successfully created CalibrationExecutionHistory entry with id {history_entry.id} on the db.', 5, db)
 
         # Fetch system configuration parameters
-        sys_config = SystemConfigurationFactory.SystemConfigurationFactory().getList(db)
-        for parameter in sys_config:
-            if parameter.parameter_name == 'root_path':
-                root_path = parameter.parameter_value
-            elif parameter.parameter_name == 'cp_dir_captures':
-                captures_dir_path = parameter.parameter_value
-            elif parameter.parameter_name == 'cp_dir_astrometry':
-                astrometry_dir_path = parameter.parameter_value
-            elif parameter.parameter_name == 'cp_tmp_user_config_path':
-                cp_config_dir_path = parameter.parameter_value
+        job_metrics.begin('config_fetch')
+        sys_config = context.sys_config(db)
+        root_path = context.sys_parameter('root_path', db)
+        captures_dir_path = context.sys_parameter('cp_dir_captures', db)
+        astrometry_dir_path = context.sys_parameter('cp_dir_astrometry', db)
+        cp_config_dir_path = context.sys_parameter('cp_tmp_user_config_path', db)
 
         # Find camera code for this calibration
-        camera_code = CameraFactory.CameraFactory().getById(cameraId, db).code
-
-        # Create symbolic links to '.fit' files in captures folder
-        if os.path.exists(f'{root_path}/{camera_code}'):
-            folder_base_name = os.listdir(f'{root_path}/{camera_code}')[0].split('_')[0]
-            if len(date) > 6:
-                process_dates = [date, (datetime.strptime(date, "%Y%m%d") + timedelta(days=1)).strftime("%Y%m%d")]
-                for pd in process_dates:
-                    if not os.path.exists(f'{captures_dir_path}/{camera_code}/{pd[:6]}'):
-                        os.makedirs(os.path.dirname(f'{captures_dir_path}/{camera_code}/{pd[:6]}/'))
-                    if os.path.exists(f'{root_path}/{camera_code}/{folder_base_name}_{pd}/captures'):
-                        fit_files = os.listdir(f'{root_path}/{camera_code}/{folder_base_name}_{pd}/captures')
-                        for fit in fit_files:
-                            if not os.path.exists(f'{captures_dir_path}/{camera_code}/{pd[:6]}/{fit}'):
-                                os.symlink(f'{root_path}/{camera_code}/{folder_base_name}_{pd}/captures/{fit}', f'{captures_dir_path}/{camera_code}/{pd[:6]}/{fit}')
-            else:
-                if not os.path.exists(f'{captures_dir_path}/{camera_code}/{date}'):
-                    os.makedirs(os.path.dirname(f'{captures_dir_path}/{camera_code}/{date}/'))
-                for date_dir in os.listdir(f'{root_path}/{camera_code}'):
-                    if os.path.exists(f'{root_path}/{camera_code}/{date_dir}/captures'):
-                        fit_files = os.listdir(f'{root_path}/{camera_code}/{date_dir}/captures')
-                        for fit in fit_files:
-                            if not os.path.exists(f'{captures_dir_path}/{camera_code}/{date}/{fit}'):
-                                os.symlink(f'{root_path}/{camera_code}/{date_dir}/captures/{fit}', f'{captures_dir_path}/{camera_code}/{date}/{fit}')
+        camera_code = context.camera(cameraId, db).code
+
+        # Find the captures of this night (or of the whole month for monthly processing) in the capture index
+        job_metrics.begin('capture_lookup')
+        capture_index.refresh(camera_code, root_path, date[:6] if is_monthly else date)
+        captures = capture_index.captures(camera_code, date[:6] if is_monthly else date)
+        job_metrics.count('captures', len(captures))
 
         # Find if data for this calibration exists on disk
-        exists_on_disk = False
-        if os.path.exists(f'{captures_dir_path}/{camera_code}/{date[:6]}'):
-            filenames_with_full_date_for_camera = os.listdir(f'{captures_dir_path}/{camera_code}/{date[:6]}')
-            if is_monthly:
-                if len(filenames_with_full_date_for_camera) > 1:
-                    exists_on_disk = True
-            else:
-                filenames_with_full_date_for_camera.pop(0)
-                for filename in filenames_with_full_date_for_camera:
-                    fit_date = filename.split("_")[1].split("T")[0]
-                    fit_time = filename.split("_")[1].split("T")[1]
-                    if (int(fit_time[:2]) > 12 and fit_date == date) or (int(fit_time[:2]) < 12 and (datetime.strptime(fit_date, "%Y%m%d") - timedelta(days=1)).strftime("%Y%m%d") == date):
-                        exists_on_disk = True
-                        break
+        exists_on_disk = len(captures) > 0
         if exists_on_disk is False:
             # Error calibration not found in filesystem
             history_entry.ceh_stderr = history_entry.ceh_stderr + (f'Error: Unable to find captures from camera {camera_code} on date {ProcessCalibration.__format_d(date, is_monthly)} in the filesystem.\n')
-            CalibrationExecutionHistoryFactory.CalibrationExecutionHistoryFactory().update(history_entry, db)
+            save_history(db)
             log_error_with_level(f'Error: Unable to find captures from camera {camera_code} on date {ProcessCalibration.__format_d(date, is_monthly)} in the filesystem.', 2, db)
             return False
         else:
             log_info_with_level(f'Found capture from camera {camera_code} on date {ProcessCalibration.__format_d(date, is_monthly)} in the filesystem at {captures_dir_path}/{camera_code}/{date[:6]}/.', 1, db)
 
         # Find config_parameters for this user
-        usr_config = UserConfigurationFactory.UserConfigurationFactory().getDictForUser(userId, db)
+        job_metrics.begin('config_fetch')
+        usr_config = context.user_config(userId, db)
         if len(usr_config) == 0:
             log_warning_with_level(f'Warning: No configuration found for user {userId}, proceeding with default configuration.', 1, db)
 
-        # Create file configuration_userId.ini and update CalibrationExecutionHistory entry with user config_parameters
-        config_json = IDLConfigFileHandler.IDLConfigFileHandler().create(userId, usr_config, sys_config)
-        if config_json is False:
+        # Skip the calibration if its astro solution was produced from the same captures and configuration
+        job_metrics.begin('fingerprint')
+        solution_path = f'{astrometry_dir_path}/{camera_code}/{date[:6]}/{camera_code}_{date}_astro_solution.txt'
+        fingerprint = ProcessCalibration.__fingerprint(camera_code, date, is_monthly, captures, usr_config, sys_config)
+        if skip_up_to_date and not force and CalibrationFingerprint.is_up_to_date(solution_path, fingerprint):
+            history_entry.ceh_stdout = history_entry.ceh_stdout + f'Skipped: captures and configuration unchanged since the last calibration (fingerprint {fingerprint}).\n'
+            save_history(db)
+            log_info_with_level(f'Camera {camera_code} on date {ProcessCalibration.__format_d(date, is_monthly)} is up to date, calibration skipped.', 1, db)
+            job_metrics.count('skipped')
+            return True
+        # The solution is about to be produced again, until IDL succeeds it doesn't match any fingerprint
+        CalibrationFingerprint.remove(solution_path)
+
+        # Decompress the '.fit.gz' captures into the capture cache, or reuse the copies decompressed by previous jobs
+        staged_captures = captures
+        if capture_cache is not None:
+            job_metrics.begin('decompression')
+            staged_captures, n_decompressed = capture_cache.stage(captures)
+            job_metrics.count('files_decompressed', n_decompressed)
+
+        # Create symbolic links to '.fit' files in captures folder, or a manifest listing them
+        job_metrics.begin('staging')
+        manifest_path = None
+        if capture_staging_mode == 'manifest':
+            manifest_path = f'{captures_dir_path}/{camera_code}/{date}.manifest'
+            if CaptureStaging.write_manifest(staged_captures, manifest_path):
+                job_metrics.count('files_staged', len(staged_captures))
+        else:
+            job_metrics.count('files_staged', CaptureStaging.link_captures(staged_captures, f'{captures_dir_path}/{camera_code}/{date[:6]}'))
+
+        # The manifest is specific to this job, so is the configuration file that points to it
+        if manifest_path is not None:
+            usr_config['capture_manifest'] = manifest_path
+
+        # Create file configuration_{hash}.ini (or reuse it if a job with the same parameters did) and update CalibrationExecutionHistory entry with user config_parameters
+        job_metrics.begin('config_file')
+        config_file = config_files.acquire(usr_config, sys_config, cp_config_dir_path)
+        if config_file is False:
             # Error couldn't create config file
             history_entry.ceh_stderr = history_entry.ceh_stderr + ('Error: Unable to create configuration.ini file for this user.\n')
-            CalibrationExecutionHistoryFactory.CalibrationExecutionHistoryFactory().update(history_entry, db)
-            log_error_with_level(f'Error: Unable to create configuration_{userId}.ini file for this user.', 1, db)
+            save_history(db)
+            log_error_with_level('Error: Unable to create configuration file for this user.', 1, db)
             return False
         else:
-            # Successfully created file
+            # Successfully created or reused file
+            config_key, config_json = config_file
             history_entry.config_parameters = config_json
-            CalibrationExecutionHistoryFactory.CalibrationExecutionHistoryFactory().update(history_entry, db)
-            log_info_with_level(f'Successfully created configuration_{userId}.ini for this user.', 1, db)
+            save_history(db, final=False)
+            log_info_with_level(f'Using configuration_{config_key}.ini for this user.', 1, db)
 
         # IDL execution and update CalibrationExecutionHistory entry with new information (stdout, stderr)
+        job_metrics.begin('idl')
         if is_monthly:
-            log_info_with_level(f'Starting monthly{" and daily" if len(date) > 6 else ""} IDL procedure for camera {camera_code} with configuration_{userId}.ini.', 1, db)
+            log_info_with_level(f'Starting monthly{" and daily" if len(date) > 6 else ""} IDL procedure for camera {camera_code} with configuration_{config_key}.ini.', 1, db)
+        else:
+            log_info_with_level(f'Starting daily IDL procedure for camera {camera_code} with configuration_{config_key}.ini.', 1, db)
+        idl_command = f'calibration, \'{camera_code}\', \'{date}\', process_image=1, process_day={1 if len(date) > 6 else 0}, process_month={is_monthly}, config_file=\'{cp_config_dir_path}/configuration_{config_key}.ini\''
+        idl_timeout = idl_timeout_monthly if is_monthly else idl_timeout_daily
+        # The output is streamed to compressed log files, only its head and tail are kept in memory
+        idl_log_path = None if idl_log_dir is None else f'{idl_log_dir}/{camera_code}/{date}_{history_entry.id}'
+        if idl_log_dir is not None and idl_log_max_age_days is not None:
+            IDLOutputLog.remove_old(idl_log_dir, idl_log_max_age_days * 86400)
+        stdout_log = IDLOutputLog(None if idl_log_path is None else f'{idl_log_path}.stdout.gz', idl_output_head_lines, idl_output_tail_lines)
+        if idl_sessions is None:
+            # Remove first 8 lines of stderr as they include IDL license information
+            stderr_log = IDLOutputLog(None if idl_log_path is None else f'{idl_log_path}.stderr.gz', idl_output_head_lines, idl_output_tail_lines, skip_lines=8)
+            cmd = ['bash', '-c', idl_shell_command(f' -e "{idl_command}"')]
+            # IDL gets its own process group, so a timeout kills it together with every process it started
+            pipes = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True)
+            readers = [threading.Thread(target=output_log.pump, args=(stream,), daemon=True) for output_log, stream in ((stdout_log, pipes.stdout), (stderr_log, pipes.stderr))]
+            for reader in readers:
+                reader.start()
+            try:
+                returncode = pipes.wait(timeout=idl_timeout)
+            except subprocess.TimeoutExpired:
+                try:
+                    os.killpg(pipes.pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    # IDL and every process it started ended since the timeout expired
+                    pass
+                pipes.wait()
+                returncode = None
+            for reader in readers:
+                reader.join()
+            pipes.stdout.close()
+            pipes.stderr.close()
+            session_stdout, session_stderr = '', ''
         else:
-            log_info_with_level(f'Starting daily IDL procedure for camera {camera_code} with configuration_{userId}.ini.', 1, db)
-        cmd = ['bash', '-c', f'idl -e "calibration, \'{camera_code}\', \'{date}\', process_image=1, process_day={1 if len(date) > 6 else 0}, process_month={is_monthly}, config_file=\'{cp_config_dir_path}/configuration_{userId}.ini\'"']
-        pipes = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        std_out, std_err = pipes.communicate()
-
-        if pipes.returncode != 0:
-            # Error unable to run idl
-            history_entry.ceh_stderr = history_entry.ceh_stderr + (f'Error: Unable to run IDL procedure. Return code: {pipes.returncode}.\n')
-            CalibrationExecutionHistoryFactory.CalibrationExecutionHistoryFactory().update(history_entry, db)
-            log_error_with_level(f'Error: Unable to run IDL procedure. Return code: {pipes.returncode}.', 1, db)
+            # The session already consumed the license information when it started
+            stderr_log = IDLOutputLog(None if idl_log_path is None else f'{idl_log_path}.stderr.gz', idl_output_head_lines, idl_output_tail_lines)
+            if idl_timeout is None:
+                idl_timeout = idl_session_timeout
+            returncode, session_stdout, session_stderr = idl_sessions.run(idl_command, idl_timeout, stdout_log.write, stderr_log.write)
+        stdout_log.close()
+        stderr_log.close()
+        std_out = stdout_log.summary() + session_stdout
+        std_err = stderr_log.summary() + session_stderr
+        job_metrics.count('stdout_bytes', stdout_log.n_bytes)
+        job_metrics.count('stderr_bytes', stderr_log.n_bytes)
+
+        if returncode is None:
+            # IDL was killed because it didn't finish in time
+            job_metrics.count('timeouts')
+            history_entry.ceh_stdout = history_entry.ceh_stdout + std_out
+            history_entry.ceh_stderr = history_entry.ceh_stderr + std_err + (f'Error: Timeout, IDL procedure killed after {idl_timeout} seconds.\n')
+            save_history(db)
+            log_error_with_level(f'Error: Timeout, IDL procedure killed after {idl_timeout} seconds.', 1, db)
+            config_files.release(config_key, cp_config_dir_path)
+            return False
+        elif returncode != 0:
+            # Error unable to run idl, its output (and the path of the full log) tells why
+            history_entry.ceh_stdout = history_entry.ceh_stdout + std_out
+            history_entry.ceh_stderr = history_entry.ceh_stderr + std_err + (f'Error: Unable to run IDL procedure. Return code: {returncode}.\n')
+            save_history(db)
+            log_error_with_level(f'Error: Unable to run IDL procedure. Return code: {returncode}.', 1, db)
+            config_files.release(config_key, cp_config_dir_path)
             return False
         else:
             # Update stdout and stderr attributes
-            history_entry.ceh_stdout = history_entry.ceh_stdout + (std_out.decode("utf-8"))
-            history_entry.ceh_stderr = history_entry.ceh_stderr + ("\n".join(std_err.decode("utf-8").split("\n")[8:]))  # Remove first 8 lines as they include IDL license information
-            CalibrationExecutionHistoryFactory.CalibrationExecutionHistoryFactory().update(history_entry, db)
+            history_entry.ceh_stdout = history_entry.ceh_stdout + std_out
+            history_entry.ceh_stderr = history_entry.ceh_stderr + std_err
+            save_history(db, final=False)
             if is_monthly:
                 log_info_with_level(f'Monthly{" and daily" if len(date) > 6 else ""} calibration finished processing camera {camera_code} on date {ProcessCalibration.__format_d(date, is_monthly)}', 1, db)
             else:
                 log_info_with_level(f'Daily calibration finished processing camera {camera_code} on date {ProcessCalibration.__format_d(date, is_monthly)}', 1, db)
 
         # Determine if execution was successful by testing presence of new files in astrometry/cameraId/month_date directory
-        if not os.path.exists(f'{astrometry_dir_path}/{camera_code}/{date[:6]}/{camera_code}_{date}_astro_solution.txt'):
+        job_metrics.begin('verification')
+        if not os.path.exists(solution_path):
             history_entry.ceh_stderr = history_entry.ceh_stderr + (f'Error: Unable to generate monthly{" and daily" if len(date) > 6 else ""} astrometry for camera {camera_code} on date {ProcessCalibration.__format_d(date, is_monthly)}.\n' if is_monthly else f'Error: Unable to generate daily astrometry for camera {camera_code} on date {ProcessCalibration.__format_d(date, is_monthly)}.\n')
-            CalibrationExecutionHistoryFactory.CalibrationExecutionHistoryFactory().update(history_entry, db)
+            save_history(db)
             log_error_with_level(f'Error: Unable to generate monthly{" and daily" if len(date) > 6 else ""} astrometry for camera {camera_code} on date {ProcessCalibration.__format_d(date, is_monthly)}.' if is_monthly else f'Error: Unable to generate daily astrometry for camera {camera_code} on date {ProcessCalibration.__format_d(date, is_monthly)}.', 1, db)
+            config_files.release(config_key, cp_config_dir_path)
             return False
         else:
+            CalibrationFingerprint.write(solution_path, fingerprint)
             if is_monthly:
                 log_info_with_level(f'Camera {camera_code} on date {ProcessCalibration.__format_d(date, is_monthly)} was successfully monthly{" and daily" if len(date) > 6 else ""} processed.', 1, db)
             else:
                 log_info_with_level(f'Camera {camera_code} on date {ProcessCalibration.__format_d(date, is_monthly)} was successfully daily processed.', 1, db)
         
-        # Delete configuration_userId.ini
-        if not IDLConfigFileHandler.IDLConfigFileHandler().delete(userId, sys_config):
-            # Error unable to delete config file for this user
-            history_entry.ceh_stderr = history_entry.ceh_stderr(f'Error: Unable to delete configuration{userId}.ini file for this user after successful IDL procedure execution.\n')
-            CalibrationExecutionHistoryFactory.CalibrationExecutionHistoryFactory().update(history_entry, db)
-            log_error_with_level(f'Error: Unable to delete configuration{userId}.ini file for this user after successful IDL procedure execution.', 1, db)
-            return False
-        log_info_with_level(f'File configuration{userId}.ini successfully deleted.', 1, db)
+        # Release configuration_{hash}.ini, it is deleted once no job used it for config_file_max_age_hours
+        job_metrics.begin('cleanup')
+        config_files.release(config_key, cp_config_dir_path)
+        save_history(db)
+        log_info_with_level(f'File configuration_{config_key}.ini released.', 1, db)
 
         return True
 
     @staticmethod
-    def bulkProcess(launcherId, date, db):
+    def plan(date, db, camera_codes=None, is_monthly=None, force=False):
         '''
-        This method finds what day to process, whether it needs to process for a month or only a day and starts processing all calibrations.
+        Returns the jobs bulkProcess() would run with the same arguments, without running them: no history entry, staged capture or IDL process is created.  
+        Every job is a dictionary with keys camera_code, user_id, date, is_monthly, captures (number of files it would stage), bytes (their size) and status:  
+        `run`, `up_to_date` (its astro solution matches the fingerprint of its inputs, it is skipped unless force is set) or `no_captures`.  
+        Only the capture index is brought up to date, the captures of every job are then found with one query.  
+        '''
+        load_config()
+        night, is_monthly = ProcessCalibration.__target(date, is_monthly)
+        night = night.strftime('%Y%m%d')
+        context = CalibrationRunContext()
+        context.load(db)
+        sys_config = context.sys_config(db)
+        root_path = context.sys_parameter('root_path', db)
+        astrometry_dir_path = context.sys_parameter('cp_dir_astrometry', db)
+
+        jobs = []
+        for camera in context.active_cameras(db):
+            if camera_codes and camera.code not in camera_codes:
+                continue
+            capture_index.refresh(camera.code, root_path, night[:6] if is_monthly else night)
+            captures = capture_index.captures(camera.code, night[:6] if is_monthly else night)
+            status = 'run' if captures else 'no_captures'
+            if captures and skip_up_to_date and not force:
+                fingerprint = ProcessCalibration.__fingerprint(camera.code, night, is_monthly, captures, context.user_config(camera.modified_by, db), sys_config)
+                if CalibrationFingerprint.is_up_to_date(f'{astrometry_dir_path}/{camera.code}/{night[:6]}/{camera.code}_{night}_astro_solution.txt', fingerprint):
+                    status = 'up_to_date'
+            jobs.append({'camera_code': camera.code, 'user_id': camera.modified_by, 'date': night, 'is_monthly': is_monthly, 'captures': len(captures), 'bytes': sum(capture['size'] for capture in captures), 'status': status})
+        return jobs
+
+    @staticmethod
+    def bulkProcess(launcherId, date, db, max_workers=None, force=False, camera_codes=None, is_monthly=None):
+        '''
+        This method finds what day to process, whether it needs to process for a month or only a day and starts processing all calibrations.  
+        The night before date is processed for every active camera, or only for the cameras in camera_codes, with its monthly processing if it is the last night of the month unless is_monthly (0 or 1) is given.  
+        Up to max_workers calibrations (default `max_parallel_jobs` from the configuration file) run at the same time, each worker using its own connection of the database connection pool.  
+        If `use_idl_sessions` is set in the configuration file every worker reuses a long-running IDL session.  
+        Log entries are queued and written in batches on a dedicated connection, every entry is written before this method returns or raises.  
+        System configuration, active cameras and user configurations are fetched once for the whole run.  
+        Stage durations of every job are summarized in the log at the end of the run and exported to `metrics_jsonl_path` and `metrics_prometheus_path` if they are set.  
+        With force set calibrations are run again even if their astro solution is up to date.  
+        If `distributed` is set every job is claimed in the lease table first and skipped if another host claimed it, and the method returns once no host runs a job of the date anymore.  
+        '''
+        return ProcessCalibration.__run(launcherId, db, max_workers, lambda pool, idl_sessions, log_writer, metrics: ProcessCalibration.__bulk_process(launcherId, date, db, pool, idl_sessions, log_writer, metrics, force, camera_codes, is_monthly))
+
+    @staticmethod
+    def backfill(launcherId, start_date, end_date, db, camera_codes=None, max_workers=None, force=False, monthly=True, restart=False):
+        '''
+        Calibrates every night from start_date to end_date (YYYYmmdd, both included) for every active camera, or only for the cameras in camera_codes.  
+        If monthly is set the monthly calibration of every month of the range that is over runs once the daily calibrations of that month succeeded.  
+        Most recent jobs run first, up to max_workers at the same time, with the same history entries and log entries as start().  
+        Progress is kept in `backfill_progress_path`: running the same backfill again only runs the jobs that didn't succeed yet, unless restart is set.  
+        Returns the number of succeeded, failed and blocked (not run because a daily calibration they depend on failed) jobs.  
+        '''
+        return ProcessCalibration.__run(launcherId, db, max_workers, lambda pool, idl_sessions, log_writer, metrics: ProcessCalibration.__backfill(launcherId, start_date, end_date, db, camera_codes, force, monthly, restart, pool, idl_sessions, log_writer, metrics))
+
+    @staticmethod
+    def daemon(launcherId, db, max_workers=None, force=False):
+        '''
+        Runs until SIGTERM or SIGINT, calibrating the last night of every active camera as soon as its captures are complete (see CaptureWatcher.py).  
+        The last night of a month gets its daily and monthly calibration once every daily calibration of that month started by the daemon has ended.  
+        Up to max_workers calibrations run at the same time, with the same history entries and log entries as start().  
+        Jobs that succeeded are kept in `backfill_progress_path` (backfill `daemon`) and never run again, failed jobs are queued for retry by bulkProcess().  
+        Returns the number of succeeded and failed jobs.  
+        '''
+        return ProcessCalibration.__run(launcherId, db, max_workers, lambda pool, idl_sessions, log_writer, metrics: ProcessCalibration.__daemon(launcherId, db, force, pool, idl_sessions, log_writer, metrics))
+
+    @staticmethod
+    def __run(launcherId, db, max_workers, body):
+        '''
+        Sets up the worker pool, IDL sessions, log writer and metrics of a run, runs body(pool, idl_sessions, log_writer, metrics) and releases them.  
+        body returns its result, returned by this method, and the last log entry of the run, written after the summary of the metrics.  
+        '''
+        load_config()
+        pool = CalibrationWorkerPool(max_parallel_jobs if max_workers is None else max_workers, db, connect_db)
+        # One connection per worker, plus the main thread, the log writer and the lease connections
+        db_pool.reserve(pool.max_workers + 4)
+        idl_sessions = IDLSessionPool(pool.max_workers, ('bash', '-c', idl_shell_command(cpu_limit=False))) if use_idl_sessions else None
+
+        # Entries are written by a background thread on a connection no other thread uses, so workers never write on a shared connection
+        log_db = connect_db() if log_flush_interval or pool.max_workers > 1 else None
+        if log_db is None:
+            # Batches are then written on db by this thread only, entries logged by workers wait for its next log entry
+            log_writer = BufferedLogWriter(db, None, log_flush_size)
+        else:
+            log_writer = BufferedLogWriter(log_db, log_flush_interval, log_flush_size, background=True)
+        metrics = CalibrationMetrics()
+        last_entry = None
+        try:
+            result, last_entry = body(pool, idl_sessions, log_writer, metrics)
+            return result
+        finally:
+            metrics.run.end()
+            ProcessCalibration.__export_metrics(metrics, launcherId, log_writer)
+            if last_entry is not None:
+                log_writer.log('INFO', 1, f'{LOG_MESSAGE_PREFIX}{last_entry}', launcherId)
+            pool.close()
+            if idl_sessions is not None:
+                idl_sessions.close()
+            if leases is not None:
+                leases.close()
+            # If the entries can't be written log_db stays open for the atexit hook of log_writer to try again
+            log_writer.close()
+            if log_db is not None:
+                log_db.close()
+
+    @staticmethod
+    def __bulk_process(launcherId, date, db, pool, idl_sessions, log_writer, metrics, force, camera_codes, monthly):
+        '''
+        Body of bulkProcess, run with the worker pool, IDL sessions, log writer and metrics set up by __run, returning its result and the last log entry of the run.  
         '''
         def fetch_cameras_to_process(db):
             '''
-            Returns list of active cameras and how many they are.  
+            Returns list of active cameras (in camera_codes if given) and how many they are.  
             '''
-            camera_list = CameraFactory.CameraFactory.getListActiveCameras(db)
+            camera_list = [camera for camera in context.active_cameras(db) if not camera_codes or camera.code in camera_codes]
             return camera_list, len(camera_list)
 
-        max_failed_retry_attempts = eval(SystemConfigurationFactory.SystemConfigurationFactory().getParameterValueByParameterName('calibration_max_failed_retry_attempts', db))
+        # Values that don't change during the run, shared by every job
+        metrics.run.begin('context_load')
+        run_started = time.time()
+        context = CalibrationRunContext()
+        context.load(db)
+
+        def run_job(job, worker_db):
+            '''
+            Runs job (camera_id, user_id, date, is_monthly) and returns its outcome, or claimed if another host claimed it (distributed mode).  
+            '''
+            if leases is not None and not leases.claim(job, run_started, force):
+                return 'claimed'
+            camera_id, user_id, job_date, is_monthly = job
+            outcome = ProcessCalibration.__start_job(camera_id, user_id, job_date, is_monthly, worker_db, loggingUserId=launcherId, idl_sessions=idl_sessions, log_writer=log_writer, context=context, metrics=metrics, force=force).outcome
+            if leases is not None:
+                leases.release(job, 'done' if outcome == 'success' else 'failed')
+            return outcome
+
+        def take_over(jobs):
+            '''
+            Runs jobs left by hosts that stopped (distributed mode), queues those that fail for retry and returns how many succeeded and failed.  
+            '''
+            n_taken_success = 0
+            n_taken_failure = 0
+            for job, outcome in pool.run(jobs, run_job, error_result='error'):
+                if outcome == 'claimed':
+                    continue
+                camera_id, user_id, job_date, is_monthly = job
+                success = outcome == 'success'
+                log_writer.log("INFO" if success else "ERROR", 4 if success else 1, f'{LOG_MESSAGE_PREFIX}Camera {context.camera(camera_id, db).code} for user {user_id} on date {ProcessCalibration.__format_d(job_date, is_monthly)}, taken over from a host that stopped, {"was successfully processed." if success else "could not be processed."}', launcherId)
+                if success:
+                    n_taken_success += 1
+                else:
+                    retry_queue.add(camera_id, user_id, job_date, is_monthly, outcome)
+                    n_taken_failure += 1
+            return n_taken_success, n_taken_failure
+
+        max_failed_retry_attempts = eval(context.sys_parameter('calibration_max_failed_retry_attempts', db))
 
         # Check if we failed calibration of some cameras in previous runs
-        with open('./failed_calibrations.json', 'r') as f:
-            failed_calibrations = json.load(f)
+        metrics.run.begin('retry')
+        retry_queue.migrate_json('./failed_calibrations.json')
+        failed_calibrations = retry_queue.claim()
         num_previously_failed = len(failed_calibrations)
         if num_previously_failed > 0:
-            lpff().insert(lpf().create(datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 'INFO', 1, f'{LOG_MESSAGE_PREFIX}Found previously failed calibrations. Re-attempting calibration.', launcherId, launcherId, launcherId), db)
+            log_writer.log('INFO', 1, f'{LOG_MESSAGE_PREFIX}Found previously failed calibrations. Re-attempting calibration.', launcherId)
             # Retry executing previously failed calibrations
-            num_previously_failed = 0
             success = 0
-            for failed_date in list(failed_calibrations):
-                num_previously_failed += len(list(failed_calibrations[failed_date]["camera_data"]))
-                is_monthly = 0
-                if failed_calibrations[failed_date]['is_monthly'] == 1:
-                    is_monthly = 1
-                lpff().insert(lpf().create(datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 'INFO', 5, f'{LOG_MESSAGE_PREFIX}Re attempting {len(list(failed_calibrations[failed_date]["camera_data"]))} calibrations in date {ProcessCalibration.__format_d(failed_date, is_monthly)}, [{max_failed_retry_attempts - failed_calibrations[failed_date]["attempts"]} attempts left].', launcherId, launcherId, launcherId), db)
-                index = 0
-                for camera_data in list(failed_calibrations[failed_date]['camera_data']):
-                    if CameraFactory.CameraFactory().isCameraActive(camera_data[0], db):
-                        if ProcessCalibration.start(camera_data[0], camera_data[1], failed_date, is_monthly, db, loggingUserId=launcherId):
-                            del failed_calibrations[failed_date]['camera_data'][index]
-                            success += 1
-                    index += 1
-                failed_calibrations[failed_date]['attempts'] += 1
-                if len(failed_calibrations[failed_date]['camera_data']) == 0 or failed_calibrations[failed_date]['attempts'] >= max_failed_retry_attempts:
-                    del failed_calibrations[failed_date]
-
-            with open('./failed_calibrations.json', 'w') as f:
-                json.dump(failed_calibrations, f, sort_keys=True, indent=4)
-            lpff().insert(lpf().create(datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 'INFO', 1, f'{LOG_MESSAGE_PREFIX}Managed to complete {success} of {num_previously_failed} previously failed calibrations.', launcherId, launcherId, launcherId), db)
-
-        # Find the date to calibrate
-        now = date - timedelta(days=1)
-
-        # Find if it's last day of the month
-        is_monthly = 0
-        if now.day == calendar.monthrange(now.year, now.month)[1]:
-            is_monthly = 1
+            for failed_date in sorted(set(failed['date'] for failed in failed_calibrations)):
+                # Calibrations that timed out go last, so an input that hangs IDL again doesn't hold back the others
+                failed_on_date = sorted((failed for failed in failed_calibrations if failed['date'] == failed_date), key=lambda failed: failed['last_error'] == 'timeout')
+                is_monthly = failed_on_date[0]['is_monthly']
+                log_writer.log('INFO', 5, f'{LOG_MESSAGE_PREFIX}Re attempting {len(failed_on_date)} calibrations in date {ProcessCalibration.__format_d(failed_date, is_monthly)}, [{max_failed_retry_attempts - max(failed["attempts"] for failed in failed_on_date)} attempts left].', launcherId)
+
+                def retry_calibration(failed, worker_db):
+                    if not context.is_camera_active(failed['camera_id'], worker_db):
+                        return 'failure'
+                    return run_job((failed['camera_id'], failed['user_id'], failed['date'], failed['is_monthly']), worker_db)
+
+                for failed, outcome in pool.run(failed_on_date, retry_calibration, error_result='error'):
+                    if outcome == 'success':
+                        retry_queue.complete(failed)
+                        success += 1
+                    elif outcome == 'claimed':
+                        # Another host runs it or already calibrated it, and queues it itself if it fails
+                        retry_queue.complete(failed)
+                    elif outcome == 'timeout' and failed['last_error'] == 'timeout':
+                        # An input that hung IDL twice in a row is not attempted again
+                        retry_queue.fail(failed, failed['attempts'] + 1, outcome)
+                    else:
+                        retry_queue.fail(failed, max_failed_retry_attempts, outcome)
+
+            log_writer.log('INFO', 1, f'{LOG_MESSAGE_PREFIX}Managed to complete {success} of {num_previously_failed} previously failed calibrations.', launcherId)
+
+        # Calibrations of previous runs left by hosts that stopped
+        if leases is not None:
+            take_over(leases.expired())
+
+        # Find the date to calibrate and if it's last day of the month
+        metrics.run.begin('calibration')
+        now, is_monthly = ProcessCalibration.__target(date, monthly)
         camera_list, n_cameras = fetch_cameras_to_process(db)
+        n_success = 0
+        n_failure = 0
+        n_claimed = 0
 
         if n_cameras > 0:
-            lpff().insert(lpf().create(datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 'INFO', 1, f'{LOG_MESSAGE_PREFIX}Successfully fetched {n_cameras} camera(s).', launcherId, launcherId, launcherId), db)
-            lpff().insert(lpf().create(datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 'INFO', 1, f'{LOG_MESSAGE_PREFIX}Started bulk calibration processing {n_cameras} camera(s).', launcherId, launcherId, launcherId), db)
-            n_success = 0
-            n_failure = 0
-
-            for camera in camera_list:
-                success = ProcessCalibration.start(camera.id, camera.modified_by, now.strftime("%Y%m%d"), is_monthly, db, loggingUserId=launcherId)
-                lpff().insert(lpf().create(datetime.now().strftime("%Y-%m-%d %H:%M:%S"), "INFO" if success else "ERROR", 4 if success else 1, f'{LOG_MESSAGE_PREFIX}({n_success + n_failure + 1}/{n_cameras}) Camera {camera.code} for user {camera.modified_by} {"was successfully processed." if success else "could not be daily processed."}', launcherId, launcherId, launcherId), db)
+            log_writer.log('INFO', 1, f'{LOG_MESSAGE_PREFIX}Successfully fetched {n_cameras} camera(s).', launcherId)
+            log_writer.log('INFO', 1, f'{LOG_MESSAGE_PREFIX}Started bulk calibration processing {n_cameras} camera(s).', launcherId)
+
+            def process_camera(camera, worker_db):
+                return run_job((camera.id, camera.modified_by, now.strftime("%Y%m%d"), is_monthly), worker_db)
+
+            # Results are handled on this thread as workers finish, so logging and failure bookkeeping stay serial
+            for camera, outcome in pool.run(camera_list, process_camera, error_result='error'):
+                if outcome == 'claimed':
+                    n_claimed += 1
+                    log_writer.log('INFO', 5, f'{LOG_MESSAGE_PREFIX}({n_success + n_failure + n_claimed}/{n_cameras}) Camera {camera.code} for user {camera.modified_by} is processed by another host.', launcherId)
+                    continue
+                success = outcome == 'success'
+                log_writer.log("INFO" if success else "ERROR", 4 if success else 1, f'{LOG_MESSAGE_PREFIX}({n_success + n_failure + n_claimed + 1}/{n_cameras}) Camera {camera.code} for user {camera.modified_by} {"was successfully processed." if success else "could not be daily processed."}', launcherId)
                 if success:
                     n_success += 1
                 else:
-                    # Save failed calibration data in failed_calibrations.json
-                    with open('./failed_calibrations.json', 'r') as f:
-                        failed_calibrations = json.load(f)
-                    try:
-                        failed_calibrations[now.strftime("%Y%m%d")]['camera_data'].append((camera.id, camera.modified_by))
-                    except:
-                        failed_calibrations[now.strftime("%Y%m%d")] = {
-                            'is_monthly': is_monthly,
-                            'camera_data': [(camera.id, camera.modified_by)],
-                            'attempts': 1
-                        }
-                    with open('./failed_calibrations.json', 'w') as f:
-                        json.dump(failed_calibrations, f, indent=4)
+                    # Queue failed calibration to re-attempt it in a next run
+                    retry_queue.add(camera.id, camera.modified_by, now.strftime("%Y%m%d"), is_monthly, outcome)
                     n_failure += 1
 
-            lpff().insert(lpf().create(datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 'INFO', 1, f'{LOG_MESSAGE_PREFIX}Finishied daily {"and monthly " if is_monthly else ""}bulk processing {n_cameras} camera(s) [{n_success} success(es), {n_failure} failure(s)].', launcherId, launcherId, launcherId), db)
+            # Wait for the other hosts, taking over the calibrations of those that stop
+            if leases is not None:
+                while leases.running(now.strftime("%Y%m%d")) > 0:
+                    expired_jobs = leases.expired(now.strftime("%Y%m%d"))
+                    if not expired_jobs:
+                        time.sleep(leases.heartbeat_seconds)
+                        continue
+                    n_taken_success, n_taken_failure = take_over(expired_jobs)
+                    n_success += n_taken_success
+                    n_failure += n_taken_failure
+                    n_claimed -= n_taken_success + n_taken_failure
+
+            last_entry = f'Finishied daily {"and monthly " if is_monthly else ""}bulk processing {n_cameras} camera(s) [{n_success} success(es), {n_failure} failure(s){f", {n_claimed} processed by other hosts" if leases is not None else ""}].'
         else:
-            lpff().insert(lpf().create(datetime.now().strftime("%Y-%m-%d %H:%M:%S"), 'INFO', 1, f'{LOG_MESSAGE_PREFIX}No cameras to process.', launcherId, launcherId, launcherId), db)
+            last_entry = 'No cameras to process.'
+
+        # The last entry is written by __run, after the summary of the metrics
+        return (n_success, n_failure), last_entry
+
+    @staticmethod
+    def __backfill(launcherId, start_date, end_date, db, camera_codes, force, monthly, restart, pool, idl_sessions, log_writer, metrics):
+        '''
+        Body of backfill, run with the worker pool, IDL sessions, log writer and metrics set up by __run, returning its result and the last log entry of the run.  
+        '''
+        metrics.run.begin('context_load')
+        context = CalibrationRunContext()
+        context.load(db)
+        cameras = [camera for camera in context.active_cameras(db) if camera_codes is None or camera.code in camera_codes]
+        camera_code_by_id = {camera.id: camera.code for camera in cameras}
 
-        return n_success, n_failure
+        metrics.run.begin('backfill')
+        jobs, dependencies = CalibrationBackfill.plan(cameras, start_date, end_date, monthly)
+        backfill_id = CalibrationBackfill.backfill_id(start_date, end_date, camera_codes, monthly)
+        done = backfill_progress.begin(backfill_id, jobs, restart)
+        jobs = [job for job in jobs if job not in done]
+        log_writer.log('INFO', 1, f'{LOG_MESSAGE_PREFIX}Started backfill {backfill_id} of {len(jobs)} calibration(s) for {len(cameras)} camera(s) [{len(done)} already done].', launcherId)
 
+        def run_job(job, worker_db):
+            camera_id, user_id, job_date, is_monthly = job
+            return ProcessCalibration.start(camera_id, user_id, job_date, is_monthly, worker_db, loggingUserId=launcherId, idl_sessions=idl_sessions, log_writer=log_writer, context=context, metrics=metrics, force=force)
 
-if __name__ == '__main__':
-    db = None
-    a = 0
-    while not db:
+        n_success = 0
+        n_failure = 0
+        n_blocked = 0
+        # Results are handled on this thread as jobs finish, so progress bookkeeping stays serial
+        for job, success in pool.run_graph(jobs, run_job, dependencies, error_result=False):
+            camera_id, user_id, job_date, is_monthly = job
+            job_description = f'Camera {camera_code_by_id[camera_id]} for user {user_id} on date {ProcessCalibration.__format_d(job_date, is_monthly)}'
+            if success is None:
+                backfill_progress.record(backfill_id, job, 'blocked')
+                log_writer.log('WARNING', 1, f'{LOG_MESSAGE_PREFIX}({n_success + n_failure + n_blocked + 1}/{len(jobs)}) {job_description} was not monthly processed because a daily calibration of the month failed.', launcherId)
+                n_blocked += 1
+            elif success:
+                backfill_progress.record(backfill_id, job, 'done')
+                log_writer.log('INFO', 4, f'{LOG_MESSAGE_PREFIX}({n_success + n_failure + n_blocked + 1}/{len(jobs)}) {job_description} was successfully {"monthly" if is_monthly else "daily"} processed.', launcherId)
+                n_success += 1
+            else:
+                backfill_progress.record(backfill_id, job, 'failed')
+                log_writer.log('ERROR', 1, f'{LOG_MESSAGE_PREFIX}({n_success + n_failure + n_blocked + 1}/{len(jobs)}) {job_description} could not be {"monthly" if is_monthly else "daily"} processed.', launcherId)
+                n_failure += 1
+
+        return (n_success, n_failure, n_blocked), f'Finished backfill {backfill_id} [{n_success} success(es), {n_failure} failure(s), {n_blocked} blocked].'
+
+
+    @staticmethod
+    def __daemon(launcherId, db, force, pool, idl_sessions, log_writer, metrics):
+        '''
+        Body of daemon, run with the worker pool, IDL sessions, log writer and metrics set up by __run, returning its result and the last log entry of the run.  
+        '''
+        stop = threading.Event()
+        previous_handlers = {signum: signal.signal(signum, lambda signum, frame: stop.set()) for signum in (signal.SIGTERM, signal.SIGINT)}
+
+        metrics.run.begin('context_load')
+        context = CalibrationRunContext()
+        context.load(db)
+        root_path = context.sys_parameter('root_path', db)
+        watcher = CaptureWatcher(root_path, [], daemon_quiet_minutes * 60, daemon_dawn_hour, daemon_lookback_days, daemon_use_inotify)
+        cameras_by_code = {}
+        camera_code_by_id = {}
+        context_day = [None]
+        last_metrics_export = [time.monotonic()]
+        # Jobs started by this daemon, month-end jobs waiting for their night and for the daily jobs of their month, daily jobs not ended by month
+        started = set()
+        month_ends = set()
+        open_dailies = {}
+        log_writer.log('INFO', 1, f'{LOG_MESSAGE_PREFIX}Started calibration daemon watching {root_path} ({"inotify" if watcher.uses_inotify else f"polling every {daemon_poll_seconds} seconds"}).', launcherId)
+
+        def is_month_end(night):
+            return int(night[6:]) == calendar.monthrange(int(night[:4]), int(night[4:6]))[1]
+
+        def start_job(job, jobs):
+            '''
+            Adds job to jobs unless it was started by this daemon or succeeded in a previous run, returns True if it was added.  
+            '''
+            if job in started or backfill_progress.is_done('daemon', job):
+                return False
+            started.add(job)
+            jobs.append(job)
+            return True
+
+        def next_jobs():
+            '''
+            Returns the jobs of the nights that became complete, None once the daemon is stopping.  
+            '''
+            if stop.is_set():
+                return None
+            if time.monotonic() - last_metrics_export[0] >= daemon_metrics_minutes * 60:
+                # The jobs exported are dropped, so the daemon doesn't keep the metrics of every job it ran, __run exports the rest when it stops
+                ProcessCalibration.__export_metrics(metrics.take_finished(), launcherId, log_writer)
+                last_metrics_export[0] = time.monotonic()
+            now = datetime.now()
+            if context_day[0] != now.date():
+                # Active cameras and configurations are fetched again every day
+                context.invalidate()
+                context.load(db)
+                cameras_by_code.clear()
+                cameras_by_code.update((camera.code, camera) for camera in context.active_cameras(db))
+                camera_code_by_id.update((camera.id, camera.code) for camera in cameras_by_code.values())
+                watcher.set_cameras(cameras_by_code)
+                context_day[0] = now.date()
+                for days in range(1, daemon_lookback_days + 1):
+                    night = (now - timedelta(days=days)).strftime('%Y%m%d')
+                    if is_month_end(night):
+                        month_ends.update((camera.id, camera.modified_by, night, 1) for camera in cameras_by_code.values())
+
+            jobs = []
+            for camera_code, night in watcher.complete_nights():
+                camera = cameras_by_code.get(camera_code)
+                # The last night of a month is calibrated by its month-end job
+                if camera is None or is_month_end(night):
+                    continue
+                job = (camera.id, camera.modified_by, night, 0)
+                if start_job(job, jobs):
+                    open_dailies[(camera.id, night[:6])] = open_dailies.get((camera.id, night[:6]), 0) + 1
+            for job in sorted(month_ends):
+                camera_id, user_id, night, is_monthly = job
+                if watcher.is_complete(camera_code_by_id[camera_id], night) and not open_dailies.get((camera_id, night[:6])):
+                    month_ends.discard(job)
+                    start_job(job, jobs)
+            return jobs
+
+        def run_job(job, worker_db):
+            camera_id, user_id, job_date, is_monthly = job
+            return ProcessCalibration.__start_job(camera_id, user_id, job_date, is_monthly, worker_db, loggingUserId=launcherId, idl_sessions=idl_sessions, log_writer=log_writer, context=context, metrics=metrics, force=force).outcome
+
+        metrics.run.begin('daemon')
+        n_success = 0
+        n_failure = 0
         try:
-            db = connect(**config)
-        except mysql.connector.Error as err:
-            if err.errno == errorcode.ER_ACCESS_DENIED_ERROR:
-                print('Something is wrong with your username or password')
-            elif err.errno == errorcode.ER_BAD_DB_ERROR:
-                print('Database does not exist')
+            # Results are handled on this thread as jobs finish, so progress bookkeeping stays serial
+            for job, outcome in pool.run_stream(next_jobs, run_job, daemon_poll_seconds, error_result='error'):
+                camera_id, user_id, job_date, is_monthly = job
+                if not is_monthly:
+                    open_dailies[(camera_id, job_date[:6])] -= 1
+                job_description = f'Camera {camera_code_by_id[camera_id]} for user {user_id} on date {ProcessCalibration.__format_d(job_date, is_monthly)}'
+                if outcome == 'success':
+                    backfill_progress.record('daemon', job, 'done')
+                    log_writer.log('INFO', 4, f'{LOG_MESSAGE_PREFIX}{job_description} was successfully {"daily and monthly" if is_monthly else "daily"} processed.', launcherId)
+                    n_success += 1
+                else:
+                    # Queue failed calibration to re-attempt it in the next bulkProcess
+                    backfill_progress.record('daemon', job, 'failed')
+                    retry_queue.add(camera_id, user_id, job_date, is_monthly, outcome)
+                    log_writer.log('ERROR', 1, f'{LOG_MESSAGE_PREFIX}{job_description} could not be {"daily and monthly" if is_monthly else "daily"} processed.', launcherId)
+                    n_failure += 1
+        finally:
+            watcher.close()
+            for signum, handler in previous_handlers.items():
+                signal.signal(signum, handler)
+
+        return (n_success, n_failure), f'Stopped calibration daemon [{n_success} success(es), {n_failure} failure(s)].'
+
+def run_date(night):
+    '''
+    Returns the date of the run that processes night (YYYYmmdd, or YYYYmm for the last night of the month), to pass to bulkProcess() or plan().  
+    '''
+    if len(night) == 6:
+        month = datetime.strptime(night, '%Y%m')
+        return month.replace(day=calendar.monthrange(month.year, month.month)[1]) + timedelta(days=1)
+    return datetime.strptime(night, '%Y%m%d') + timedelta(days=1)
+
+
+def add_job_arguments(parser, default):
+    '''
+    Adds the arguments choosing the jobs of bulkProcess() and plan() to parser, with default as their default value.  
+    '''
+    parser.add_argument('--date', type=run_date, default=default, help='night to process, YYYYmmdd, or YYYYmm for the last night of the month (default: last night)')
+    parser.add_argument('--camera', dest='cameras', action='append', default=default, help='camera code to process, can be repeated (default: every active camera)')
+    monthly_group = parser.add_mutually_exclusive_group()
+    monthly_group.add_argument('--daily', dest='is_monthly', action='store_const', const=0, default=default, help='only run the daily processing, even on the last night of the month')
+    monthly_group.add_argument('--monthly', dest='is_monthly', action='store_const', const=1, default=default, help='run the daily and monthly processing, even if the night is not the last of the month')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Calibrate every active camera on the last night.')
+    parser.add_argument('--config', help='configuration file (default: $PRISMA_PROCEDURES_CONFIG, ../procedures_config.json or procedures_config.json next to this folder)')
+    parser.add_argument('--force', action='store_true', help='run calibrations again even if their astro solution is up to date')
+    parser.add_argument('--workers', type=int, help='calibrations running at the same time (default: max_parallel_jobs)')
+    add_job_arguments(parser, None)
+    subparsers = parser.add_subparsers(dest='command')
+    backfill_parser = subparsers.add_parser('backfill', help='calibrate every night of a date range, then the months of the range that are over')
+    backfill_parser.add_argument('start_date', help='first night to calibrate, YYYYmmdd')
+    backfill_parser.add_argument('end_date', help='last night to calibrate, YYYYmmdd')
+    backfill_parser.add_argument('--camera', dest='cameras', action='append', default=argparse.SUPPRESS, help='camera code to calibrate, can be repeated (default: every active camera)')
+    backfill_parser.add_argument('--workers', type=int, default=argparse.SUPPRESS, help='calibrations running at the same time (default: max_parallel_jobs)')
+    backfill_parser.add_argument('--no-monthly', dest='monthly', action='store_false', help='only run daily calibrations')
+    backfill_parser.add_argument('--restart', action='store_true', help='forget the progress of previous runs of the same backfill')
+    backfill_parser.add_argument('--force', action='store_true', default=argparse.SUPPRESS, help='run calibrations again even if their astro solution is up to date')
+    daemon_parser = subparsers.add_parser('daemon', help='run until stopped, calibrating every night as soon as its captures are complete')
+    daemon_parser.add_argument('--workers', type=int, default=argparse.SUPPRESS, help='calibrations running at the same time (default: max_parallel_jobs)')
+    daemon_parser.add_argument('--force', action='store_true', default=argparse.SUPPRESS, help='run calibrations again even if their astro solution is up to date')
+    plan_parser = subparsers.add_parser('plan', help='list the jobs of a run and the captures each one would stage, without running anything')
+    add_job_arguments(plan_parser, argparse.SUPPRESS)
+    plan_parser.add_argument('--force', action='store_true', default=argparse.SUPPRESS, help='plan calibrations whose astro solution is up to date too')
+    plan_parser.add_argument('--json', action='store_true', help='print one JSON object per job')
+    args = parser.parse_args()
+
+    load_config(args.config)
+    db = connect_db()
+    if db is None:
+        print('Unable to connect to the database, exiting')
+        exit()
+
+    if args.command == 'plan':
+        # Reads the database and the capture index only, no login and no log entry
+        jobs = ProcessCalibration.plan(args.date or datetime.now(), db, args.cameras, args.is_monthly, args.force)
+        for job in jobs:
+            if args.json:
+                print(json.dumps(job))
             else:
-                print(err)
-            a += 1
-            if a == db_connection_attempts:
-                print('Unable to connect to the database, exiting')
-                exit()
-            time.sleep(1)
+                print(f'{job["camera_code"]:<12} {job["date"]} {"daily+monthly" if job["is_monthly"] else "daily":<13} {job["captures"]:>6} file(s) {job["bytes"] / 1024 / 1024:>10.1f} MB  {job["status"]}')
+        if not args.json:
+            jobs_to_run = [job for job in jobs if job['status'] == 'run']
+            print(f'{len(jobs_to_run)} of {len(jobs)} job(s) would run, staging {sum(job["captures"] for job in jobs_to_run)} file(s) ({sum(job["bytes"] for job in jobs_to_run) / 1024 / 1024:.1f} MB).')
+        exit()
 
     launcher_id = CorePersonFactory.CorePersonFactory().login(default_user["username"], default_user["password"], db)
     if launcher_id is not False:
         lpff().insert(lpf().create(datetime.now(), 'INFO', 4, f'{LOG_MESSAGE_PREFIX}Successfully logged in user {default_user["username"]}', launcher_id, launcher_id, launcher_id), db)
-        ProcessCalibration.bulkProcess(launcher_id, datetime.now(), db)
+        if args.command == 'backfill':
+            ProcessCalibration.backfill(launcher_id, args.start_date, args.end_date, db, args.cameras, args.workers, args.force, args.monthly, args.restart)
+        elif args.command == 'daemon':
+            ProcessCalibration.daemon(launcher_id, db, args.workers, args.force)
+        else:
+            ProcessCalibration.bulkProcess(launcher_id, args.date or datetime.now(), db, args.workers, args.force, args.cameras, args.is_monthly)
     else:
         lpff().insert(lpf().create(datetime.now(), 'ERROR', 1, f'{LOG_MESSAGE_PREFIX}Error: Unable to login user {default_user["username"]}', 1, 1, 1), db)
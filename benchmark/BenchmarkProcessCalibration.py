@@ -0,0 +1,326 @@
+'''
+Offline benchmark of ProcessCalibration.bulkProcess.
+The PRISMA_SDK factories and mysql.connector are replaced by the in-memory fakes of FakeSDK.py, IDL by the stub bin/idl,
+and the captures by a synthetic tree of N cameras x M nights x K files generated in a temporary folder.
+Every scenario runs in its own interpreter (ProcessCalibration keeps the configuration it read on first use) and reports, for every run,
+the wall time of bulkProcess, the db calls per camera and the file system calls per camera.
+
+    python benchmark/BenchmarkProcessCalibration.py --cameras 20 --nights 30 --files 50 --idl-sleep 0.05
+'''
+import argparse
+import builtins
+import calendar
+import gzip
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+SCENARIOS = ('daily', 'month-end', 'retry', 'backfill')
+
+# bulkProcess(date) calibrates the night before date: a night in the middle of the month, or the last night of the month (daily and monthly)
+# backfill calibrates every night of the tree, which ends with the night before date
+RUN_DATES = {'daily': datetime(2024, 3, 16), 'month-end': datetime(2024, 4, 1), 'retry': datetime(2024, 3, 16), 'backfill': datetime(2024, 4, 1)}
+
+
+class FileSystemCounter:
+    '''
+    Counts the calls made to the os functions that hit the file system, and the processes started, while installed.
+    Calls made by SQLite or by IDL itself are not visible from Python and aren't counted.
+    '''
+
+    OS_FUNCTIONS = ('stat', 'lstat', 'scandir', 'listdir', 'symlink', 'readlink', 'makedirs', 'mkdir', 'remove', 'unlink', 'rmdir', 'rename', 'replace', 'open', 'walk')
+    PATH_FUNCTIONS = ('exists', 'lexists', 'isdir', 'isfile', 'islink', 'getmtime', 'getsize')
+
+    def __init__(self):
+        self.counts = {}
+        self.__lock = threading.Lock()
+        self.__originals = []
+
+    def __count(self, name):
+        with self.__lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def __wrap(self, module, attribute, name):
+        original = getattr(module, attribute)
+
+        def wrapper(*args, **kwargs):
+            self.__count(name)
+            return original(*args, **kwargs)
+        self.__originals.append((module, attribute, original))
+        setattr(module, attribute, wrapper)
+
+    def install(self):
+        for attribute in FileSystemCounter.OS_FUNCTIONS:
+            self.__wrap(os, attribute, attribute)
+        for attribute in FileSystemCounter.PATH_FUNCTIONS:
+            self.__wrap(os.path, attribute, f'path.{attribute}')
+        self.__wrap(builtins, 'open', 'open')
+        count = self.__count
+
+        class CountingPopen(subprocess.Popen):
+            def __init__(self, *args, **kwargs):
+                count('spawn')
+                super().__init__(*args, **kwargs)
+        self.__originals.append((subprocess, 'Popen', subprocess.Popen))
+        subprocess.Popen = CountingPopen
+
+    def uninstall(self):
+        while self.__originals:
+            module, attribute, original = self.__originals.pop()
+            setattr(module, attribute, original)
+
+    def reset(self):
+        with self.__lock:
+            self.counts = {}
+
+    def total(self):
+        with self.__lock:
+            return sum(self.counts.values())
+
+
+def camera_codes(n_cameras):
+    return [f'BNC{i + 1:03d}' for i in range(n_cameras)]
+
+
+def nights_before(run_date, n_nights):
+    '''
+    Returns the n_nights nights (YYYYmmdd) ending with the night before run_date, oldest first.
+    '''
+    last_night = run_date - timedelta(days=1)
+    return [(last_night - timedelta(days=n_nights - 1 - i)).strftime('%Y%m%d') for i in range(n_nights)]
+
+
+def make_capture_tree(root_path, codes, nights, n_files, capture_kb=0):
+    '''
+    Creates `{root_path}/{code}/{code}_{night}/captures` with n_files captures per night, taken every few minutes between 20:00 and 04:00.
+    Every capture is capture_kb KB of zeros compressed with gzip.
+    '''
+    content = gzip.compress(bytes(capture_kb * 1024))
+    for code in codes:
+        for night in nights:
+            captures_path = f'{root_path}/{code}/{code}_{night}/captures'
+            os.makedirs(captures_path, exist_ok=True)
+            start = datetime.strptime(night, '%Y%m%d') + timedelta(hours=20)
+            for i in range(n_files):
+                observation_time = start + timedelta(seconds=i * 8 * 3600 // max(1, n_files))
+                with open(f'{captures_path}/{code}_{observation_time.strftime("%Y%m%dT%H%M%S")}_UT-0.fit.gz', 'wb') as f:
+                    f.write(content)
+
+
+def run_scenario(scenario, args):
+    '''
+    Runs scenario args.runs times in this interpreter and returns one result dictionary per run.
+    '''
+    base_path = tempfile.mkdtemp(prefix='calibration_benchmark_')
+    work_path = f'{base_path}/work'
+    os.makedirs(work_path)
+    root_path = f'{base_path}/root'
+    astrometry_path = f'{base_path}/astrometry'
+    codes = camera_codes(args.cameras)
+    run_date = RUN_DATES[scenario]
+    nights = nights_before(run_date, args.nights)
+    make_capture_tree(root_path, codes, nights, args.files, args.capture_kb)
+
+    # ProcessCalibration reads the configuration file named by PRISMA_PROCEDURES_CONFIG on first use
+    config_path = f'{base_path}/procedures_config.json'
+    with open(config_path, 'w') as f:
+        json.dump({'process_calibration': {
+            'default_user': {'username': 'benchmark', 'password': 'benchmark'},
+            'db_config': {},
+            'LOG_MESSAGE_PREFIX': '[ProcessCalibration] ',
+            'db_connection_attempts': 1,
+            'max_parallel_jobs': args.workers,
+            'db_ping_interval': args.db_ping_interval,
+            'use_idl_sessions': args.idl_sessions,
+            'capture_staging_mode': args.staging,
+            'capture_index_path': f'{base_path}/capture_index.sqlite',
+            'capture_cache_dir': f'{base_path}/capture_cache' if args.capture_cache else None,
+            'retry_queue_path': f'{base_path}/failed_calibrations.sqlite',
+            'retry_backoff_seconds': 0,
+            'backfill_progress_path': f'{base_path}/calibration_backfill.sqlite',
+            'idl_log_dir': f'{base_path}/idl_logs',
+            'distributed': args.hosts > 1,
+            'lease_db_path': f'{base_path}/calibration_leases.sqlite',
+            'lease_seconds': 5,
+            'lease_heartbeat_seconds': 0.5,
+            'idl_timeout_daily': args.idl_timeout,
+            'idl_timeout_monthly': args.idl_timeout,
+        }}, f)
+    os.environ['PRISMA_PROCEDURES_CONFIG'] = config_path
+    # Anything written relative to the working directory stays in the temporary folder
+    os.chdir(work_path)
+    os.environ['PATH'] = f'{BENCHMARK_DIR}/bin{os.pathsep}{os.environ["PATH"]}'
+    os.environ['BENCH_ASTROMETRY_DIR'] = astrometry_path
+    os.environ['BENCH_IDL_SLEEP'] = str(args.idl_sleep)
+    os.environ['BENCH_IDL_OUTPUT_LINES'] = str(args.idl_output_lines)
+    os.environ['BENCH_IDL_FAIL'] = ','.join(codes[:args.failing])
+    os.environ['BENCH_IDL_HANG'] = ','.join(codes[args.failing:args.failing + args.hanging])
+
+    sys.path[:0] = [BENCHMARK_DIR, REPO_DIR]
+    import FakeSDK
+    FakeSDK.install()
+    import ProcessCalibration
+    from PRISMA_SDK.simpleClass import Camera
+
+    database = FakeSDK.database
+    database.cameras = [Camera.Camera().create(i + 1, code, None, None, None, 1, i % 3 + 1, 1) for i, code in enumerate(codes)]
+    database.system_configuration = {
+        'root_path': root_path,
+        'cp_dir_captures': f'{base_path}/captures',
+        'cp_dir_astrometry': astrometry_path,
+        'cp_tmp_user_config_path': f'{base_path}/config',
+        'calibration_max_failed_retry_attempts': '3',
+    }
+    database.user_configurations = {user: {'fwhm_max': 3.5, 'n_stars_min': 10, 'catalog': 'hipparcos'} for user in (1, 2, 3)}
+
+    def history_stats(history):
+        return {
+            'jobs': len(history),
+            'distinct_history_ids': len(set(history_entry.id for history_entry in history if history_entry.id)),
+            'skipped': sum(history_entry.ceh_stdout.startswith('Skipped') for history_entry in history),
+            'timeouts': sum('Error: Timeout' in history_entry.ceh_stderr for history_entry in history),
+            'history_bytes': sum(len(history_entry.ceh_stdout) + len(history_entry.ceh_stderr) for history_entry in history),
+        }
+
+    def run_host(host_results):
+        '''
+        Runs bulkProcess as another host of a distributed run, in a forked process with its own copy of the fake database.
+        '''
+        n_history = len(database.history)
+        n_success, n_failure = ProcessCalibration.ProcessCalibration.bulkProcess(1, run_date, ProcessCalibration.connect_db(), force=args.force)
+        host_results.put(dict(history_stats(database.history[n_history:]), success=n_success, failure=n_failure))
+
+    counter = FileSystemCounter()
+    results = []
+    try:
+        for run in range(args.runs):
+            if scenario == 'retry':
+                # Every camera failed every night before the one calibrated by this run
+                for camera in database.cameras:
+                    for night in nights[:-1]:
+                        ProcessCalibration.retry_queue.add(camera.id, camera.modified_by, night, int(night[6:] == str(calendar.monthrange(int(night[:4]), int(night[4:6]))[1])))
+            # The other hosts of a distributed run share the lease table, captures and astrometry folders but not the fake database
+            fork = multiprocessing.get_context('fork')
+            host_results = fork.Queue()
+            hosts = [fork.Process(target=run_host, args=(host_results,)) for _ in range(args.hosts - 1 if scenario != 'backfill' else 0)]
+            for host in hosts:
+                host.start()
+            plan_stats = {}
+            if args.plan and scenario != 'backfill':
+                # The plan of the run must leave no history entry behind
+                n_history = len(database.history)
+                plan_db = ProcessCalibration.connect_db()
+                plan = ProcessCalibration.ProcessCalibration.plan(run_date, plan_db, force=args.force)
+                plan_db.close()
+                plan_stats = {'plan': {status: sum(job['status'] == status for job in plan) for status in sorted(set(job['status'] for job in plan))}, 'plan_files': sum(job['captures'] for job in plan if job['status'] == 'run'), 'plan_history_rows': len(database.history) - n_history}
+            database.calls = 0
+            n_history = len(database.history)
+            counter.reset()
+            counter.install()
+            start = time.perf_counter()
+            # Like the entry point, the run starts with a connection of the pool
+            db = ProcessCalibration.connect_db()
+            try:
+                if scenario == 'backfill':
+                    # Every run starts the backfill from scratch, so runs can be compared
+                    n_success, n_failure, n_blocked = ProcessCalibration.ProcessCalibration.backfill(1, nights[0], nights[-1], db, force=args.force, restart=True)
+                else:
+                    n_success, n_failure = ProcessCalibration.ProcessCalibration.bulkProcess(1, run_date, db, force=args.force)
+                    n_blocked = 0
+                host_stats = [host_results.get() for host in hosts]
+                for host in hosts:
+                    host.join()
+            finally:
+                elapsed = time.perf_counter() - start
+                counter.uninstall()
+                db.close()
+            stats = history_stats(database.history[n_history:])
+            for host_stat in host_stats:
+                n_success += host_stat.pop('success')
+                n_failure += host_stat.pop('failure')
+                stats = {name: value + host_stat[name] for name, value in stats.items()}
+            results.append({
+                'scenario': scenario,
+                'run': run + 1,
+                'hosts': len(hosts) + 1,
+                'cameras': args.cameras,
+                'nights': args.nights,
+                'files': args.files,
+                **stats,
+                'success': n_success,
+                'failure': n_failure,
+                'blocked': n_blocked,
+                'wall_seconds': elapsed,
+                'db_calls': database.calls,
+                'db_calls_per_camera': database.calls / args.cameras,
+                'fs_calls': counter.total(),
+                'fs_calls_per_camera': counter.total() / args.cameras,
+                'fs_calls_by_function': dict(sorted(counter.counts.items())),
+                'db_pool': ProcessCalibration.db_pool.stats(),
+                **plan_stats,
+            })
+    finally:
+        os.chdir(REPO_DIR)
+        if not args.keep:
+            shutil.rmtree(base_path, ignore_errors=True)
+    return results
+
+
+def print_results(results, args):
+    if args.json:
+        for result in results:
+            print(json.dumps(result))
+        return
+    for result in results:
+        print(f'{result["scenario"]:<10} run {result["run"]}: {result["jobs"]} job(s) ({result["skipped"]} skipped) [{result["success"]} success(es), {result["failure"]} failure(s), {result["blocked"]} blocked, {result["timeouts"]} timeout(s)] '
+              f'in {result["wall_seconds"]:.2f}s, {result["db_calls_per_camera"]:.1f} db calls/camera, {result["fs_calls_per_camera"]:.1f} fs calls/camera')
+        if args.verbose:
+            print('    ' + ', '.join(f'{name} {n}' for name, n in result['fs_calls_by_function'].items()))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark ProcessCalibration.bulkProcess offline, with fake SDK, fake IDL and synthetic captures.')
+    parser.add_argument('--scenario', choices=SCENARIOS + ('all',), default='all', help='daily night, month-end (daily and monthly), retry of every previous night or backfill of every night (default: all)')
+    parser.add_argument('--cameras', type=int, default=10, help='number of cameras (default: 10)')
+    parser.add_argument('--nights', type=int, default=15, help='nights of captures per camera (default: 15)')
+    parser.add_argument('--files', type=int, default=50, help='captures per camera and night (default: 50)')
+    parser.add_argument('--failing', type=int, default=0, help='cameras whose calibration never produces an astro solution (default: 0)')
+    parser.add_argument('--hanging', type=int, default=0, help='cameras whose calibration never ends, see --idl-timeout (default: 0)')
+    parser.add_argument('--idl-timeout', type=float, help='idl_timeout_daily and idl_timeout_monthly (default: none)')
+    parser.add_argument('--runs', type=int, default=2, help='bulkProcess runs per scenario, the first one starts with an empty capture index (default: 2)')
+    parser.add_argument('--hosts', type=int, default=1, help='processes running bulkProcess together in distributed mode, sharing a SQLite lease table (default: 1)')
+    parser.add_argument('--workers', type=int, default=1, help='max_parallel_jobs (default: 1)')
+    parser.add_argument('--db-ping-interval', type=float, default=30, help='db_ping_interval, 0 pings the connection before every query (default: 30)')
+    parser.add_argument('--idl-sessions', action='store_true', help='set use_idl_sessions')
+    parser.add_argument('--staging', choices=('symlink', 'manifest'), default='symlink', help='capture_staging_mode (default: symlink)')
+    parser.add_argument('--capture-cache', action='store_true', help='set capture_cache_dir, captures are decompressed once into a shared cache')
+    parser.add_argument('--capture-kb', type=int, default=0, help='uncompressed size of every capture in KB (default: 0)')
+    parser.add_argument('--idl-sleep', type=float, default=0.0, help='seconds every fake calibration takes (default: 0)')
+    parser.add_argument('--idl-output-lines', type=int, default=10, help='lines printed by every fake calibration (default: 10)')
+    parser.add_argument('--force', action='store_true', help='run calibrations again even if their astro solution is up to date')
+    parser.add_argument('--plan', action='store_true', help='run ProcessCalibration.plan() before every run and report the jobs it plans')
+    parser.add_argument('--keep', action='store_true', help='keep the temporary folder of every scenario')
+    parser.add_argument('--json', action='store_true', help='print one JSON object per run')
+    parser.add_argument('--verbose', action='store_true', help='print file system calls by function')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.scenario != 'all':
+        print_results(run_scenario(args.scenario, args), args)
+    else:
+        # One interpreter per scenario, so every scenario starts from a fresh ProcessCalibration module
+        for scenario in SCENARIOS:
+            returncode = subprocess.call([sys.executable, os.path.abspath(__file__), *sys.argv[1:], '--scenario', scenario])
+            if returncode != 0:
+                sys.exit(returncode)
@@ -0,0 +1,314 @@
+import itertools
+import json
+import os
+import sys
+import threading
+import types
+
+
+class FakeDatabase:
+    '''
+    In-memory stand-in for the tables read and written by ProcessCalibration through PRISMA_SDK.
+    Every factory method and every cursor execute counts as one db call.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.cameras = []
+        self.system_configuration = {}
+        self.user_configurations = {}
+        self.history = []
+        self.logs = []
+        self.calls = 0
+        self.__ids = itertools.count(1)
+
+    def call(self):
+        with self.lock:
+            self.calls += 1
+
+    def next_id(self):
+        with self.lock:
+            return next(self.__ids)
+
+
+database = FakeDatabase()
+
+
+class FakeError(Exception):
+    def __init__(self, msg=None, errno=None):
+        super().__init__(msg)
+        self.errno = errno
+
+
+class FakeConnection:
+    '''
+    Connection returned by the fake mysql.connector.connect.
+    '''
+
+    def __init__(self, **config):
+        self.last_insert_id = 0
+        self.closed = False
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self)
+
+    def is_connected(self):
+        return not self.closed
+
+    def ping(self, reconnect=False, attempts=1, delay=0):
+        if self.closed:
+            raise FakeError('Connection not available.')
+
+    def reconnect(self, attempts=1, delay=0):
+        self.closed = False
+
+    def commit(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+class FakePoolError(FakeError):
+    pass
+
+
+class FakeConnectionPool:
+    '''
+    Pool returned by the fake mysql.connector.pooling.MySQLConnectionPool, closing one of its connections returns it to the pool.
+    '''
+
+    def __init__(self, pool_name=None, pool_size=5, **config):
+        self.__idle = [FakePooledConnection(self) for _ in range(pool_size)]
+        self.__lock = threading.Lock()
+
+    def get_connection(self):
+        with self.__lock:
+            if not self.__idle:
+                raise FakePoolError('Failed getting connection; pool exhausted')
+            connection = self.__idle.pop()
+        connection.reconnect()
+        return connection
+
+    def add_connection(self, connection):
+        with self.__lock:
+            self.__idle.append(connection)
+
+
+class FakePooledConnection(FakeConnection):
+
+    def __init__(self, pool):
+        super().__init__()
+        self.__pool = pool
+
+    def close(self):
+        self.__pool.add_connection(self)
+
+
+class FakeCursor:
+
+    def __init__(self, connection):
+        self.__connection = connection
+        self.__rows = []
+
+    def execute(self, operation, params=None):
+        database.call()
+        if operation.startswith('INSERT'):
+            # The id generated by an INSERT is kept by the session, i.e. the (pooled) connection that ran it
+            self.__connection.last_insert_id = params[0]
+        self.__rows = [(self.__connection.last_insert_id,)] if 'LAST_INSERT_ID' in operation else []
+
+    def fetchone(self):
+        return self.__rows[0] if self.__rows else None
+
+    def fetchall(self):
+        return list(self.__rows)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class Record:
+    pass
+
+
+class CalibrationExecutionHistory:
+    def create(self, camera_id, date, execution_date, is_monthly, config_parameters, ceh_stdout, ceh_stderr, created_by, modified_by, user):
+        history_entry = CalibrationExecutionHistory()
+        history_entry.id = None
+        history_entry.camera_id = camera_id
+        history_entry.date = date
+        history_entry.execution_date = execution_date
+        history_entry.is_monthly = is_monthly
+        history_entry.config_parameters = config_parameters
+        history_entry.ceh_stdout = ceh_stdout
+        history_entry.ceh_stderr = ceh_stderr
+        history_entry.user = user
+        return history_entry
+
+
+class CalibrationExecutionHistoryFactory:
+    def insert(self, history_entry, db):
+        history_entry.id = database.next_id()
+        # Through a cursor like the real factory, so LAST_INSERT_ID works on any connection wrapper
+        db.cursor().execute('INSERT INTO calibration_execution_history', (history_entry.id,))
+        with database.lock:
+            database.history.append(history_entry)
+        return True
+
+    def update(self, history_entry, db):
+        database.call()
+        return True
+
+    def getByCameraId(self, camera_id, db):
+        database.call()
+        return [history_entry for history_entry in database.history if history_entry.camera_id == camera_id]
+
+    def getByCameraIdForUser(self, camera_id, user, db):
+        database.call()
+        return [history_entry for history_entry in database.history if history_entry.camera_id == camera_id and history_entry.user == user]
+
+    def getList(self, db):
+        database.call()
+        return list(database.history)
+
+
+class Camera:
+    def create(self, id, code, a, b, c, d, modified_by, e):
+        camera = Camera()
+        camera.id = id
+        camera.code = code
+        camera.modified_by = modified_by
+        camera.active = 1
+        return camera
+
+
+class CameraFactory:
+    @staticmethod
+    def getListActiveCameras(db):
+        database.call()
+        return [camera for camera in database.cameras if camera.active]
+
+    @staticmethod
+    def getList(db):
+        database.call()
+        return list(database.cameras)
+
+    def getById(self, camera_id, db):
+        database.call()
+        return next((camera for camera in database.cameras if camera.id == camera_id), None)
+
+    def isCameraActive(self, camera_id, db):
+        database.call()
+        return any(camera.id == camera_id and camera.active for camera in database.cameras)
+
+
+class SystemConfiguration:
+    pass
+
+
+class SystemConfigurationFactory:
+    def getList(self, db):
+        database.call()
+        parameters = []
+        for name, value in database.system_configuration.items():
+            parameter = SystemConfiguration()
+            parameter.parameter_name = name
+            parameter.parameter_value = value
+            parameters.append(parameter)
+        return parameters
+
+    def getParameterValueByParameterName(self, parameter_name, db):
+        database.call()
+        return database.system_configuration.get(parameter_name)
+
+
+class UserConfigurationFactory:
+    def getDictForUser(self, user_id, db):
+        database.call()
+        return dict(database.user_configurations.get(user_id, {}))
+
+
+class CorePersonFactory:
+    def login(self, username, password, db):
+        database.call()
+        return 1
+
+
+class LogProgramFile:
+    def create(self, date, log_type, level, text, created_by, modified_by, user):
+        log_entry = LogProgramFile()
+        log_entry.date = date
+        log_entry.type = log_type
+        log_entry.level = level
+        log_entry.text = text.encode('utf-8')
+        return log_entry
+
+
+class LogProgramFileFactory:
+    def insert(self, log_entry, db):
+        database.call()
+        with database.lock:
+            database.logs.append(log_entry)
+            log_entry.id = len(database.logs)
+        return True
+
+    def getList(self, db):
+        database.call()
+        return list(database.logs)
+
+
+class IDLConfigFileHandler:
+    '''
+    Writes the user configuration to `{cp_tmp_user_config_path}/configuration_{key}.ini` like the real handler.
+    '''
+
+    @staticmethod
+    def __config_dir_path(sys_config):
+        return next(parameter.parameter_value for parameter in sys_config if parameter.parameter_name == 'cp_tmp_user_config_path')
+
+    def create(self, key, usr_config, sys_config):
+        config_dir_path = IDLConfigFileHandler.__config_dir_path(sys_config)
+        os.makedirs(config_dir_path, exist_ok=True)
+        with open(f'{config_dir_path}/configuration_{key}.ini', 'w') as f:
+            for name, value in sorted(usr_config.items()):
+                f.write(f'{name}={value}\n')
+        return json.dumps(usr_config)
+
+    def delete(self, key, sys_config):
+        try:
+            os.remove(f'{IDLConfigFileHandler.__config_dir_path(sys_config)}/configuration_{key}.ini')
+            return True
+        except OSError:
+            return False
+
+
+def _module(name, **attributes):
+    module = types.ModuleType(name)
+    module.__dict__.update(attributes)
+    sys.modules[name] = module
+    return module
+
+
+def install():
+    '''
+    Registers fake mysql.connector and PRISMA_SDK modules in sys.modules, they must be installed before ProcessCalibration is imported.
+    '''
+    pooling = _module('mysql.connector.pooling', MySQLConnectionPool=FakeConnectionPool, CNX_POOL_MAXSIZE=32)
+    errors = _module('mysql.connector.errors', Error=FakeError, PoolError=FakePoolError)
+    connector = _module('mysql.connector', connect=FakeConnection, Error=FakeError, errorcode=types.SimpleNamespace(ER_ACCESS_DENIED_ERROR=1045, ER_BAD_DB_ERROR=1049), pooling=pooling, errors=errors)
+    _module('mysql', connector=connector)
+
+    simple_classes = {'UserConfiguration': Record, 'CorePerson': Record, 'CalibrationExecutionHistory': CalibrationExecutionHistory, 'Camera': Camera, 'SystemConfiguration': SystemConfiguration, 'LogProgramFile': LogProgramFile}
+    factories = {'UserConfigurationFactory': UserConfigurationFactory, 'CorePersonFactory': CorePersonFactory, 'CalibrationExecutionHistoryFactory': CalibrationExecutionHistoryFactory, 'CameraFactory': CameraFactory, 'IDLConfigFileHandler': IDLConfigFileHandler, 'SystemConfigurationFactory': SystemConfigurationFactory, 'LogProgramFileFactory': LogProgramFileFactory}
+    simple_class = _module('PRISMA_SDK.simpleClass', **{name: _module(f'PRISMA_SDK.simpleClass.{name}', **{name: cls}) for name, cls in simple_classes.items()})
+    _module('PRISMA_SDK', simpleClass=simple_class, **{name: _module(f'PRISMA_SDK.{name}', **{name: cls}) for name, cls in factories.items()})
@@ -0,0 +1,98 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+BENCHMARK = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmark', 'BenchmarkProcessCalibration.py')
+
+
+class TestBenchmark(unittest.TestCase):
+
+    @staticmethod
+    def run_benchmark(*args):
+        output = subprocess.run([sys.executable, BENCHMARK, '--cameras', '2', '--nights', '2', '--files', '3', '--failing', '1', '--runs', '1', '--json', *args], capture_output=True, text=True, check=True).stdout
+        return {result['scenario']: result for result in map(json.loads, output.splitlines())}
+
+    # Tests that every scenario runs bulkProcess end to end against the fake SDK and the fake IDL
+    def test_01_scenarios(self):
+        results = self.run_benchmark()
+        self.assertEqual(sorted(results), ['backfill', 'daily', 'month-end', 'retry'])
+        for scenario, jobs in (('daily', 2), ('month-end', 2), ('retry', 4)):
+            self.assertEqual(results[scenario]['jobs'], jobs)
+            self.assertEqual((results[scenario]['success'], results[scenario]['failure']), (1, 1))
+            self.assertGreater(results[scenario]['db_calls_per_camera'], 0)
+            self.assertEqual(results[scenario]['fs_calls_by_function']['spawn'], jobs)
+            # Every job reads back the id of its own history entry
+            self.assertEqual(results[scenario]['distinct_history_ids'], jobs)
+            # Every connection of the pool was returned at the end of the run
+            self.assertEqual(results[scenario]['db_pool']['in_use'], 0)
+        # Backfill of 2 nights: the monthly calibration of the failing camera is blocked by its failed daily calibrations
+        self.assertEqual(results['backfill']['jobs'], 5)
+        self.assertEqual((results['backfill']['success'], results['backfill']['failure'], results['backfill']['blocked']), (3, 2, 1))
+        # The month-end calibration links the captures of every night of the month
+        self.assertEqual(results['daily']['fs_calls_by_function']['symlink'], 2 * 3)
+        self.assertEqual(results['month-end']['fs_calls_by_function']['symlink'], 2 * 2 * 3)
+
+    # Tests the benchmark with IDL sessions and capture manifests
+    def test_02_idl_sessions(self):
+        result = self.run_benchmark('--scenario', 'daily', '--idl-sessions', '--staging', 'manifest')['daily']
+        self.assertEqual((result['success'], result['failure']), (1, 1))
+        self.assertNotIn('symlink', result['fs_calls_by_function'])
+
+    # Tests that a calibration that hangs is killed, with the processes it started, once its timeout expires
+    def test_03_timeout(self):
+        for args in ((), ('--idl-sessions',)):
+            start = time.monotonic()
+            result = self.run_benchmark('--scenario', 'daily', '--failing', '0', '--hanging', '1', '--idl-timeout', '1', *args)['daily']
+            # The hanging calibration leaves a child holding its output open, it would block for an hour if it survived
+            self.assertLess(time.monotonic() - start, 30)
+            self.assertEqual((result['success'], result['failure'], result['timeouts']), (1, 1, 1))
+
+    # Tests that only the head and tail of a long IDL output are kept in the history entries
+    def test_04_bounded_output(self):
+        for args in ((), ('--idl-sessions',)):
+            result = self.run_benchmark('--scenario', 'daily', '--failing', '0', '--idl-output-lines', '2000', *args)['daily']
+            self.assertEqual(result['success'], 2)
+            self.assertLess(result['history_bytes'], 2 * 300 * 50)
+
+    # Tests that hosts of a distributed run share the calibrations through the lease table, each one run by a single host
+    def test_05_distributed(self):
+        result = self.run_benchmark('--scenario', 'daily', '--cameras', '6', '--hosts', '3')['daily']
+        self.assertEqual(result['hosts'], 3)
+        self.assertEqual((result['jobs'], result['success'], result['failure']), (6, 5, 1))
+
+    # Tests that the plan of a run lists its jobs and their captures without leaving history entries or links behind, and skips up to date jobs
+    def test_06_plan(self):
+        first_run, second_run = (result for result in map(json.loads, subprocess.run([sys.executable, BENCHMARK, '--scenario', 'month-end', '--cameras', '3', '--nights', '2', '--files', '3', '--failing', '1', '--runs', '2', '--json', '--plan'], capture_output=True, text=True, check=True).stdout.splitlines()))
+        self.assertEqual((first_run['plan'], first_run['plan_files'], first_run['plan_history_rows']), ({'run': 3}, 3 * 2 * 3, 0))
+        self.assertEqual(first_run['fs_calls_by_function']['symlink'], 3 * 2 * 3)
+        self.assertEqual((second_run['plan'], second_run['plan_history_rows']), ({'run': 1, 'up_to_date': 2}, 0))
+
+    # Tests that importing ProcessCalibration doesn't read the configuration file, which is read on first use from any working directory
+    def test_07_lazy_config(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            config_path = f'{tmp_dir}/procedures_config.json'
+            with open(config_path, 'w') as f:
+                json.dump({'process_calibration': {'default_user': {}, 'db_config': {}, 'LOG_MESSAGE_PREFIX': '', 'db_connection_attempts': 1, 'max_parallel_jobs': 3}}, f)
+            code = 'import FakeSDK; FakeSDK.install(); import ProcessCalibration; print(ProcessCalibration.config_path); print(ProcessCalibration.max_parallel_jobs, ProcessCalibration.config_path)'
+            env = dict(os.environ, PYTHONPATH=os.pathsep.join((os.path.dirname(BENCHMARK), os.path.dirname(os.path.dirname(BENCHMARK)))), PRISMA_PROCEDURES_CONFIG=config_path)
+            output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True, cwd=tmp_dir, env=env).stdout
+        self.assertEqual(output.splitlines(), ['None', f'3 {config_path}'])
+
+    # Tests that the CPU time limit of IDL is left out of the command of the long-lived IDL sessions, and the memory limit kept
+    def test_08_idl_limits(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            config_path = f'{tmp_dir}/procedures_config.json'
+            with open(config_path, 'w') as f:
+                json.dump({'process_calibration': {'default_user': {}, 'db_config': {}, 'LOG_MESSAGE_PREFIX': '', 'db_connection_attempts': 1, 'idl_rlimit_cpu_seconds': 600, 'idl_rlimit_memory_mb': 2}}, f)
+            code = 'import FakeSDK; FakeSDK.install(); import ProcessCalibration; print(ProcessCalibration.idl_shell_command(\' -e "x"\')); print(ProcessCalibration.idl_shell_command(cpu_limit=False))'
+            env = dict(os.environ, PYTHONPATH=os.pathsep.join((os.path.dirname(BENCHMARK), os.path.dirname(os.path.dirname(BENCHMARK)))), PRISMA_PROCEDURES_CONFIG=config_path)
+            output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True, cwd=tmp_dir, env=env).stdout
+        self.assertEqual(output.splitlines(), ['ulimit -t 600; ulimit -v 2048; exec idl -e "x"', 'ulimit -v 2048; exec idl'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,146 @@
+import contextlib
+import io
+import threading
+import time
+import unittest
+from unittest import mock
+from BufferedLogWriter import BufferedLogWriter
+
+
+class LogProgramFile:
+    '''
+    Log entry created by the writer in place of PRISMA_SDK's LogProgramFile.
+    '''
+
+    def create(self, date, log_type, level, text, created_by, modified_by, user):
+        log_entry = LogProgramFile()
+        log_entry.text = text
+        return log_entry
+
+
+class LogTable:
+    '''
+    pr_log_program_file in place of PRISMA_SDK's LogProgramFileFactory: keeps the texts of the inserted entries, insert() raises for the texts in failing until they were tried once.
+    '''
+
+    def __init__(self):
+        self.texts = []
+        self.threads = set()
+        self.failing = set()
+        self.lock = threading.Lock()
+
+    def insert(self, log_entry, db):
+        with self.lock:
+            if log_entry.text in self.failing:
+                self.failing.discard(log_entry.text)
+                raise OSError('Lost connection to MySQL server')
+            self.texts.append(log_entry.text)
+            self.threads.add(threading.current_thread())
+        return True
+
+    def wait_for(self, n_texts, timeout=5):
+        deadline = time.monotonic() + timeout
+        while len(self.texts) < n_texts and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return list(self.texts)
+
+
+class TestBufferedLogWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.table = LogTable()
+        self.atexit = mock.patch('BufferedLogWriter.atexit').start()
+        mock.patch('BufferedLogWriter.lpf', LogProgramFile).start()
+        mock.patch('BufferedLogWriter.lpff', lambda: self.table).start()
+        # Errors of the flushes are printed
+        self.output = io.StringIO()
+        self.stdout = contextlib.redirect_stdout(self.output)
+        self.stdout.__enter__()
+
+    def tearDown(self):
+        self.stdout.__exit__(None, None, None)
+        mock.patch.stopall()
+
+    def log(self, writer, *texts):
+        for text in texts:
+            writer.log('INFO', 1, text, 1)
+
+    # Tests that entries are written in the order they were logged, once flush_size of them are queued
+    def test_01_size_flush(self):
+        writer = BufferedLogWriter(None, flush_size=3)
+        self.log(writer, 'a', 'b')
+        self.assertEqual(self.table.texts, [])
+        self.log(writer, 'c', 'd')
+        self.assertEqual(self.table.texts, ['a', 'b', 'c'])
+        writer.close()
+        self.assertEqual(self.table.texts, ['a', 'b', 'c', 'd'])
+
+    # Tests that the background thread writes the queued entries every flush_interval seconds
+    def test_02_interval_flush(self):
+        writer = BufferedLogWriter(None, flush_interval=0.05, flush_size=100)
+        self.log(writer, 'a', 'b')
+        self.assertEqual(self.table.wait_for(2), ['a', 'b'])
+        self.log(writer, 'c')
+        self.assertEqual(self.table.wait_for(3), ['a', 'b', 'c'])
+        writer.close()
+
+    # Tests that close() writes the queued entries and that the writer is closed at exit until it was closed
+    def test_03_close(self):
+        writer = BufferedLogWriter(None, flush_interval=3600, flush_size=100)
+        self.atexit.register.assert_called_once_with(writer.close)
+        self.log(writer, 'a', 'b')
+        writer.close()
+        self.assertEqual(self.table.texts, ['a', 'b'])
+        self.atexit.unregister.assert_called_once_with(writer.close)
+
+    # Tests that entries that couldn't be written are written by the next flush ahead of those logged since, and the background thread survives the error
+    def test_04_failed_insert(self):
+        writer = BufferedLogWriter(None, flush_size=3)
+        self.table.failing = {'b'}
+        self.log(writer, 'a', 'b', 'c')
+        self.assertEqual(self.table.texts, ['a'])
+        self.log(writer, 'd')
+        self.assertEqual(self.table.texts, ['a', 'b', 'c', 'd'])
+        self.assertIn('Unable to write log entries', self.output.getvalue())
+
+        self.table.failing = {'e', 'f'}
+        writer = BufferedLogWriter(None, flush_interval=0.05, flush_size=100)
+        self.log(writer, 'e')
+        self.assertEqual(self.table.wait_for(5), ['a', 'b', 'c', 'd', 'e'])
+        self.log(writer, 'f', 'g')
+        self.assertEqual(self.table.wait_for(7), ['a', 'b', 'c', 'd', 'e', 'f', 'g'])
+        writer.close()
+
+    # Tests that close() raises when the entries can't be written, leaving them to the atexit hook
+    def test_05_failed_close(self):
+        writer = BufferedLogWriter(None, flush_size=100)
+        self.table.failing = {'a'}
+        self.log(writer, 'a')
+        with self.assertRaises(OSError):
+            writer.close()
+        self.atexit.unregister.assert_not_called()
+        writer.close()
+        self.assertEqual(self.table.texts, ['a'])
+
+    # Tests that with a background thread a full queue is written by that thread, not by the thread that logged
+    def test_06_background_size_flush(self):
+        writer = BufferedLogWriter(None, flush_size=2, background=True)
+        self.log(writer, 'a', 'b')
+        self.assertEqual(self.table.wait_for(2), ['a', 'b'])
+        self.assertNotIn(threading.current_thread(), self.table.threads)
+        writer.close()
+
+    # Tests that without a background thread only the thread that created the writer writes, entries logged by other threads wait for it
+    def test_07_owner_thread_flush(self):
+        writer = BufferedLogWriter(None, flush_size=2)
+        worker = threading.Thread(target=self.log, args=(writer, 'a', 'b', 'c'))
+        worker.start()
+        worker.join()
+        self.assertEqual(self.table.texts, [])
+        self.log(writer, 'd')
+        self.assertEqual(self.table.texts, ['a', 'b', 'c', 'd'])
+        self.assertEqual(self.table.threads, {threading.current_thread()})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+from CalibrationBackfill import CalibrationBackfill
+
+
+class TestCalibrationBackfill(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.backfill = CalibrationBackfill(f'{self.tmp_dir}/calibration_backfill.sqlite')
+        self.cameras = [SimpleNamespace(id=2, code='ITA2', modified_by=1), SimpleNamespace(id=1, code='ITA1', modified_by=3)]
+
+    def tearDown(self):
+        self.backfill.close()
+        shutil.rmtree(self.tmp_dir)
+
+    # Tests the jobs of a backfill, their order and the dependencies of monthly jobs on daily jobs
+    def test_01_plan(self):
+        jobs, dependencies = CalibrationBackfill.plan(self.cameras, '20230227', '20230302', today=datetime(2023, 3, 20))
+        self.assertEqual(jobs[:4], [(1, 3, '20230302', 0), (2, 1, '20230302', 0), (1, 3, '20230301', 0), (2, 1, '20230301', 0)])
+        # February is over, March isn't: only February gets a monthly job, right before its last night
+        self.assertEqual(jobs[4:8], [(1, 3, '202302', 1), (2, 1, '202302', 1), (1, 3, '20230228', 0), (2, 1, '20230228', 0)])
+        self.assertEqual(len(jobs), 10)
+        self.assertEqual(dependencies, {(1, 3, '202302', 1): [(1, 3, '20230228', 0), (1, 3, '20230227', 0)], (2, 1, '202302', 1): [(2, 1, '20230228', 0), (2, 1, '20230227', 0)]})
+        jobs, dependencies = CalibrationBackfill.plan(self.cameras, '20230227', '20230302', monthly=False, today=datetime(2023, 3, 20))
+        self.assertEqual((len(jobs), dependencies), (8, {}))
+
+    # Tests that a backfill resumes from the jobs it already completed, unless restarted
+    def test_02_resume(self):
+        backfill_id = CalibrationBackfill.backfill_id('20230227', '20230302', ['ITA2', 'ITA1'])
+        self.assertEqual(backfill_id, CalibrationBackfill.backfill_id('20230227', '20230302', ['ITA1', 'ITA2']))
+        jobs, _ = CalibrationBackfill.plan(self.cameras, '20230227', '20230302', today=datetime(2023, 3, 20))
+        self.assertEqual(self.backfill.begin(backfill_id, jobs), set())
+        self.backfill.record(backfill_id, jobs[0], 'done')
+        self.backfill.record(backfill_id, jobs[1], 'failed')
+        self.backfill.record(backfill_id, jobs[4], 'blocked')
+        self.assertEqual(self.backfill.progress(backfill_id), {'done': 1, 'failed': 1, 'blocked': 1, 'pending': 7})
+        self.assertEqual(self.backfill.begin(backfill_id, jobs), {jobs[0]})
+        self.assertEqual(self.backfill.begin(backfill_id, jobs, restart=True), set())
+        self.assertEqual(self.backfill.progress(backfill_id), {'pending': 10})
+
+    # Tests that jobs recorded without begin(), as done by the daemon, are looked up one by one
+    def test_03_is_done(self):
+        job = (1, 3, '20230330', 0)
+        self.assertFalse(self.backfill.is_done('daemon', job))
+        self.backfill.record('daemon', job, 'failed')
+        self.assertFalse(self.backfill.is_done('daemon', job))
+        self.backfill.record('daemon', job, 'done')
+        self.assertTrue(self.backfill.is_done('daemon', job))
+        self.assertFalse(self.backfill.is_done('daemon', (2, 1, '20230330', 0)))
+        self.assertEqual(self.backfill.progress('daemon'), {'done': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import os
+import shutil
+import tempfile
+import unittest
+from CalibrationFingerprint import CalibrationFingerprint
+
+
+class TestCalibrationFingerprint(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.solution_path = f'{self.tmp_dir}/ITA1_20230330_astro_solution.txt'
+        self.captures = [{'filename': 'ITA1_20230330T210000_UT-0.fit.gz', 'path': '/a', 'night': '20230330', 'size': 10, 'mtime_ns': 1},
+                         {'filename': 'ITA1_20230331T010000_UT-0.fit.gz', 'path': '/b', 'night': '20230330', 'size': 20, 'mtime_ns': 2}]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def fingerprint(self, captures=None, usr_config=None, sys_parameters=None, is_monthly=0):
+        return CalibrationFingerprint.compute('ITA1', '20230330', is_monthly, self.captures if captures is None else captures, {'fwhm': 3} if usr_config is None else usr_config, {'root_path': '/root'} if sys_parameters is None else sys_parameters)
+
+    # Tests that the fingerprint changes with every input but not with the order of the captures
+    def test_01_compute(self):
+        fingerprint = self.fingerprint()
+        self.assertEqual(fingerprint, self.fingerprint(captures=list(reversed(self.captures))))
+        self.assertNotEqual(fingerprint, self.fingerprint(captures=[dict(self.captures[0], mtime_ns=5), self.captures[1]]))
+        self.assertNotEqual(fingerprint, self.fingerprint(captures=self.captures[:1]))
+        self.assertNotEqual(fingerprint, self.fingerprint(usr_config={'fwhm': 4}))
+        self.assertNotEqual(fingerprint, self.fingerprint(sys_parameters={'root_path': '/other'}))
+        self.assertNotEqual(fingerprint, self.fingerprint(is_monthly=1))
+
+    # Tests that a solution is up to date only if it exists and its sidecar holds the same fingerprint
+    def test_02_sidecar(self):
+        fingerprint = self.fingerprint()
+        self.assertFalse(CalibrationFingerprint.is_up_to_date(self.solution_path, fingerprint))
+        CalibrationFingerprint.write(self.solution_path, fingerprint)
+        self.assertTrue(os.path.exists(f'{self.tmp_dir}/ITA1_20230330_astro_solution.fingerprint'))
+        # Sidecar without solution
+        self.assertFalse(CalibrationFingerprint.is_up_to_date(self.solution_path, fingerprint))
+        open(self.solution_path, 'w').close()
+        self.assertTrue(CalibrationFingerprint.is_up_to_date(self.solution_path, fingerprint))
+        self.assertFalse(CalibrationFingerprint.is_up_to_date(self.solution_path, self.fingerprint(usr_config={})))
+        CalibrationFingerprint.remove(self.solution_path)
+        CalibrationFingerprint.remove(self.solution_path)
+        self.assertFalse(CalibrationFingerprint.is_up_to_date(self.solution_path, fingerprint))
+        self.assertEqual(os.listdir(self.tmp_dir), ['ITA1_20230330_astro_solution.txt'])
+
+
+if __name__ == '__main__':
+    unittest.main()
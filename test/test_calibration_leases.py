@@ -0,0 +1,97 @@
+import multiprocessing
+import shutil
+import sqlite3
+import tempfile
+import time
+import unittest
+from CalibrationLeases import CalibrationLeases
+
+JOBS = [(camera_id, camera_id % 3 + 1, '20230330', 1) for camera_id in range(1, 41)]
+
+
+def connect(path):
+    return sqlite3.connect(path, timeout=30, check_same_thread=False)
+
+
+def claim_jobs(path, owner, results):
+    '''
+    Claims and runs every free job of JOBS, like a host of a distributed run.
+    '''
+    leases = CalibrationLeases(lambda: connect(path), sqlite3, owner, lease_seconds=30, heartbeat_seconds=0.05)
+    since = time.time()
+    for job in JOBS:
+        if leases.claim(job, since):
+            time.sleep(0.01)
+            results.put((owner, job, leases.release(job, 'done')))
+    leases.close()
+
+
+class TestCalibrationLeases(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.path = f'{self.tmp_dir}/leases.sqlite'
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def __leases(self, owner, lease_seconds=30, heartbeat_seconds=60):
+        return CalibrationLeases(lambda: connect(self.path), sqlite3, owner, lease_seconds, heartbeat_seconds)
+
+    # Tests that several processes sharing the lease table run every job exactly once
+    def test_01_claim_multiprocess(self):
+        results = multiprocessing.Queue()
+        processes = [multiprocessing.Process(target=claim_jobs, args=(self.path, f'host{i}', results)) for i in range(4)]
+        for process in processes:
+            process.start()
+        claimed = [results.get(timeout=60) for _ in JOBS]
+        for process in processes:
+            process.join(60)
+        self.assertEqual(sorted(job for _, job, _ in claimed), JOBS)
+        self.assertTrue(all(released for _, _, released in claimed))
+
+    # Tests that the job of an owner whose lease expired can be claimed by another one, and that the first owner can't release it anymore
+    def test_02_expired(self):
+        crashed = self.__leases('crashed', lease_seconds=0.1)
+        other = self.__leases('other')
+        self.assertTrue(crashed.claim(JOBS[0]))
+        self.assertFalse(other.claim(JOBS[0]))
+        self.assertEqual(other.running('20230330'), 1)
+        time.sleep(0.2)
+        self.assertEqual(other.expired('20230330'), [JOBS[0]])
+        self.assertTrue(other.claim(JOBS[0]))
+        self.assertFalse(crashed.release(JOBS[0], 'failed'))
+        self.assertTrue(other.release(JOBS[0], 'done'))
+        self.assertEqual(other.running('20230330'), 0)
+        crashed.close()
+        other.close()
+
+    # Tests that heartbeats keep a lease from expiring
+    def test_03_heartbeat(self):
+        owner = self.__leases('owner', lease_seconds=0.2, heartbeat_seconds=0.05)
+        other = self.__leases('other')
+        self.assertTrue(owner.claim(JOBS[0]))
+        time.sleep(0.5)
+        self.assertEqual(other.expired(), [])
+        owner.close()
+        time.sleep(0.3)
+        self.assertEqual(other.expired(), [JOBS[0]])
+        other.close()
+
+    # Tests that failed jobs are free again for later runs, done jobs only with force
+    def test_04_claim_finished(self):
+        leases = self.__leases('owner')
+        self.assertTrue(leases.claim(JOBS[0]))
+        leases.release(JOBS[0], 'failed')
+        self.assertTrue(leases.claim(JOBS[1]))
+        leases.release(JOBS[1], 'done')
+        since = time.time()
+        self.assertFalse(leases.claim(JOBS[0], since - 60))
+        self.assertTrue(leases.claim(JOBS[0], since))
+        self.assertFalse(leases.claim(JOBS[1], since))
+        self.assertTrue(leases.claim(JOBS[1], since, force=True))
+        leases.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
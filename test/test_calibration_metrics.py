@@ -0,0 +1,85 @@
+import json
+import shutil
+import tempfile
+import time
+import unittest
+from CalibrationMetrics import CalibrationMetrics
+
+
+class TestCalibrationMetrics(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    # Tests that stages are timed one after another and that a stage begun twice accumulates
+    def test_01_stages(self):
+        metrics = CalibrationMetrics()
+        job = metrics.job(3, '20230330', 0)
+        job.begin('config_fetch')
+        time.sleep(0.01)
+        job.begin('idl')
+        time.sleep(0.02)
+        job.begin('config_fetch')
+        time.sleep(0.01)
+        job.count('captures', 4)
+        job.finish('success')
+        self.assertEqual(list(job.stages), ['config_fetch', 'idl'])
+        self.assertGreaterEqual(job.stages['config_fetch'], 0.02)
+        self.assertGreaterEqual(job.stages['idl'], 0.02)
+        self.assertEqual(job.counts, {'captures': 4})
+        self.assertEqual(job.outcome, 'success')
+
+    # Tests nearest rank percentiles and the summary of a stage across jobs
+    def test_02_summary(self):
+        self.assertEqual(CalibrationMetrics.percentile([5, 1, 4, 2, 3], 50), 3)
+        self.assertEqual(CalibrationMetrics.percentile(list(range(1, 21)), 95), 19)
+        metrics = CalibrationMetrics()
+        for i in range(4):
+            job = metrics.job(i, '20230330', 0)
+            job.stages['idl'] = i + 1.0
+            job.finish('success' if i else 'failure')
+        self.assertEqual(metrics.stage_summary(), {'idl': {'count': 4, 'sum': 10.0, 'p50': 2.0, 'p95': 4.0}})
+        self.assertIn('4 job(s): 1 failure, 3 success', metrics.summary_lines()[0])
+
+    # Tests the JSON lines and Prometheus exports
+    def test_03_export(self):
+        metrics = CalibrationMetrics()
+        job = metrics.job(3, '20230330', 1)
+        job.stages['idl'] = 2.5
+        job.count('files_staged', 7)
+        job.finish('success')
+        metrics.run.begin('calibration')
+        metrics.run.end()
+        metrics.write_jsonl(f'{self.tmp_dir}/metrics.jsonl')
+        metrics.write_jsonl(f'{self.tmp_dir}/metrics.jsonl')
+        with open(f'{self.tmp_dir}/metrics.jsonl') as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual([line['kind'] for line in lines], ['job', 'run', 'job', 'run'])
+        self.assertEqual(lines[0]['camera_id'], 3)
+        self.assertEqual(lines[0]['stages'], {'idl': 2.5})
+        metrics.write_prometheus(f'{self.tmp_dir}/metrics.prom')
+        with open(f'{self.tmp_dir}/metrics.prom') as f:
+            prometheus = f.read()
+        self.assertIn('calibration_stage_duration_seconds_sum{stage="idl"} 2.5', prometheus)
+        self.assertIn('calibration_jobs{outcome="success"} 1', prometheus)
+        self.assertIn('calibration_job_count_total{name="files_staged"} 7', prometheus)
+
+    # Tests that take_finished() hands over the finished jobs only, and forgets them
+    def test_04_take_finished(self):
+        metrics = CalibrationMetrics()
+        for i in range(3):
+            metrics.job(i, '20230330', 0)
+        for job in metrics.jobs()[:2]:
+            job.finish('success')
+        finished = metrics.take_finished()
+        self.assertIs(finished.run, metrics.run)
+        self.assertEqual([job.camera_id for job in finished.jobs()], [0, 1])
+        self.assertEqual([job.camera_id for job in metrics.jobs()], [2])
+        self.assertEqual(metrics.take_finished().jobs(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from CalibrationRetryQueue import CalibrationRetryQueue
+
+
+class TestCalibrationRetryQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.queue = CalibrationRetryQueue(f'{self.tmp_dir}/failed_calibrations.sqlite', backoff_seconds=60, lease_seconds=600)
+
+    def tearDown(self):
+        self.queue.close()
+        shutil.rmtree(self.tmp_dir)
+
+    # Tests that failed calibrations only become eligible after their backoff
+    def test_01_backoff(self):
+        self.queue.add(3, 1, '20230330', 0)
+        self.assertEqual(self.queue.claim(), [])
+        claimed = self.queue.claim(now=time.time() + 61)
+        self.assertEqual([(c['camera_id'], c['user_id'], c['date'], c['attempts']) for c in claimed], [(3, 1, '20230330', 1)])
+        self.assertTrue(self.queue.fail(claimed[0], max_attempts=3))
+        # Second attempt waits twice as long
+        self.assertEqual(self.queue.claim(now=time.time() + 61), [])
+        self.assertEqual(len(self.queue.claim(now=time.time() + 121)), 1)
+
+    # Tests that a claimed entry isn't handed out again until its lease expires
+    def test_02_claim_is_exclusive(self):
+        self.queue.add(3, 1, '20230330', 0)
+        now = time.time() + 61
+        self.assertEqual(len(self.queue.claim(now=now)), 1)
+        self.assertEqual(self.queue.claim(now=now), [])
+        self.assertEqual(len(self.queue.claim(now=now + 601)), 1)
+
+    # Tests that entries are removed on success and after max_attempts failures
+    def test_03_complete_and_drop(self):
+        self.queue.add(3, 1, '20230330', 0)
+        self.queue.add(4, 1, '20230330', 0)
+        claimed = self.queue.claim(now=time.time() + 61)
+        self.queue.complete(claimed[0])
+        self.assertFalse(self.queue.fail(claimed[1], max_attempts=2))
+        self.assertEqual(self.queue.count(), 0)
+
+    # Tests that failed_calibrations.json is moved into the queue
+    def test_04_migrate_json(self):
+        json_path = f'{self.tmp_dir}/failed_calibrations.json'
+        with open(json_path, 'w') as f:
+            json.dump({'20230331': {'is_monthly': 1, 'camera_data': [[3, 1], [4, 2]], 'attempts': 2}}, f)
+        self.assertEqual(self.queue.migrate_json(json_path), 2)
+        self.assertFalse(os.path.exists(json_path))
+        self.assertEqual(self.queue.migrate_json(json_path), 0)
+        claimed = self.queue.claim()
+        self.assertEqual([(c['camera_id'], c['user_id'], c['is_monthly'], c['attempts']) for c in claimed], [(3, 1, 1, 2), (4, 2, 1, 2)])
+
+    # Tests that count() with eligible_only leaves out the entries in backoff and the claimed ones
+    def test_05_count_eligible(self):
+        self.queue.add(3, 1, '20230330', 0)
+        self.queue.add(4, 1, '20230330', 0)
+        now = time.time() + 61
+        self.assertEqual((self.queue.count(), self.queue.count(eligible_only=True), self.queue.count(eligible_only=True, now=now)), (2, 0, 2))
+        self.queue.claim(now=now)
+        self.assertEqual((self.queue.count(), self.queue.count(eligible_only=True, now=now)), (2, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import types
+import unittest
+from unittest import mock
+from CalibrationRunContext import CalibrationRunContext
+
+
+class Tables:
+    '''
+    SystemConfiguration, Camera and UserConfiguration tables in place of PRISMA_SDK's factories, counting the queries made to them.
+    '''
+
+    def __init__(self):
+        self.queries = 0
+        self.sys_config = [types.SimpleNamespace(parameter_name='cp_dir_captures', parameter_value='/captures')]
+        self.cameras = [types.SimpleNamespace(id=1, code='ITCP01', modified_by=10), types.SimpleNamespace(id=2, code='ITCP02', modified_by=20)]
+        self.user_configs = {10: {'fov': 1}, 20: {'fov': 2}}
+
+    def getList(self, db):
+        self.queries += 1
+        return list(self.sys_config)
+
+    def getListActiveCameras(self, db):
+        self.queries += 1
+        return list(self.cameras)
+
+    def getById(self, camera_id, db):
+        self.queries += 1
+        return types.SimpleNamespace(id=camera_id, code=f'ITCP{camera_id:02d}', modified_by=None)
+
+    def getDictForUser(self, user_id, db):
+        self.queries += 1
+        return dict(self.user_configs[user_id])
+
+
+class TestCalibrationRunContext(unittest.TestCase):
+
+    def setUp(self):
+        self.tables = Tables()
+        # CameraFactory.getListActiveCameras is called on the class, the other queries on an instance
+        factory = mock.Mock(return_value=self.tables, getListActiveCameras=self.tables.getListActiveCameras)
+        for name in ('SystemConfigurationFactory', 'CameraFactory', 'UserConfigurationFactory'):
+            mock.patch(f'CalibrationRunContext.{name}', types.SimpleNamespace(**{name: factory})).start()
+        self.context = CalibrationRunContext()
+
+    def tearDown(self):
+        mock.patch.stopall()
+
+    # Tests that load() fetches everything a run needs once, and that cached values are not fetched again
+    def test_01_cache(self):
+        self.context.load(None)
+        self.assertEqual(self.tables.queries, 4)
+        self.assertEqual(self.context.sys_parameter('cp_dir_captures', None), '/captures')
+        self.assertIsNone(self.context.sys_parameter('cp_tmp_user_config_path', None))
+        self.assertTrue(self.context.is_camera_active(2, None))
+        self.assertFalse(self.context.is_camera_active(3, None))
+        self.assertEqual(self.context.camera(1, None).code, 'ITCP01')
+        self.assertEqual(self.context.user_config(20, None), {'fov': 2})
+        self.assertEqual(self.tables.queries, 4)
+        # A camera that isn't active is fetched on first use and kept
+        self.assertEqual(self.context.camera(3, None).code, 'ITCP03')
+        self.context.camera(3, None)
+        self.assertEqual(self.tables.queries, 5)
+
+    # Tests that invalidate() drops the cached values, which are fetched again on next use
+    def test_02_invalidate(self):
+        self.context.load(None)
+        self.tables.cameras.pop()
+        self.tables.user_configs[10] = {'fov': 3}
+        self.assertTrue(self.context.is_camera_active(2, None))
+        self.context.invalidate()
+        self.assertFalse(self.context.is_camera_active(2, None))
+        self.assertEqual(self.context.user_config(10, None), {'fov': 3})
+        self.assertEqual(self.tables.queries, 4 + 2)
+
+    # Tests that user_config() returns a copy, so a job changing its configuration doesn't change the one of the next jobs
+    def test_03_user_config_copy(self):
+        usr_config = self.context.user_config(10, None)
+        usr_config['capture_manifest'] = '/tmp/manifest.txt'
+        self.assertEqual(self.context.user_config(10, None), {'fov': 1})
+        self.assertIsNot(self.context.user_config(10, None), self.context.user_config(10, None))
+        self.assertEqual(self.tables.queries, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
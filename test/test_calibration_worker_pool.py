@@ -0,0 +1,110 @@
+import contextlib
+import io
+import threading
+import time
+import unittest
+from CalibrationWorkerPool import CalibrationWorkerPool
+
+
+class TestCalibrationWorkerPool(unittest.TestCase):
+
+    # Tests that run() yields a result for every job, on worker threads with their own connection
+    def test_01_run(self):
+        connections = []
+
+        def connect_db():
+            connections.append(object())
+            return connections[-1]
+        pool = CalibrationWorkerPool(3, 'caller_db', connect_db)
+        results = dict(pool.run(range(10), lambda job, db: (job * 2, db)))
+        self.assertEqual(sorted(result for result, _ in results.values()), [job * 2 for job in range(10)])
+        self.assertNotIn('caller_db', [db for _, db in results.values()])
+        self.assertLessEqual(len(connections), 3)
+
+    # Tests that run_graph() starts a job after its dependencies, in the order of jobs
+    def test_02_run_graph_order(self):
+        started = []
+        pool = CalibrationWorkerPool(1, 'caller_db', None)
+        jobs = ['month_b', 'b2', 'b1', 'month_a', 'a2', 'a1']
+        dependencies = {'month_b': ['b1', 'b2'], 'month_a': ['a1', 'a2', 'a0']}
+        results = list(pool.run_graph(jobs, lambda job, db: started.append(job) or True, dependencies))
+        self.assertEqual(started, ['b2', 'b1', 'month_b', 'a2', 'a1', 'month_a'])
+        self.assertEqual([job for job, _ in results], started)
+
+    # Tests that jobs depending on a failed job are yielded with result None without running
+    def test_03_run_graph_blocked(self):
+        started = []
+        lock = threading.Lock()
+
+        def job_function(job, db):
+            time.sleep(0.01)
+            with lock:
+                started.append(job)
+            return job != 'b1'
+        pool = CalibrationWorkerPool(2, None, lambda: 'worker_db')
+        jobs = ['total', 'month_b', 'b2', 'b1', 'month_a', 'a2', 'a1']
+        dependencies = {'total': ['month_a', 'month_b'], 'month_b': ['b1', 'b2'], 'month_a': ['a1', 'a2']}
+        results = dict(pool.run_graph(jobs, job_function, dependencies))
+        self.assertEqual(results, {'b2': True, 'b1': False, 'month_b': None, 'total': None, 'a2': True, 'a1': True, 'month_a': True})
+        self.assertNotIn('month_b', started)
+        self.assertNotIn('total', started)
+
+    # Tests that run_stream() runs the jobs returned by next_jobs() as they come and drops those not started when it stops
+    def test_04_run_stream(self):
+        for max_workers in (1, 2):
+            batches = [['a', 'b'], [], ['c', 'd', 'e']]
+            calls = []
+
+            def next_jobs():
+                calls.append(len(calls))
+                if batches:
+                    return batches.pop(0)
+                return None
+            pool = CalibrationWorkerPool(max_workers, 'caller_db', lambda: 'worker_db')
+            results = dict(pool.run_stream(next_jobs, lambda job, db: job.upper(), 0.01))
+            if max_workers == 1:
+                self.assertEqual(results, {'a': 'A', 'b': 'B', 'c': 'C'})
+            else:
+                # e never starts: at most two jobs run when next_jobs() returns None
+                self.assertTrue({'a', 'b', 'c'} <= set(results) <= {'a', 'b', 'c', 'd'})
+                self.assertEqual(results['c'], 'C')
+
+    # Tests that a job whose worker can't open a connection gets None, and that the next job of that worker tries again
+    def test_05_connection_failure(self):
+        attempts = []
+
+        def connect_db():
+            attempts.append(None)
+            return None if len(attempts) == 1 else 'worker_db'
+        pool = CalibrationWorkerPool(2, 'caller_db', connect_db)
+        results = [db for _, db in pool.run(range(2), lambda job, db: time.sleep(0.05) or db)]
+        self.assertEqual(sorted(results, key=str), [None, 'worker_db'])
+        self.assertEqual([db for _, db in pool.run(range(4), lambda job, db: db)], ['worker_db'] * 4)
+
+    # Tests that a job that raises is yielded with error_result without stopping the others, and blocks the jobs depending on it
+    def test_06_job_error(self):
+        def job_function(job, db):
+            if job == 0:
+                raise RuntimeError('IDL vanished')
+            return 'success'
+        with contextlib.redirect_stderr(io.StringIO()) as stderr:
+            for max_workers in (1, 2):
+                pool = CalibrationWorkerPool(max_workers, 'caller_db', lambda: 'worker_db')
+                results = dict(pool.run(range(10), job_function, error_result='error'))
+                self.assertEqual(results, {job: 'error' if job == 0 else 'success' for job in range(10)})
+                results = dict(pool.run_graph([0, 1, 'month'], job_function, {'month': [0, 1]}, error_result=False))
+                self.assertEqual(results, {0: False, 1: 'success', 'month': None})
+        self.assertIn('RuntimeError: IDL vanished', stderr.getvalue())
+
+    # Tests that the jobs not started yet are cancelled when the caller stops iterating
+    def test_07_cancel(self):
+        started = []
+        pool = CalibrationWorkerPool(2, 'caller_db', lambda: 'worker_db')
+        results = pool.run(range(10), lambda job, db: started.append(job) or time.sleep(0.05))
+        next(results)
+        results.close()
+        self.assertLess(len(started), 10)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import gzip
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from CaptureCache import CaptureCache
+
+
+class TestCaptureCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.cache = CaptureCache(f'{self.tmp_dir}/cache', grace_seconds=0)
+        self.captures = [self.__capture(f'ITCP01_20230330T2{i}0000_UT-0.fit.gz', b'SIMPLE  =                    T' * 100) for i in range(3)]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def __capture(self, filename, content):
+        path = f'{self.tmp_dir}/root/ITCP01/ITCP01_20230330/captures/{filename}'
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(gzip.compress(content) if filename.endswith('.gz') else content)
+        stat = os.stat(path)
+        return {'filename': filename, 'path': path, 'night': '20230330', 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    # Tests that captures are decompressed once and reused afterwards
+    def test_01_stage(self):
+        staged, n_decompressed = self.cache.stage(self.captures)
+        self.assertEqual(n_decompressed, 3)
+        self.assertEqual([capture['filename'] for capture in staged], [capture['filename'][:-3] for capture in self.captures])
+        with open(staged[0]['path'], 'rb') as f:
+            self.assertEqual(f.read(), b'SIMPLE  =                    T' * 100)
+        self.assertEqual(self.cache.stage(self.captures), (staged, 0))
+
+    # Tests that a capture that changed is decompressed again
+    def test_02_stage_modified_capture(self):
+        self.cache.stage(self.captures)
+        modified = self.__capture(self.captures[0]['filename'], b'modified')
+        modified['mtime_ns'] += 1
+        os.utime(modified['path'], ns=(modified['mtime_ns'], modified['mtime_ns']))
+        staged, n_decompressed = self.cache.stage([modified] + self.captures[1:])
+        self.assertEqual(n_decompressed, 1)
+        with open(staged[0]['path'], 'rb') as f:
+            self.assertEqual(f.read(), b'modified')
+
+    # Tests that uncompressed and corrupt captures are staged unchanged
+    def test_03_stage_uncompressed_and_corrupt(self):
+        uncompressed = self.__capture('ITCP01_20230331T010000_UT-0.fit', b'SIMPLE')
+        corrupt = self.__capture('ITCP01_20230331T020000_UT-0.fit', b'not gzip')
+        corrupt_gz = dict(corrupt, filename=f'{corrupt["filename"]}.gz')
+        staged, n_decompressed = self.cache.stage([uncompressed, corrupt_gz])
+        self.assertEqual(staged, [uncompressed, corrupt_gz])
+        self.assertEqual(n_decompressed, 1)
+
+    # Tests that the copies used least recently are evicted first, except those used within the grace period
+    def test_04_evict(self):
+        staged, _ = self.cache.stage(self.captures)
+        size = os.path.getsize(staged[0]['path'])
+        now_ns = time.time_ns()
+        for i, capture in enumerate(staged):
+            os.utime(capture['path'], ns=(now_ns - (3 - i) * 10 ** 9, self.captures[i]['mtime_ns']))
+        self.cache.stage(self.captures[:1])
+        self.assertEqual(self.cache.evict(2 * size), 1)
+        self.assertEqual([os.path.exists(capture['path']) for capture in staged], [True, False, True])
+        self.cache.grace_seconds = 3600
+        self.assertEqual(self.cache.evict(0), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+from CaptureIndex import CaptureIndex
+
+
+class TestCaptureIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.root_path = f'{self.tmp_dir}/root'
+        self.index = CaptureIndex(f'{self.tmp_dir}/capture_index.sqlite')
+
+    def tearDown(self):
+        self.index.close()
+        shutil.rmtree(self.tmp_dir)
+
+    def add_capture(self, folder_date, observation_time):
+        captures_path = f'{self.root_path}/ITCP01/ITCP01_{folder_date}/captures'
+        os.makedirs(captures_path, exist_ok=True)
+        filename = f'ITCP01_{observation_time}_UT-0.fit.gz'
+        with open(f'{captures_path}/{filename}', 'w') as f:
+            f.write('capture')
+        return filename
+
+    # Tests that captures taken before 12:00 belong to the previous night
+    def test_01_captures_by_night(self):
+        evening = self.add_capture('20230330', '20230330T213000')
+        morning = self.add_capture('20230331', '20230331T041500')
+        next_evening = self.add_capture('20230331', '20230331T220000')
+        self.index.refresh('ITCP01', self.root_path)
+        self.assertEqual([c['filename'] for c in self.index.captures('ITCP01', '20230330')], [evening, morning])
+        self.assertEqual([c['filename'] for c in self.index.captures('ITCP01', '20230331')], [next_evening])
+        self.assertEqual(len(self.index.captures('ITCP01', '202303')), 3)
+        self.assertEqual(self.index.captures('ITCP01', '202304'), [])
+
+    # Tests that refresh picks up new and deleted captures
+    def test_02_refresh(self):
+        self.add_capture('20230330', '20230330T213000')
+        self.index.refresh('ITCP01', self.root_path)
+        new_capture = self.add_capture('20230330', '20230330T233000')
+        # Folder mtimes have a coarse resolution on some filesystems
+        os.utime(f'{self.root_path}/ITCP01/ITCP01_20230330/captures', ns=(0, 0))
+        self.index.refresh('ITCP01', self.root_path)
+        self.assertIn(new_capture, [c['filename'] for c in self.index.captures('ITCP01', '20230330')])
+        shutil.rmtree(f'{self.root_path}/ITCP01/ITCP01_20230330')
+        self.index.refresh('ITCP01', self.root_path)
+        self.assertEqual(self.index.captures('ITCP01', '20230330'), [])
+
+    # Tests that rebuild indexes every camera folder
+    def test_03_rebuild(self):
+        self.add_capture('20230330', '20230330T213000')
+        self.assertEqual(self.index.rebuild(self.root_path), ['ITCP01'])
+        self.assertEqual(len(self.index.captures('ITCP01', '20230330')), 1)
+
+    # Tests that a refresh for a date only checks the folders of the nights around it, and lists the camera folder only when a folder was added or removed
+    def test_04_refresh_date(self):
+        self.add_capture('20230310', '20230310T213000')
+        self.add_capture('20230330', '20230330T213000')
+        self.index.refresh('ITCP01', self.root_path, '20230330')
+        self.assertEqual(len(self.index.captures('ITCP01', '20230330')), 1)
+        # The folder of another night is known but not indexed yet
+        self.assertEqual(self.index.captures('ITCP01', '20230310'), [])
+        morning = self.add_capture('20230331', '20230331T041500')
+        os.utime(f'{self.root_path}/ITCP01', ns=(0, 0))
+        stats = []
+        stat = os.stat
+        with mock.patch('CaptureIndex.os.stat', lambda path: stats.append(path) or stat(path)), mock.patch('CaptureIndex.os.scandir', wraps=os.scandir) as scandir:
+            self.index.refresh('ITCP01', self.root_path, '20230330')
+            self.assertIn(morning, [c['filename'] for c in self.index.captures('ITCP01', '20230330')])
+            self.assertNotIn(f'{self.root_path}/ITCP01/ITCP01_20230310/captures', stats)
+            self.assertIn(mock.call(f'{self.root_path}/ITCP01'), scandir.call_args_list)
+            scandir.reset_mock()
+            self.index.refresh('ITCP01', self.root_path, '20230330')
+            # Nothing changed: neither the camera folder nor a captures folder is listed
+            self.assertEqual(scandir.call_args_list, [])
+        self.index.refresh('ITCP01', self.root_path, '202303')
+        self.assertEqual(len(self.index.captures('ITCP01', '202303')), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import os
+import shutil
+import tempfile
+import unittest
+from CaptureStaging import CaptureStaging
+
+
+class TestCaptureStaging(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.captures = []
+        os.makedirs(f'{self.tmp_dir}/root')
+        for filename in ['ITCP01_20230330T213000_UT-0.fit.gz', 'ITCP01_20230331T041500_UT-0.fit.gz']:
+            with open(f'{self.tmp_dir}/root/{filename}', 'w') as f:
+                f.write('capture')
+            self.captures.append({'filename': filename, 'path': f'{self.tmp_dir}/root/{filename}'})
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    # Tests that only captures not linked yet are linked
+    def test_01_link_captures(self):
+        target_dir = f'{self.tmp_dir}/captures/ITCP01/202303'
+        self.assertEqual(CaptureStaging.link_captures(self.captures[:1], target_dir), 1)
+        self.assertEqual(CaptureStaging.link_captures(self.captures, target_dir), 1)
+        self.assertEqual(sorted(os.listdir(target_dir)), sorted(c['filename'] for c in self.captures))
+
+    # Tests that the link to a decompressed copy replaces the link to its capture
+    def test_02_link_captures_decompressed(self):
+        target_dir = f'{self.tmp_dir}/captures/ITCP01/202303'
+        CaptureStaging.link_captures(self.captures, target_dir)
+        decompressed = [dict(self.captures[0], filename=self.captures[0]['filename'][:-3])]
+        self.assertEqual(CaptureStaging.link_captures(decompressed, target_dir), 1)
+        self.assertEqual(sorted(os.listdir(target_dir)), sorted([decompressed[0]['filename'], self.captures[1]['filename']]))
+
+    # Tests that the manifest is only rewritten when its content changes
+    def test_03_write_manifest(self):
+        manifest_path = f'{self.tmp_dir}/captures/ITCP01/20230330.manifest'
+        self.assertTrue(CaptureStaging.write_manifest(self.captures, manifest_path))
+        self.assertFalse(CaptureStaging.write_manifest(self.captures, manifest_path))
+        with open(manifest_path) as f:
+            self.assertEqual(f.read().splitlines(), [c['path'] for c in self.captures])
+
+    # Tests that garbage collection removes dangling links and empty folders only
+    def test_04_collect_garbage(self):
+        target_dir = f'{self.tmp_dir}/captures/ITCP01/202303'
+        CaptureStaging.link_captures(self.captures, target_dir)
+        os.remove(self.captures[0]['path'])
+        self.assertEqual(CaptureStaging.collect_garbage(f'{self.tmp_dir}/captures'), 1)
+        self.assertEqual(os.listdir(target_dir), [self.captures[1]['filename']])
+        self.assertEqual(CaptureStaging.collect_garbage(f'{self.tmp_dir}/captures', max_age_days=-1), 1)
+        self.assertEqual(os.listdir(f'{self.tmp_dir}/captures'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
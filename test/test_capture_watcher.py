@@ -0,0 +1,56 @@
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from CaptureWatcher import CaptureWatcher, inotify_simple
+
+
+class TestCaptureWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        # Dawn after the night of 20230330 is 20230331 06:00, captures are complete 30 minutes later
+        self.dawn = datetime(2023, 3, 31, 6).timestamp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def __add_capture(self, camera_code, night, mtime, prefix=None):
+        captures_path = f'{self.tmp_dir}/{camera_code}/{prefix or camera_code}_{night}/captures'
+        os.makedirs(captures_path, exist_ok=True)
+        open(f'{captures_path}/{camera_code}_{night}T210000_UT-0.fit.gz', 'w').close()
+        os.utime(captures_path, (mtime, mtime))
+
+    # Tests that a night is complete once no capture arrived for quiet_seconds after dawn, and is reported once, whatever the prefix of its folder
+    def test_01_complete_nights_polling(self):
+        watcher = CaptureWatcher(self.tmp_dir, ['ITCP01', 'ITCP02'], quiet_seconds=1800, dawn_hour=6, use_inotify=False)
+        self.__add_capture('ITCP01', '20230330', self.dawn - 3600)
+        self.__add_capture('ITCP02', '20230330', self.dawn + 600, prefix='STATION')
+        self.__add_capture('ITCP02', '20230327', self.dawn - 4 * 86400)
+        self.assertEqual(watcher.complete_nights(self.dawn + 1799), [])
+        self.assertEqual(watcher.complete_nights(self.dawn + 1800), [('ITCP01', '20230330')])
+        self.assertEqual(watcher.complete_nights(self.dawn + 2400), [('ITCP02', '20230330')])
+        self.assertEqual(watcher.complete_nights(self.dawn + 86400), [])
+
+    # Tests that a night without captures folder is complete quiet_seconds after dawn
+    def test_02_is_complete(self):
+        watcher = CaptureWatcher(self.tmp_dir, ['ITCP01'], quiet_seconds=1800, dawn_hour=6, use_inotify=False)
+        self.assertFalse(watcher.is_complete('ITCP01', '20230330', self.dawn + 1799))
+        self.assertTrue(watcher.is_complete('ITCP01', '20230330', self.dawn + 1800))
+
+    # Tests that inotify notices night folders and captures created after the first scan
+    @unittest.skipIf(inotify_simple is None, 'inotify_simple is not installed')
+    def test_03_complete_nights_inotify(self):
+        os.makedirs(f'{self.tmp_dir}/ITCP01')
+        watcher = CaptureWatcher(self.tmp_dir, ['ITCP01'], quiet_seconds=0, dawn_hour=6, lookback_days=10 ** 5)
+        self.assertTrue(watcher.uses_inotify)
+        self.assertEqual(watcher.complete_nights(self.dawn - 86400), [])
+        self.__add_capture('ITCP01', '20230330', self.dawn - 3600, prefix='STATION')
+        self.assertEqual(watcher.complete_nights(self.dawn - 7200), [])
+        self.assertEqual(watcher.complete_nights(self.dawn), [('ITCP01', '20230330')])
+        watcher.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
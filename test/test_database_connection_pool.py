@@ -0,0 +1,122 @@
+import threading
+import time
+import types
+import unittest
+from DatabaseConnectionPool import DatabaseConnectionPool
+
+
+class Error(Exception):
+    pass
+
+
+class PoolError(Error):
+    pass
+
+
+class Connection:
+    '''
+    Pooled connection of the fake pooling module below, drop() simulates the server closing it.
+    '''
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.alive = True
+        self.reconnects = 0
+
+    def drop(self):
+        self.alive = False
+
+    def ping(self, reconnect=False, attempts=1, delay=0):
+        if not self.alive:
+            raise Error('Lost connection to MySQL server')
+
+    def reconnect(self, attempts=1, delay=0):
+        self.alive = True
+        self.reconnects += 1
+
+    def cursor(self):
+        if not self.alive:
+            raise Error('Lost connection to MySQL server')
+        return 'cursor'
+
+    def close(self):
+        self.pool.idle.append(self)
+
+
+class MySQLConnectionPool:
+
+    def __init__(self, pool_name, pool_size, **config):
+        self.idle = [Connection(self) for _ in range(pool_size)]
+
+    def get_connection(self):
+        if not self.idle:
+            raise PoolError('Failed getting connection; pool exhausted')
+        return self.idle.pop()
+
+
+MODULE = types.SimpleNamespace(pooling=types.SimpleNamespace(MySQLConnectionPool=MySQLConnectionPool, CNX_POOL_MAXSIZE=32), errors=types.SimpleNamespace(PoolError=PoolError), Error=Error)
+
+
+class TestDatabaseConnectionPool(unittest.TestCase):
+
+    # Tests that closed connections are handed out again and that the pool usage is counted
+    def test_01_reuse(self):
+        pool = DatabaseConnectionPool(MODULE, {}, 2)
+        self.assertIsNone(pool.stats())
+        first = pool.connection()
+        second = pool.connection()
+        first.close()
+        first.close()
+        self.assertFalse(first.is_connected())
+        third = pool.connection()
+        self.assertTrue(third.is_connected())
+        second.close()
+        third.close()
+        self.assertEqual(pool.stats(), {'pool_size': 2, 'acquired': 3, 'in_use': 0, 'max_in_use': 2, 'waits': 0, 'pings': 0, 'reconnects': 0})
+
+    # Tests that a connection dropped by the server while unused is reconnected before its next query, and only pinged after ping_interval
+    def test_02_reconnect(self):
+        pool = DatabaseConnectionPool(MODULE, {}, 1, ping_interval=0.2)
+        db = pool.connection()
+        self.assertEqual(db.cursor(), 'cursor')
+        self.assertEqual(pool.stats()['pings'], 0)
+        db.drop()
+        time.sleep(0.3)
+        self.assertEqual(db.cursor(), 'cursor')
+        self.assertEqual(db.reconnects, 1)
+        self.assertEqual((pool.stats()['pings'], pool.stats()['reconnects']), (1, 1))
+        # A connection used recently is trusted
+        db.drop()
+        with self.assertRaises(Error):
+            db.cursor()
+
+    # Tests that a connection is waited for while the pool is exhausted, until timeout
+    def test_03_wait(self):
+        pool = DatabaseConnectionPool(MODULE, {}, 1, timeout=0.2)
+        db = pool.connection()
+        with self.assertRaises(PoolError):
+            pool.connection()
+        threading.Timer(0.1, db.close).start()
+        pool.timeout = 5
+        pool.connection().close()
+        self.assertEqual((pool.stats()['waits'], pool.stats()['max_in_use']), (2, 1))
+
+    # Tests that reserve() opens the connections a run with more workers needs, in pools of at most CNX_POOL_MAXSIZE connections
+    def test_04_reserve(self):
+        module = types.SimpleNamespace(pooling=types.SimpleNamespace(MySQLConnectionPool=MySQLConnectionPool, CNX_POOL_MAXSIZE=2), errors=MODULE.errors, Error=Error)
+        pool = DatabaseConnectionPool(module, {}, 1, timeout=0)
+        connections = [pool.connection()]
+        with self.assertRaises(PoolError):
+            pool.connection()
+        pool.reserve(5)
+        connections += [pool.connection() for _ in range(4)]
+        self.assertEqual(pool.stats()['pool_size'], 5)
+        with self.assertRaises(PoolError):
+            pool.connection()
+        for db in connections:
+            db.close()
+        self.assertEqual((pool.stats()['in_use'], pool.stats()['max_in_use']), (0, 5))
+
+
+if __name__ == '__main__':
+    unittest.main()
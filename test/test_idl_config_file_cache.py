@@ -0,0 +1,87 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+from IDLConfigFileCache import IDLConfigFileCache
+
+
+class FakeConfigFileHandler:
+    '''
+    Writes configuration_{key}.ini like IDLConfigFileHandler, counting the files it renders.
+    '''
+
+    def __init__(self, config_dir_path):
+        self.config_dir_path = config_dir_path
+        self.n_created = 0
+
+    def create(self, key, usr_config, sys_config):
+        self.n_created += 1
+        with open(f'{self.config_dir_path}/configuration_{key}.ini', 'w') as f:
+            for name, value in sorted(usr_config.items()):
+                f.write(f'{name}={value}\n')
+        return json.dumps(usr_config)
+
+
+class TestIDLConfigFileCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        self.handler = FakeConfigFileHandler(self.tmp_dir)
+        self.cache = IDLConfigFileCache(self.handler, max_age_seconds=3600)
+        self.sys_config = [SimpleNamespace(parameter_name='cp_tmp_user_config_path', parameter_value=self.tmp_dir)]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    # Tests that jobs with the same parameters share one file, rendered once, and jobs with different parameters get their own
+    def test_01_acquire(self):
+        key_a, config_json = self.cache.acquire({'fwhm_max': 3.5}, self.sys_config, self.tmp_dir)
+        self.assertEqual(self.cache.acquire({'fwhm_max': 3.5}, self.sys_config, self.tmp_dir), (key_a, config_json))
+        key_b, _ = self.cache.acquire({'fwhm_max': 4.0}, self.sys_config, self.tmp_dir)
+        self.assertNotEqual(key_a, key_b)
+        self.assertEqual(self.handler.n_created, 2)
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), sorted([f'configuration_{key_a}.ini', f'configuration_{key_b}.ini']))
+        with open(f'{self.tmp_dir}/configuration_{key_a}.ini') as f:
+            self.assertEqual(f.read(), 'fwhm_max=3.5\n')
+
+    # Tests that files rendered by another cache (another process) with the same content get the same name
+    def test_02_acquire_content_addressed(self):
+        key, _ = self.cache.acquire({'fwhm_max': 3.5}, self.sys_config, self.tmp_dir)
+        other_cache = IDLConfigFileCache(FakeConfigFileHandler(self.tmp_dir))
+        self.assertEqual(other_cache.acquire({'fwhm_max': 3.5}, self.sys_config, self.tmp_dir)[0], key)
+        self.assertEqual(os.listdir(self.tmp_dir), [f'configuration_{key}.ini'])
+
+    # Tests that concurrent jobs with the same parameters use the same file
+    def test_03_acquire_concurrent(self):
+        keys = []
+        threads = [threading.Thread(target=lambda: keys.append(self.cache.acquire({'fwhm_max': 3.5}, self.sys_config, self.tmp_dir)[0])) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(set(keys)), 1)
+        self.assertEqual(self.handler.n_created, 1)
+
+    # Tests that only files not used for max_age_seconds and not in use by this process are collected
+    def test_04_collect_garbage(self):
+        key_a, _ = self.cache.acquire({'fwhm_max': 3.5}, self.sys_config, self.tmp_dir)
+        key_b, _ = self.cache.acquire({'fwhm_max': 4.0}, self.sys_config, self.tmp_dir)
+        self.cache.release(key_b, self.tmp_dir)
+        old = time.time() - 7200
+        for key in (key_a, key_b):
+            os.utime(f'{self.tmp_dir}/configuration_{key}.ini', (old, old))
+        open(f'{self.tmp_dir}/configuration_1.ini', 'w').close()
+        os.utime(f'{self.tmp_dir}/configuration_1.ini', (old, old))
+        self.assertEqual(self.cache.collect_garbage(self.tmp_dir), 1)
+        self.assertEqual(sorted(os.listdir(self.tmp_dir)), sorted([f'configuration_{key_a}.ini', 'configuration_1.ini']))
+        # A collected file is rendered again when its parameters are used again
+        self.assertEqual(self.cache.acquire({'fwhm_max': 4.0}, self.sys_config, self.tmp_dir)[0], key_b)
+        self.assertTrue(os.path.exists(f'{self.tmp_dir}/configuration_{key_b}.ini'))
+
+
+if __name__ == '__main__':
+    unittest.main()
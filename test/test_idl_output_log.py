@@ -0,0 +1,57 @@
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import time
+import unittest
+from IDLOutputLog import IDLOutputLog
+
+
+class TestIDLOutputLog(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    # Tests that license lines are dropped, the summary keeps head and tail and the log file keeps everything
+    def test_01_head_tail(self):
+        output_log = IDLOutputLog(f'{self.tmp_dir}/ITA1/20230330_1.stderr.gz', head_lines=2, tail_lines=3, skip_lines=8)
+        output_log.pump(io.BytesIO(b''.join(f'line {i}\n'.encode() for i in range(-8, 20))))
+        output_log.close()
+        self.assertEqual((output_log.n_lines, output_log.n_bytes), (20, sum(len(f'line {i}\n') for i in range(20))))
+        self.assertEqual(output_log.summary(), f'line 0\nline 1\n[... 15 line(s) omitted ...]\nline 17\nline 18\nline 19\n[Full output (20 line(s)) in {self.tmp_dir}/ITA1/20230330_1.stderr.gz]\n')
+        with gzip.open(f'{self.tmp_dir}/ITA1/20230330_1.stderr.gz', 'rt') as f:
+            self.assertEqual(f.read(), ''.join(f'line {i}\n' for i in range(20)))
+
+    # Tests that short outputs are kept whole and that no file is created without output
+    def test_02_short_output(self):
+        output_log = IDLOutputLog(None, head_lines=2, tail_lines=3)
+        for i in range(4):
+            output_log.write(f'line {i}\n')
+        self.assertEqual(output_log.summary(), 'line 0\nline 1\nline 2\nline 3\n')
+        empty_log = IDLOutputLog(f'{self.tmp_dir}/empty.gz')
+        empty_log.close()
+        self.assertEqual(empty_log.summary(), '')
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+    # Tests that log files older than the maximum age are deleted, at most once per interval
+    def test_03_remove_old(self):
+        old = time.time() - 10 * 86400
+        for name in ('20230330_1.stdout.gz', '20230330_1.stderr.gz', '20230410_2.stdout.gz'):
+            output_log = IDLOutputLog(f'{self.tmp_dir}/ITA1/{name}')
+            output_log.write('line\n')
+            output_log.close()
+        for name in ('20230330_1.stdout.gz', '20230330_1.stderr.gz'):
+            os.utime(f'{self.tmp_dir}/ITA1/{name}', (old, old))
+        self.assertEqual(IDLOutputLog.remove_old(self.tmp_dir, 5 * 86400), 2)
+        self.assertEqual(os.listdir(f'{self.tmp_dir}/ITA1'), ['20230410_2.stdout.gz'])
+        os.utime(f'{self.tmp_dir}/ITA1/20230410_2.stdout.gz', (old, old))
+        self.assertEqual(IDLOutputLog.remove_old(self.tmp_dir, 5 * 86400), 0)
+        self.assertEqual(IDLOutputLog.remove_old(self.tmp_dir, 5 * 86400, min_interval=0), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
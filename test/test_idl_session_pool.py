@@ -0,0 +1,85 @@
+import sys
+import time
+import unittest
+from IDLSessionPool import IDLSessionPool
+
+# Stand-in for an IDL session: answers the sentinels written by IDLSession.run() and a few test commands
+STUB_SESSION = '''
+import os
+import re
+import sys
+import time
+
+print('IDL license line', file=sys.stderr, flush=True)
+error_code = 0
+for line in sys.stdin:
+    line = line.strip()
+    stdout_sentinel = re.match(r"print, '([^']*)', !error_state.code", line)
+    stderr_sentinel = re.match(r"printf, -2, '([^']*)'", line)
+    if line == 'exit':
+        break
+    elif line == 'message, /reset':
+        error_code = 0
+    elif stdout_sentinel:
+        print(stdout_sentinel.group(1), error_code, flush=True)
+    elif stderr_sentinel:
+        print(stderr_sentinel.group(1), file=sys.stderr, flush=True)
+    elif line == 'pid':
+        print(os.getpid(), flush=True)
+    elif line == 'fail':
+        print('% Variable is undefined: X.', file=sys.stderr, flush=True)
+        error_code = -167
+    elif line == 'die':
+        print('half done', flush=True)
+        sys.exit(3)
+    elif line == 'hang':
+        time.sleep(60)
+    elif line == 'both':
+        for i in range(3):
+            print(f'out {i}', flush=True)
+            print(f'err {i}', file=sys.stderr, flush=True)
+'''
+
+
+class TestIDLSessionPool(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = IDLSessionPool(1, (sys.executable, '-c', STUB_SESSION))
+
+    def tearDown(self):
+        self.pool.close()
+
+    # Tests that the IDL error code of a command is returned and reset before the next command, which runs in the same session
+    def test_01_error_code(self):
+        _, pid, _ = self.pool.run('pid', timeout=10)
+        self.assertEqual(self.pool.run('fail', timeout=10), (-167, '', '% Variable is undefined: X.\n'))
+        self.assertEqual(self.pool.run('pid', timeout=10), (0, pid, ''))
+
+    # Tests that a session dying in the middle of a command returns its exit code and the output read so far, and is restarted for the next command
+    def test_02_session_dies(self):
+        _, pid, _ = self.pool.run('pid', timeout=10)
+        self.assertEqual(self.pool.run('die', timeout=10), (3, 'half done\n', ''))
+        returncode, new_pid, _ = self.pool.run('pid', timeout=10)
+        self.assertEqual(returncode, 0)
+        self.assertNotEqual(new_pid, pid)
+
+    # Tests that a command that doesn't answer within its timeout is killed with its session, which is restarted for the next command
+    def test_03_timeout(self):
+        _, pid, _ = self.pool.run('pid', timeout=10)
+        start = time.monotonic()
+        self.assertEqual(self.pool.run('hang', timeout=0.5), (None, '', ''))
+        self.assertLess(time.monotonic() - start, 5)
+        returncode, new_pid, _ = self.pool.run('pid', timeout=10)
+        self.assertEqual(returncode, 0)
+        self.assertNotEqual(new_pid, pid)
+
+    # Tests that output interleaved on stdout and stderr is told apart, returned or passed line by line to the handlers
+    def test_04_interleaved_output(self):
+        self.assertEqual(self.pool.run('both', timeout=10), (0, 'out 0\nout 1\nout 2\n', 'err 0\nerr 1\nerr 2\n'))
+        lines = {'stdout': [], 'stderr': []}
+        self.assertEqual(self.pool.run('both', timeout=10, on_stdout=lines['stdout'].append, on_stderr=lines['stderr'].append), (0, '', ''))
+        self.assertEqual(lines, {'stdout': ['out 0\n', 'out 1\n', 'out 2\n'], 'stderr': ['err 0\n', 'err 1\n', 'err 2\n']})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,6 +5,7 @@ import os
 import json
 import numpy as np
 import calendar
+import re
 from mysql.connector import connect, errorcode
 import ProcessCalibration
 from os import path
@@ -58,11 +59,9 @@ class TestProcessCalibration(unittest.TestCase):
         else:
             CameraFactory.CameraFactory().update(cmr, self.db)
 
-        with open('./failed_calibrations.json', 'r') as f:
-            failed_calibrations = json.load(f)
-        nmf = len(failed_calibrations)
+        nmf = ProcessCalibration.retry_queue.count(eligible_only=True)
 
-        n_success, n_failure = ProcessCalibration.ProcessCalibration().bulkProcess(4, datetime.now(), self.db)
+        n_success, n_failure = ProcessCalibration.ProcessCalibration().bulkProcess(4, datetime.now(), self.db, force=True)
         if not len(camera_list) > 0:
             self.assertTrue(lpff().getList(self.db)[-1].text.decode() == f'{LOG_MESSAGE_PREFIX}No cameras to process.')
         else:
@@ -81,10 +80,10 @@ class TestProcessCalibration(unittest.TestCase):
             self.assertTrue(lpff().getList(self.db)[nl].text.decode() == f'{LOG_MESSAGE_PREFIX}Started bulk calibration processing {len(camera_list)} camera(s).')
             ns = 0
             for lgs in lpff().getList(self.db)[n_logs+1:nl]:
-                if lgs.text.decode() == f'{LOG_MESSAGE_PREFIX}File configuration1.ini successfully deleted.':
+                if re.fullmatch(rf'{re.escape(LOG_MESSAGE_PREFIX)}File configuration_[0-9a-f]+\.ini released\.', lgs.text.decode()):
                     ns += 1
             self.assertTrue(lpff().getList(self.db)[nl-2].text.decode() == f'{LOG_MESSAGE_PREFIX}Managed to complete {ns} of {nmf} previously failed calibrations.')
-            if(os.stat('./failed_calibrations.json').st_size > 0):
+            if nmf > 0:
                 self.assertTrue(lpff().getList(self.db)[n_logs].text.decode() == f'{LOG_MESSAGE_PREFIX}Found previously failed calibrations. Re-attempting calibration.')
             if (datetime.now() - timedelta(days=1)).day == calendar.monthrange((datetime.now() - timedelta(days=1)).year, (datetime.now() - timedelta(days=1)).month)[1]:
                 self.assertTrue(lpff().getList(self.db)[-1].text.decode() == f'{LOG_MESSAGE_PREFIX}Finishied daily and monthly bulk processing {len(camera_list)} camera(s) [{n_success} success(es), {n_failure} failure(s)].')
@@ -141,22 +140,24 @@ class TestProcessCalibration(unittest.TestCase):
         date = date.strftime("%Y%m%d")
         if m_o_d == 1:
             len2 = len(CalibrationExecutionHistoryFactory.CalibrationExecutionHistoryFactory().getByCameraId(cmr.id, self.db))
-            ProcessCalibration.ProcessCalibration().start(cmr.id, cmr.modified_by, date, 1, self.db, 4)
+            ProcessCalibration.ProcessCalibration().start(cmr.id, cmr.modified_by, date, 1, self.db, 4, force=True)
             self.assertTrue(len(CalibrationExecutionHistoryFactory.CalibrationExecutionHistoryFactory().getByCameraId(cmr.id, self.db)) > len2)
-            self.assertTrue(lpff().getList(self.db)[-1].text.decode() == f'{LOG_MESSAGE_PREFIX}File configuration{cmr.modified_by}.ini successfully deleted.')
+            config_key = re.fullmatch(rf'{re.escape(LOG_MESSAGE_PREFIX)}Using configuration_([0-9a-f]+)\.ini for this user\.', lpff().getList(self.db)[-5].text.decode()).group(1)
+            self.assertTrue(lpff().getList(self.db)[-1].text.decode() == f'{LOG_MESSAGE_PREFIX}File configuration_{config_key}.ini released.')
             self.assertTrue(lpff().getList(self.db)[-2].text.decode() == f'{LOG_MESSAGE_PREFIX}Camera {cmr.code} on date {date} was successfully monthly and daily processed.')
             self.assertTrue(lpff().getList(self.db)[-3].text.decode() == f'{LOG_MESSAGE_PREFIX}Monthly and daily calibration finished processing camera {cmr.code} on date {date}')
-            self.assertTrue(lpff().getList(self.db)[-4].text.decode() == f'{LOG_MESSAGE_PREFIX}Starting monthly and daily IDL procedure for camera {cmr.code} with configuration_{cmr.modified_by}.ini.')
-            self.assertTrue(lpff().getList(self.db)[-5].text.decode() == f'{LOG_MESSAGE_PREFIX}Successfully created configuration_{cmr.modified_by}.ini for this user.')
+            self.assertTrue(lpff().getList(self.db)[-4].text.decode() == f'{LOG_MESSAGE_PREFIX}Starting monthly and daily IDL procedure for camera {cmr.code} with configuration_{config_key}.ini.')
             self.assertTrue(lpff().getList(self.db)[-6].text.decode() == f'{LOG_MESSAGE_PREFIX}Found capture from camera {cmr.code} on date {date[:6]} in the filesystem at {cameras_dir_path}/{cmr.code}/{date[:6]}.')
             self.assertTrue(lpff().getList(self.db)[-7].text.decode() == f'{LOG_MESSAGE_PREFIX}Successfully created CalibrationExecutionHistory entry with id {CalibrationExecutionHistoryFactory.CalibrationExecutionHistoryFactory().getByCameraIdForUser(cmr.id, cmr.modified_by, self.db)[-1].id} on the db.')
-            self.assertFalse(path.exists(f'{cp_tmp_user_config_path}/configuration_{cmr.modified_by}.ini'))
+            # The released configuration file is kept for the next jobs with the same parameters
+            self.assertTrue(path.exists(f'{cp_tmp_user_config_path}/configuration_{config_key}.ini'))
             self.assertTrue(len(CalibrationExecutionHistoryFactory.CalibrationExecutionHistoryFactory().getByCameraId(cmr.id, self.db)) > 0)
-            self.assertTrue(ProcessCalibration.ProcessCalibration().start(cmr.id, cmr.modified_by, date[:6], 1, self.db, 4))
+            self.assertTrue(ProcessCalibration.ProcessCalibration().start(cmr.id, cmr.modified_by, date[:6], 1, self.db, 4, force=True))
             self.assertTrue(len(CalibrationExecutionHistoryFactory.CalibrationExecutionHistoryFactory().getByCameraId(cmr.id, self.db)) > 1)
+            config_key = re.fullmatch(rf'{re.escape(LOG_MESSAGE_PREFIX)}Using configuration_([0-9a-f]+)\.ini for this user\.', lpff().getList(self.db)[-5].text.decode()).group(1)
             self.assertTrue(lpff().getList(self.db)[-2].text.decode() == f'{LOG_MESSAGE_PREFIX}Camera {cmr.code} on date {date} was successfully monthly processed.')
             self.assertTrue(lpff().getList(self.db)[-3].text.decode() == f'{LOG_MESSAGE_PREFIX}Monthly calibration finished processing camera {cmr.code} on date {date}')
-            self.assertTrue(lpff().getList(self.db)[-4].text.decode() == f'{LOG_MESSAGE_PREFIX}Starting monthly IDL procedure for camera {cmr.code} with configuration_{cmr.modified_by}.ini.')
+            self.assertTrue(lpff().getList(self.db)[-4].text.decode() == f'{LOG_MESSAGE_PREFIX}Starting monthly IDL procedure for camera {cmr.code} with configuration_{config_key}.ini.')
         else:
             ProcessCalibration.ProcessCalibration().start(cmr.id, cmr.modified_by, str(123513135), 0, self.db, 4)
             self.assertTrue(lpff().getList(self.db)[-1].text.decode() == f'{LOG_MESSAGE_PREFIX}Error: The date in your input is not correct, make sure it is in the format YYYYmmdd or YYYYmm.')
@@ -170,16 +171,17 @@ class TestProcessCalibration(unittest.TestCase):
             print(f'{LOG_MESSAGE_PREFIX}Warning: No configuration found for user 42, proceeding with default configuration.')
             self.assertTrue(lpff().getList(self.db)[-6].text.decode() == f'{LOG_MESSAGE_PREFIX}Warning: No configuration found for user 42, proceeding with default configuration.')
             len1 = len(CalibrationExecutionHistoryFactory.CalibrationExecutionHistoryFactory().getByCameraId(cmr.id, self.db))
-            ProcessCalibration.ProcessCalibration().start(cmr.id, cmr.modified_by, date, 0, self.db, 4)
+            ProcessCalibration.ProcessCalibration().start(cmr.id, cmr.modified_by, date, 0, self.db, 4, force=True)
             self.assertTrue(len(CalibrationExecutionHistoryFactory.CalibrationExecutionHistoryFactory().getByCameraId(cmr.id, self.db)) > len1)
-            self.assertTrue(lpff().getList(self.db)[-1].text.decode() == f'{LOG_MESSAGE_PREFIX}File configuration{cmr.modified_by}.ini successfully deleted.')
+            config_key = re.fullmatch(rf'{re.escape(LOG_MESSAGE_PREFIX)}Using configuration_([0-9a-f]+)\.ini for this user\.', lpff().getList(self.db)[-5].text.decode()).group(1)
+            self.assertTrue(lpff().getList(self.db)[-1].text.decode() == f'{LOG_MESSAGE_PREFIX}File configuration_{config_key}.ini released.')
             self.assertTrue(lpff().getList(self.db)[-2].text.decode() == f'{LOG_MESSAGE_PREFIX}Camera {cmr.code} on date {date} was successfully daily processed.')
             self.assertTrue(lpff().getList(self.db)[-3].text.decode() == f'{LOG_MESSAGE_PREFIX}Daily calibration finished processing camera {cmr.code} on date {date}')
-            self.assertTrue(lpff().getList(self.db)[-4].text.decode() == f'{LOG_MESSAGE_PREFIX}Starting daily IDL procedure for camera {cmr.code} with configuration_{cmr.modified_by}.ini.')
-            self.assertTrue(lpff().getList(self.db)[-5].text.decode() == f'{LOG_MESSAGE_PREFIX}Successfully created configuration_{cmr.modified_by}.ini for this user.')
+            self.assertTrue(lpff().getList(self.db)[-4].text.decode() == f'{LOG_MESSAGE_PREFIX}Starting daily IDL procedure for camera {cmr.code} with configuration_{config_key}.ini.')
             self.assertTrue(lpff().getList(self.db)[-6].text.decode() == f'{LOG_MESSAGE_PREFIX}Found capture from camera {cmr.code} on date {date[:6]} in the filesystem at {cameras_dir_path}/{cmr.code}/{date[:6]}.')
             self.assertTrue(lpff().getList(self.db)[-7].text.decode() == f'{LOG_MESSAGE_PREFIX}Successfully created CalibrationExecutionHistory entry with id {CalibrationExecutionHistoryFactory.CalibrationExecutionHistoryFactory().getByCameraIdForUser(cmr.id, cmr.modified_by, self.db)[-1].id} on the db.')
-            self.assertFalse(path.exists(f'{cp_tmp_user_config_path}/configuration_{cmr.modified_by}.ini'))
+            # The released configuration file is kept for the next jobs with the same parameters
+            self.assertTrue(path.exists(f'{cp_tmp_user_config_path}/configuration_{config_key}.ini'))
 
 
 if __name__ == '__main__':